@@ -1,4 +1,6 @@
+from django.db import transaction
 from django.shortcuts import render
+from django.utils.decorators import method_decorator
 
 from rest_framework.response import Response 
 from rest_framework.decorators import api_view, permission_classes 
@@ -6,12 +8,14 @@ from rest_framework.generics import RetrieveAPIView
 from rest_framework.status import HTTP_201_CREATED, HTTP_400_BAD_REQUEST 
 from rest_framework.permissions import IsAuthenticatedOrReadOnly 
 
+from main.db import non_atomic_reads
 from main.models import Bb, Comment
 
 from .serializers import BbSerializer, BbDetailSerializer, CommentSerializer
 
 # Create your views here.
 
+@transaction.non_atomic_requests
 @api_view(['GET']) 
 def bbs(request): 
     if request.method == 'GET': 
@@ -19,10 +23,12 @@ def bbs(request):
         serializer = BbSerializer(bbs, many=True) 
         return Response(serializer.data)
 
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class BbDetailView(RetrieveAPIView): 
     queryset = Bb.objects.filter(is_active=True) 
     serializer_class = BbDetailSerializer
 
+@non_atomic_reads
 @api_view(['GET', 'POST']) 
 @permission_classes((IsAuthenticatedOrReadOnly,)) 
 def comments(request, pk): 
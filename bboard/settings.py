@@ -68,6 +68,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'main.budgets.RequestBudgetMiddleware',
+    'main.middleware.RequestCacheMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'main.middleware.TimezoneMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -77,7 +79,8 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'main.middleware.ImageUploadErrorMiddleware',
-    
+    'main.middleware.ConditionalPageMiddleware',
+    'main.middleware.AnonymousPageCacheMiddleware',
 ]
 
 
@@ -110,10 +113,27 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'bboard.sqlite3',
-        'ATOMIC_REQUESTS': True,  # Автоматические транзакции для всех view
+        'ATOMIC_REQUESTS': True,  # Автоматические транзакции для всех view (читающие GET - main.db.non_atomic_reads)
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '600')),  # Постоянные соединения: PRAGMA и кеш страниц не теряются
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # BEGIN IMMEDIATE: писатель берет блокировку сразу и ждет busy_timeout,
+            # а не получает "database is locked" при повышении блокировки
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# PRAGMA для каждого нового соединения SQLite (main.db)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',  # Читатели не блокируют писателя и наоборот
+    'synchronous': 'NORMAL',  # В WAL не теряет целостность, fsync только при checkpoint
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '5000')),  # Мс ожидания блокировки
+    'cache_size': -int(os.getenv('SQLITE_CACHE_KB', '65536')),  # Кеш страниц соединения, КБ
+    'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),  # Чтение файла базы через mmap
+    'temp_store': 'MEMORY',
+}
+
 
 # ==============================================================================
 # PASSWORD VALIDATION
@@ -185,7 +205,7 @@ LOGOUT_REDIRECT_URL = 'main:index'
 # SESSIONS
 # ==============================================================================
 
-SESSION_ENGINE = 'django.contrib.sessions.backends.cache'  # Хранение в Redis
+SESSION_ENGINE = 'main.sessions'  # Хранение в Redis, чтение через кеш запроса (main.request_cache)
 SESSION_CACHE_ALIAS = 'default'
 SESSION_COOKIE_AGE = 1209600  # 2 недели
 SESSION_COOKIE_HTTPONLY = True
@@ -205,6 +225,22 @@ MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
 # CACHING (Redis)
 # ==============================================================================
 
+# Формат значений в Redis: сериализатор и сжатие (сравнить варианты на реальных
+# ключах - команда cache_benchmark). После смены задайте новую CACHE_SCHEMA_VERSION
+CACHE_SERIALIZERS = {
+    'pickle': 'django_redis.serializers.pickle.PickleSerializer',
+    'json': 'main.cache_backends.JSONSerializer',
+    'msgpack': 'main.cache_backends.MsgpackSerializer',
+}
+CACHE_COMPRESSORS = {
+    'none': 'django_redis.compressors.identity.IdentityCompressor',
+    'zlib': 'main.cache_backends.ZlibCompressor',
+    'lz4': 'main.cache_backends.Lz4Compressor',
+}
+CACHE_SERIALIZER = os.getenv('CACHE_SERIALIZER', 'pickle')
+CACHE_COMPRESSOR = os.getenv('CACHE_COMPRESSOR', 'zlib')
+CACHE_COMPRESS_MIN_LENGTH = int(os.getenv('CACHE_COMPRESS_MIN_LENGTH', '1024'))
+
 CACHES = {
     'default': {
         'BACKEND': 'django_redis.cache.RedisCache',
@@ -212,12 +248,46 @@ CACHES = {
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
             'IGNORE_EXCEPTIONS': True,
+            'SERIALIZER': CACHE_SERIALIZERS[CACHE_SERIALIZER],
+            'COMPRESSOR': CACHE_COMPRESSORS[CACHE_COMPRESSOR],
         },
         'KEY_PREFIX': 'bboard',
         'TIMEOUT': 300,
     }
 }
 
+# Версия схемы кешируемых записей: входит в каждый ключ generate_cache_key().
+# При релизе, меняющем формат записей, задайте новую (например, хеш коммита):
+# старые записи просто перестанут читаться и истекут сами, сессии не затронуты
+CACHE_SCHEMA_VERSION = os.getenv('CACHE_SCHEMA_VERSION', '1')
+
+# Сколько живут готовые страницы для анонимов (main.page_cache)
+PAGE_CACHE_TIMEOUT = int(os.getenv('PAGE_CACHE_TIMEOUT', '300'))
+
+# Бюджеты на один запрос по имени URL (main.budgets): SQL-запросы и обращения
+# к кешу с пустым кешем. Превышение пишется в лог main.budgets (WARNING),
+# а RequestBudgetTests падают - так ловятся N+1 в шаблонах и админке
+REQUEST_BUDGETS = {
+    'main:index': {'queries': 7, 'cache_calls': 30},
+    'main:rubric_bbs': {'queries': 7, 'cache_calls': 30},
+    'main:bb_detail': {'queries': 8, 'cache_calls': 26},
+    'main:bb_comments': {'queries': 3, 'cache_calls': 10},
+    'main:other': {'queries': 5, 'cache_calls': 19},
+    'main:profile': {'queries': 5, 'cache_calls': 12},
+    'main:profile_my_bbs': {'queries': 6, 'cache_calls': 12},
+    'main:profile_bb_add': {'queries': 8, 'cache_calls': 12},
+    'main:profile_bb_edit': {'queries': 11, 'cache_calls': 12},
+    'async_api:rubrics': {'queries': 4, 'cache_calls': 5},
+    'async_api:popular': {'queries': 2, 'cache_calls': 4},
+    'async_api:bb_detail': {'queries': 5, 'cache_calls': 4},
+    'admin:main_bb_changelist': {'queries': 10, 'cache_calls': 9},
+    'admin:main_comment_changelist': {'queries': 11, 'cache_calls': 9},
+    'admin:main_subrubric_changelist': {'queries': 10, 'cache_calls': 9},
+}
+
+# Заголовок Server-Timing с числом и временем SQL-запросов и обращений к кешу
+SERVER_TIMING = os.getenv('SERVER_TIMING', '1') == '1'
+
 # ==============================================================================
 # LOGGING
 # ==============================================================================
@@ -243,6 +313,11 @@ LOGGING = {
             'level': 'DEBUG' if DEBUG else 'INFO',
             'propagate': False,
         },
+        'main.budgets': {
+            'handlers': ['console'],
+            'level': 'DEBUG' if DEBUG else 'INFO',
+            'propagate': False,
+        },
         'main.api_views': {
             'handlers': ['console'],
             'level': 'DEBUG' if DEBUG else 'INFO',
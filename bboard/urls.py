@@ -17,9 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from main.db import non_atomic_read_urls
+
 urlpatterns = [
-    path('admin/', admin.site.urls),
-    path('captcha/', include('captcha.urls')), 
+    path('admin/', non_atomic_read_urls(admin.site.urls)),
+    path('captcha/', non_atomic_read_urls(include('captcha.urls'))),
     path('api/async/', include('main.urls_async')),
     path('api/', include('api.urls')),
     path('', include('main.urls')),
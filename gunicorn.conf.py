@@ -10,4 +10,24 @@ limit_request_field_size = 8190
 
 max_requests = 1000
 max_requests_jitter = 50
-preload_app = True
\ No newline at end of file
+preload_app = True
+
+def when_ready(server):
+    """
+    Прогрев кеша после старта (python manage.py cache_warm)
+
+    Отдельный процесс: не задерживает запуск воркеров и не держит
+    соединений с базой в мастере, от которого они форкаются.
+    Отключить: CACHE_WARM_ON_START=0.
+    """
+    import os
+    import subprocess
+    import sys
+
+    if os.getenv("CACHE_WARM_ON_START", "1") == "0":
+        return
+    server.log.info("Starting cache warm")
+    subprocess.Popen(
+        [sys.executable, "manage.py", "cache_warm", "--workers", "2", "--rate", "10"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
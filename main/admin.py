@@ -8,6 +8,7 @@ from .models import AdvUser
 from .models import SuperRubric, SubRubric 
 from .models import Bb, AdditionalImage, Comment
 from .utilities import send_activation_notification
+from .counters import deactivate_comments
 
 # Register your models here.
 @admin.action(description='Отправить письма с требованиями активации')
@@ -77,13 +78,16 @@ class AdditionalImageInline(admin.TabularInline):
 	model = AdditionalImage 
 
 class BbAdmin(admin.ModelAdmin): 
-	list_display = ('rubric', 'title', 'content', 'author', 'created_at') 
+	list_display = ('rubric', 'title', 'content', 'author', 'comment_count', 'created_at') 
+	list_select_related = ('rubric__super_rubric', 'author')
 	fields = (('rubric', 'author'), 'title', 'content', 'price', 'contacts', 'image', 'is_active') 
 	inlines = (AdditionalImageInline,) 
 
 @admin.action(description='Снять с публикации')
 def make_inactive(modeladmin, request, queryset):
-    queryset.update(is_active=False)
+    # Не queryset.update(): сигналы не сработают, а счетчики объявлений нужно уменьшить
+    count = deactivate_comments(queryset)
+    modeladmin.message_user(request, f'Снято с публикации: {count}')
 
 class CommentAdmin(admin.ModelAdmin):
     list_display = ('author', 'content', 'is_active', 'created_at')
@@ -4,15 +4,26 @@ API view-функции с кешированием (синхронные, со
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.core.cache import cache
+from django.db import transaction
 from .models import SubRubric, Bb
 from .cache_utils import generate_cache_key, get_cached_or_set
+from .popular import POPULAR_SIZE, get_popular_bbs
+from .suggest import suggest
 import logging
 
 logger = logging.getLogger(__name__)
 
 CACHE_TIMEOUT_RUBRICS = 3600
-CACHE_TIMEOUT_POPULAR_BBS = 600
+CACHE_SOFT_TIMEOUT_RUBRICS = 3000
 
+POPULAR_DEFAULT_LIMIT = 10
+POPULAR_MAX_LIMIT = 100
+
+SUGGEST_DEFAULT_LIMIT = 10
+SUGGEST_MAX_LIMIT = 20
+SUGGEST_MAX_QUERY_LENGTH = 50
+
+@transaction.non_atomic_requests
 @require_http_methods(["GET"])
 def api_rubrics(request):
     """
@@ -30,36 +41,30 @@ def api_rubrics(request):
         logger.info(f"Fetched {len(rubrics)} rubrics from DB")
         return rubrics
     
-    rubrics = get_cached_or_set(cache_key, fetch_rubrics, timeout=CACHE_TIMEOUT_RUBRICS)
+    rubrics = get_cached_or_set(
+        cache_key, fetch_rubrics, timeout=CACHE_TIMEOUT_RUBRICS, soft_timeout=CACHE_SOFT_TIMEOUT_RUBRICS, tags=['sidebar']
+    )
     
     return JsonResponse({'rubrics': rubrics}, safe=False)
 
+@transaction.non_atomic_requests
 @require_http_methods(["GET"])
 def api_popular_bbs(request):
     """
-    API для получения популярных объявлений с кешированием
-    GET /api/async/popular/?limit=10
+    API популярных объявлений: срез предрасчитанного рейтинга (main.popular)
+    GET /api/async/popular/?limit=10&offset=0
     """
-    limit = int(request.GET.get('limit', 10))
-    cache_key = generate_cache_key('api_popular_bbs', limit)
-    
-    def fetch_popular_bbs():
-        bbs = list(
-            Bb.objects.filter(is_active=True)
-            .select_related('rubric', 'author')
-            .order_by('-created_at')[:limit]
-            .values(
-                'id', 'title', 'content', 'price', 
-                'created_at', 'rubric__name', 'author__username'
-            )
-        )
-        logger.info(f"Fetched {len(bbs)} popular bbs from DB")
-        return bbs
-    
-    bbs = get_cached_or_set(cache_key, fetch_popular_bbs, timeout=CACHE_TIMEOUT_POPULAR_BBS)
+    try:
+        limit = int(request.GET.get('limit', POPULAR_DEFAULT_LIMIT))
+        offset = int(request.GET.get('offset', 0))
+    except ValueError:
+        return JsonResponse({'error': 'Некорректный параметр limit или offset'}, status=400)
+    limit = max(1, min(limit, POPULAR_MAX_LIMIT))
+    offset = max(0, min(offset, POPULAR_SIZE))
     
-    return JsonResponse({'bbs': bbs}, safe=False)
+    return JsonResponse({'bbs': get_popular_bbs(limit, offset)}, safe=False)
 
+@transaction.non_atomic_requests
 @require_http_methods(["GET"])
 def api_bb_detail(request, pk):
     """
@@ -77,7 +82,7 @@ def api_bb_detail(request, pk):
                 'id': bb.id,
                 'title': bb.title,
                 'content': bb.content,
-                'price': float(bb.price),
+                'price': float(bb.price) if bb.price is not None else None,
                 'contacts': bb.contacts,
                 'created_at': bb.created_at.isoformat(),
                 'rubric': bb.rubric.name,
@@ -90,9 +95,25 @@ def api_bb_detail(request, pk):
         except Bb.DoesNotExist:
             return None
     
-    bb_data = get_cached_or_set(cache_key, fetch_bb_detail, timeout=300)
+    bb_data = get_cached_or_set(cache_key, fetch_bb_detail, timeout=300, tags=[f'bb:{pk}'])
     
     if bb_data is None:
         return JsonResponse({'error': 'Объявление не найдено'}, status=404)
     
-    return JsonResponse(bb_data)
\ No newline at end of file
+    return JsonResponse(bb_data)
+
+@transaction.non_atomic_requests
+@require_http_methods(["GET"])
+def api_suggest(request):
+    """
+    API подсказок при наборе запроса (из памяти воркера, без обращений к БД)
+    GET /api/async/suggest/?q=вел&limit=10
+    """
+    query = request.GET.get('q', '')[:SUGGEST_MAX_QUERY_LENGTH]
+    try:
+        limit = int(request.GET.get('limit', SUGGEST_DEFAULT_LIMIT))
+    except ValueError:
+        return JsonResponse({'error': 'Некорректный параметр limit'}, status=400)
+    limit = max(1, min(limit, SUGGEST_MAX_LIMIT))
+    
+    return JsonResponse({'query': query, **suggest(query, limit)})
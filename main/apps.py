@@ -7,4 +7,4 @@ class MainConfig(AppConfig):
     verbose_name = 'Доска объявлений'
 
     def ready(self):
-        from . import signals 
\ No newline at end of file
+        from . import db, signals 
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""
+Бюджеты запросов к базе и кешу на один HTTP-запрос
+
+RequestBudgetMiddleware считает SQL-запросы (connection.execute_wrapper) и
+обращения к кешу (обертка методов бэкенда default) за запрос, пишет их в
+лог main.budgets и в заголовок Server-Timing и сравнивает с бюджетом
+view из settings.REQUEST_BUDGETS (по имени URL, например 'main:index').
+Превышение - WARNING в логе; в тестах по заполненной базе - ошибка
+(RequestBudgetTests), поэтому N+1 в шаблоне или админке ловится до прода.
+"""
+import logging
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+# Публичные методы бэкенда кеша; каждый вызов - одно обращение к Redis
+CACHE_METHODS = (
+    'get', 'set', 'add', 'delete', 'touch', 'incr', 'decr', 'has_key',
+    'get_many', 'set_many', 'delete_many', 'get_or_set', 'clear',
+)
+
+_current: ContextVar[Optional['RequestStats']] = ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """Счетчики одного запроса: SQL и кеш, количество и время в мс"""
+
+    def __init__(self):
+        self.queries = 0
+        self.query_ms = 0.0
+        self.cache_calls = 0
+        self.cache_ms = 0.0
+        self._cache_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper для соединения с базой"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.query_ms += (time.perf_counter() - started) * 1000
+
+    def as_dict(self) -> Dict:
+        return {
+            'queries': self.queries, 'query_ms': round(self.query_ms, 2),
+            'cache_calls': self.cache_calls, 'cache_ms': round(self.cache_ms, 2),
+        }
+
+    def server_timing(self) -> str:
+        """Значение заголовка Server-Timing"""
+        return (
+            f'db;dur={self.query_ms:.1f};desc="{self.queries} queries", '
+            f'cache;dur={self.cache_ms:.1f};desc="{self.cache_calls} calls"'
+        )
+
+
+def current() -> Optional[RequestStats]:
+    return _current.get()
+
+
+def activate(stats: RequestStats):
+    return _current.set(stats)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def record_cache_call(ms: float = 0.0):
+    """Учесть обращение к кешу, сделанное в обход методов бэкенда (pipeline)"""
+    stats = _current.get()
+    if stats is not None and not stats._cache_depth:
+        stats.cache_calls += 1
+        stats.cache_ms += ms
+
+
+def _counting(method):
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        stats = _current.get()
+        # Команды в pipeline (client=pipe) уходят одним execute() - его учитывает record_cache_call()
+        if stats is None or stats._cache_depth or kwargs.get('client') is not None:
+            return method(*args, **kwargs)
+        stats._cache_depth += 1
+        started = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            stats._cache_depth -= 1
+            stats.cache_calls += 1
+            stats.cache_ms += (time.perf_counter() - started) * 1000
+    return wrapper
+
+
+def instrument_cache(alias: str = 'default'):
+    """
+    Обернуть методы бэкенда кеша счетчиком (один раз на экземпляр)
+
+    Экземпляр бэкенда свой у каждого потока, поэтому вызывается в начале
+    каждого запроса. Вложенные вызовы (set_many через set в LocMemCache)
+    считаются одним обращением.
+    """
+    backend = caches[alias]
+    if getattr(backend, '_budget_instrumented', False):
+        return
+    for name in CACHE_METHODS:
+        if hasattr(backend, name):
+            setattr(backend, name, _counting(getattr(backend, name)))
+    backend._budget_instrumented = True
+
+
+def get_budget(view_name: Optional[str]) -> Optional[Dict[str, int]]:
+    """Бюджет view по имени URL: {'queries': n, 'cache_calls': m} или None"""
+    if not view_name:
+        return None
+    return getattr(settings, 'REQUEST_BUDGETS', {}).get(view_name)
+
+
+def budget_violations(view_name: Optional[str], stats: RequestStats) -> List[str]:
+    """Превышения бюджета view: ['queries 12 > 5', ...]"""
+    budget = get_budget(view_name) or {}
+    counts = stats.as_dict()
+    return [
+        f'{name} {counts[name]} > {limit}'
+        for name, limit in budget.items() if counts[name] > limit
+    ]
+
+
+class RequestBudgetMiddleware:
+    """
+    Счетчики SQL и кеша за запрос, Server-Timing и проверка бюджета view
+
+    Стоит первым после SecurityMiddleware, чтобы учесть сессию,
+    RequestCacheMiddleware и кеш страниц. Счетчики доступны в тестах как
+    response.request_stats.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        instrument_cache()
+        stats = RequestStats()
+        token = activate(stats)
+        try:
+            with connection.execute_wrapper(stats):
+                response = self.get_response(request)
+        finally:
+            deactivate(token)
+
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match else None
+        response.request_stats = stats
+        if getattr(settings, 'SERVER_TIMING', True):
+            response.headers['Server-Timing'] = stats.server_timing()
+
+        violations = budget_violations(view_name, stats)
+        if violations:
+            logger.warning(f"{request.method} {request.path} ({view_name}) over budget: {', '.join(violations)}")
+        else:
+            logger.debug(
+                f"{request.method} {request.path} ({view_name}): "
+                f"{stats.queries} queries {stats.query_ms:.1f} ms, {stats.cache_calls} cache calls {stats.cache_ms:.1f} ms"
+            )
+        return response
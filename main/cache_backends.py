@@ -0,0 +1,143 @@
+"""
+Сериализаторы и компрессоры значений кеша для django-redis
+
+Выбираются в settings (CACHE_SERIALIZER, CACHE_COMPRESSOR). JSON и msgpack
+сохраняют типы, которые встречаются в наших записях (datetime, date,
+Decimal); ключи словарей в JSON - только строки. Сжатие включается для
+значений длиннее CACHE_COMPRESS_MIN_LENGTH байт: короткие значения
+(счетчики, токены блокировок) остаются как есть.
+
+Сравнить варианты на реальных ключах: python manage.py cache_benchmark
+"""
+import datetime
+import json
+import zlib
+from decimal import Decimal
+from typing import Any
+
+from django.conf import settings
+from django_redis.compressors.base import BaseCompressor
+from django_redis.exceptions import CompressorError
+from django_redis.serializers.base import BaseSerializer
+
+MSGPACK_EXT_DATE = 1
+MSGPACK_EXT_DECIMAL = 2
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'__date__': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'__decimal__': str(value)}
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def _json_object_hook(obj: dict) -> Any:
+    if len(obj) == 1:
+        if '__datetime__' in obj:
+            return datetime.datetime.fromisoformat(obj['__datetime__'])
+        if '__date__' in obj:
+            return datetime.date.fromisoformat(obj['__date__'])
+        if '__decimal__' in obj:
+            return Decimal(obj['__decimal__'])
+    return obj
+
+
+class JSONSerializer(BaseSerializer):
+    """Компактный JSON с сохранением дат и Decimal"""
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value, default=_json_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+    def loads(self, value: bytes) -> Any:
+        return json.loads(value.decode(), object_hook=_json_object_hook)
+
+
+class MsgpackSerializer(BaseSerializer):
+    """msgpack (нужен пакет msgpack); datetime - штатный Timestamp, date и Decimal - расширения"""
+
+    def __init__(self, options):
+        super().__init__(options)
+        import msgpack
+        self._msgpack = msgpack
+
+    def _default(self, value: Any) -> Any:
+        if isinstance(value, datetime.date) and not isinstance(value, datetime.datetime):
+            return self._msgpack.ExtType(MSGPACK_EXT_DATE, value.isoformat().encode())
+        if isinstance(value, Decimal):
+            return self._msgpack.ExtType(MSGPACK_EXT_DECIMAL, str(value).encode())
+        if isinstance(value, (set, frozenset)):
+            return list(value)
+        raise TypeError(f'Object of type {type(value).__name__} is not msgpack serializable')
+
+    def _ext_hook(self, code: int, data: bytes) -> Any:
+        if code == MSGPACK_EXT_DATE:
+            return datetime.date.fromisoformat(data.decode())
+        if code == MSGPACK_EXT_DECIMAL:
+            return Decimal(data.decode())
+        return self._msgpack.ExtType(code, data)
+
+    def dumps(self, value: Any) -> bytes:
+        return self._msgpack.packb(value, default=self._default, use_bin_type=True, datetime=True)
+
+    def loads(self, value: bytes) -> Any:
+        return self._msgpack.unpackb(
+            value, raw=False, timestamp=3, strict_map_key=False, ext_hook=self._ext_hook
+        )
+
+
+class ThresholdCompressor(BaseCompressor):
+    """
+    Сжимает только значения длиннее порога: OPTIONS['COMPRESS_MIN_LENGTH']
+    или settings.CACHE_COMPRESS_MIN_LENGTH (байт)
+    """
+
+    @property
+    def min_length(self) -> int:
+        return self._options.get('COMPRESS_MIN_LENGTH', getattr(settings, 'CACHE_COMPRESS_MIN_LENGTH', 1024))
+
+    def compress(self, value: bytes) -> bytes:
+        if len(value) > self.min_length:
+            return self._compress(value)
+        return value
+
+    def decompress(self, value: bytes) -> bytes:
+        try:
+            return self._decompress(value)
+        except Exception as e:
+            raise CompressorError from e
+
+    def _compress(self, value: bytes) -> bytes:
+        raise NotImplementedError
+
+    def _decompress(self, value: bytes) -> bytes:
+        raise NotImplementedError
+
+
+class ZlibCompressor(ThresholdCompressor):
+    level = 6
+
+    def _compress(self, value: bytes) -> bytes:
+        return zlib.compress(value, self.level)
+
+    def _decompress(self, value: bytes) -> bytes:
+        return zlib.decompress(value)
+
+
+class Lz4Compressor(ThresholdCompressor):
+    """LZ4 (нужен пакет lz4): хуже сжимает, но заметно быстрее zlib"""
+
+    def __init__(self, options):
+        super().__init__(options)
+        import lz4.frame
+        self._lz4 = lz4.frame
+
+    def _compress(self, value: bytes) -> bytes:
+        return self._lz4.compress(value)
+
+    def _decompress(self, value: bytes) -> bytes:
+        return self._lz4.decompress(value)
@@ -0,0 +1,144 @@
+"""
+Статистика кеша по префиксам ключей (index_page, bb_detail, page, ...)
+
+Попадания, промахи, ошибки, время callback и размер значений копятся в
+памяти воркера (Counter под блокировкой) и не чаще раза в
+CACHE_STATS_FLUSH_INTERVAL секунд прибавляются к хешам в Redis одним
+pipeline. Размер меряется у каждого CACHE_STATS_SIZE_SAMPLE-го вычисленного
+значения: повторная сериализация каждого промаха удвоила бы работу
+сериализатора. Общую картину по всем воркерам показывает команда cache_stats.
+"""
+import itertools
+import logging
+import pickle
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CACHE_STATS_FLUSH_INTERVAL = getattr(settings, 'CACHE_STATS_FLUSH_INTERVAL', 10)
+CACHE_STATS_SIZE_SAMPLE = getattr(settings, 'CACHE_STATS_SIZE_SAMPLE', 10)
+CACHE_STATS_KEY = f"{settings.CACHES['default']['KEY_PREFIX']}:cache-stats"
+
+# {префикс: Counter(hits, misses, stale, errors, computed, callback_us, sized, bytes)};
+# callback_us - сумма по computed вызовам callback, bytes - по sized измеренным значениям
+_pending = defaultdict(Counter)
+_lock = threading.Lock()
+_last_flush = [time.monotonic()]
+_computed = itertools.count()
+
+
+def key_prefix(cache_key: str) -> str:
+    """Префикс ключа из generate_cache_key(): 'bboard:bb_detail:v1:...' -> 'bb_detail'"""
+    parts = cache_key.split(':')
+    if len(parts) > 2 and parts[0] == settings.CACHES['default']['KEY_PREFIX']:
+        return parts[1]
+    return 'other'
+
+
+def payload_size(value) -> int:
+    """
+    Размер значения в Redis: сериализатор и сжатие из настроек django-redis
+
+    Для других бэкендов - размер pickle.
+    """
+    try:
+        encoded = cache.client.encode(value)
+    except AttributeError:
+        encoded = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    return len(encoded) if isinstance(encoded, bytes) else len(str(encoded))
+
+
+def size_metrics(value) -> Dict[str, int]:
+    """
+    Размер для record() у каждого CACHE_STATS_SIZE_SAMPLE-го значения
+
+    Returns:
+        dict: {'sized': 1, 'bytes': n} или {} (значение не попало в выборку)
+    """
+    if next(_computed) % CACHE_STATS_SIZE_SAMPLE:
+        return {}
+    return {'sized': 1, 'bytes': payload_size(value)}
+
+
+def record(cache_key: str, **metrics: int):
+    """
+    Учесть событие кеша для префикса ключа
+
+    Usage:
+        record(cache_key, hits=1)
+        record(cache_key, computed=1, callback_us=1520, **size_metrics(value))
+    """
+    prefix = key_prefix(cache_key)
+    with _lock:
+        _pending[prefix].update(metrics)
+    if time.monotonic() - _last_flush[0] >= CACHE_STATS_FLUSH_INTERVAL:
+        flush()
+
+
+def uses_redis() -> bool:
+    return settings.CACHES['default']['BACKEND'].startswith('django_redis')
+
+
+def flush():
+    """Прибавить накопленное в воркере к общим счетчикам в Redis"""
+    with _lock:
+        _last_flush[0] = time.monotonic()
+        if not uses_redis():
+            return
+        pending = {prefix: dict(counter) for prefix, counter in _pending.items() if counter}
+        _pending.clear()
+    if not pending:
+        return
+    try:
+        from django_redis import get_redis_connection
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        for prefix, counter in pending.items():
+            pipe.sadd(f'{CACHE_STATS_KEY}:prefixes', prefix)
+            for metric, amount in counter.items():
+                pipe.hincrby(f'{CACHE_STATS_KEY}:{prefix}', metric, amount)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Cache stats flush error: {e}")
+
+
+def get_local_stats() -> Dict[str, Dict[str, int]]:
+    """Накопленное в этом процессе и еще не отправленное в Redis (без Redis - все)"""
+    with _lock:
+        return {prefix: dict(counter) for prefix, counter in _pending.items()}
+
+
+def get_shared_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Общие счетчики всех воркеров из Redis
+
+    Returns:
+        dict: {префикс: {'hits': ..., 'misses': ..., 'callback_us': ..., ...}}
+    """
+    from django_redis import get_redis_connection
+    client = get_redis_connection('default')
+    prefixes = sorted(prefix.decode() for prefix in client.smembers(f'{CACHE_STATS_KEY}:prefixes'))
+    pipe = client.pipeline(transaction=False)
+    for prefix in prefixes:
+        pipe.hgetall(f'{CACHE_STATS_KEY}:{prefix}')
+    return {
+        prefix: {metric.decode(): int(value) for metric, value in values.items()}
+        for prefix, values in zip(prefixes, pipe.execute())
+    }
+
+
+def reset_stats():
+    """Обнулить счетчики процесса и общие счетчики в Redis"""
+    with _lock:
+        _pending.clear()
+    if not uses_redis():
+        return
+    from django_redis import get_redis_connection
+    client = get_redis_connection('default')
+    prefixes = [prefix.decode() for prefix in client.smembers(f'{CACHE_STATS_KEY}:prefixes')]
+    client.delete(f'{CACHE_STATS_KEY}:prefixes', *(f'{CACHE_STATS_KEY}:{prefix}' for prefix in prefixes))
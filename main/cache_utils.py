@@ -3,18 +3,71 @@
 """
 from django.core.cache import cache
 from django.conf import settings
-from functools import wraps
+from django.db import connections
+from django.http import Http404
 import hashlib
 import json
-from typing import Optional, Callable, Any
+import math
+import os
+import random
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Optional, Callable, Any, Dict, Iterable, Tuple
 import logging
 
+from . import cache_stats
+from . import request_cache
+
 logger = logging.getLogger(__name__)
 
+# Single-flight: сколько живет блокировка пересчета, сколько ждут остальные
+# и сколько старое значение хранится после логического истечения
+SINGLE_FLIGHT_LOCK_TIMEOUT = 30
+SINGLE_FLIGHT_WAIT = 3.0
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+SINGLE_FLIGHT_STALE_GRACE = 60
+# Коэффициент вероятностного раннего обновления (XFetch); 1.0 - стандартный
+EARLY_EXPIRATION_BETA = 1.0
+
+CACHE_SCHEMA_VERSION = getattr(settings, 'CACHE_SCHEMA_VERSION', '1')
+
+# L1: кеш в памяти воркера для маленьких горячих и редко меняющихся ключей
+L1_MAXSIZE = getattr(settings, 'CACHE_L1_MAXSIZE', 256)
+L1_TIMEOUT = getattr(settings, 'CACHE_L1_TIMEOUT', 60)
+L1_INVALIDATION_CHANNEL = f"{settings.CACHES['default']['KEY_PREFIX']}:l1-invalidate"
+
+# Счетчики попаданий по уровням кеша в текущем процессе
+_stats = {'l1': Counter(), 'redis': Counter(), 'page': Counter()}
+
+def _count(tier: str, outcome: str, cache_key: Optional[str] = None):
+    """Счетчик уровня кеша; с cache_key - еще и статистика префикса (cache_stats)"""
+    _stats[tier][outcome] += 1
+    if cache_key is not None:
+        cache_stats.record(cache_key, **{outcome: 1})
+
+def get_cache_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Счетчики кеша текущего процесса по уровням
+    
+    Returns:
+        dict: {'l1': {'hits': ..., 'misses': ...}, 'redis': {'hits': ..., 'misses': ..., 'stale': ...},
+               'page': {'hits': ..., 'misses': ...}}
+    """
+    return {tier: dict(counter) for tier, counter in _stats.items()}
+
+def reset_cache_stats():
+    for counter in _stats.values():
+        counter.clear()
+
 def generate_cache_key(prefix: str, *args, **kwargs) -> str:
     """
     Генерация уникального ключа кеша на основе префикса и параметров
     
+    Ключ включает версию схемы записей (settings.CACHE_SCHEMA_VERSION):
+    после релиза с новой версией записи старого формата не читаются.
+    
     Args:
         prefix: Префикс ключа (например, 'rubrics', 'bb_detail')
         *args: Позиционные аргументы для формирования ключа
@@ -30,13 +83,365 @@ def generate_cache_key(prefix: str, *args, **kwargs) -> str:
     }
     key_string = json.dumps(key_data, sort_keys=True, default=str)
     key_hash = hashlib.md5(key_string.encode()).hexdigest()
-    return f"{settings.CACHES['default']['KEY_PREFIX']}:{prefix}:{key_hash}"
+    return f"{settings.CACHES['default']['KEY_PREFIX']}:{prefix}:v{CACHE_SCHEMA_VERSION}:{key_hash}"
+
+def get_tag_key(tag: str) -> str:
+    """Ключ счетчика версии тега ('index', 'sidebar', 'rubric:5')"""
+    return f"{settings.CACHES['default']['KEY_PREFIX']}:tag:{tag}"
+
+def _new_tag_version() -> int:
+    # Начальная версия - время в мс: если счетчик вытеснят, старые записи
+    # не совпадут с новым значением и не "воскреснут"
+    return int(time.time() * 1000)
+
+def _read_tag_versions(tags: Iterable[str], values: Dict[str, Any]) -> Dict[str, int]:
+    """Версии тегов из уже прочитанных значений; отсутствующие счетчики создаются"""
+    versions = {}
+    for tag in tags:
+        key = get_tag_key(tag)
+        version = values.get(key)
+        if version is None:
+            version = _new_tag_version()
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key, version)
+        versions[tag] = version
+    return versions
+
+def get_tag_versions(tags: Iterable[str]) -> Dict[str, int]:
+    """
+    Текущие версии тегов (один get_many; в запросе - из кеша запроса)
+    
+    Args:
+        tags: Имена тегов
+    
+    Returns:
+        dict: {тег: версия}
+    """
+    tags = list(tags)
+    try:
+        return _read_tag_versions(tags, request_cache.get_many([get_tag_key(tag) for tag in tags]))
+    except Exception as e:
+        logger.error(f"Cache tag read error for {tags}: {e}")
+        return {}
+
+def get_tag_modified_key(tag: str) -> str:
+    """Ключ времени последней инвалидации тега (для Last-Modified)"""
+    return f"{settings.CACHES['default']['KEY_PREFIX']}:tag-modified:{tag}"
+
+def get_tag_stamps(tags: Iterable[str]) -> Tuple[Dict[str, int], Optional[float]]:
+    """
+    Версии тегов и время последнего изменения любого из них одним get_many
+    
+    Args:
+        tags: Имена тегов
+    
+    Returns:
+        tuple: ({тег: версия}, unix-время последней инвалидации или None)
+    """
+    tags = list(tags)
+    modified_keys = [get_tag_modified_key(tag) for tag in tags]
+    try:
+        values = request_cache.get_many([*(get_tag_key(tag) for tag in tags), *modified_keys])
+    except Exception as e:
+        logger.error(f"Cache tag read error for {tags}: {e}")
+        return {}, None
+    modified = []
+    for key in modified_keys:
+        if key not in values:
+            # Тег еще не инвалидировался (или вытеснен): отсчет с текущего момента
+            now = time.time()
+            values[key] = now if cache.add(key, now, timeout=None) else cache.get(key, now)
+        modified.append(values[key])
+    return _read_tag_versions(tags, values), max(modified, default=None)
+
+def invalidate_tags(*tags: str):
+    """
+    Инвалидация всех значений, помеченных тегами: O(1) INCR на тег
+    
+    Сами записи не удаляются - при чтении их метка версий не совпадет
+    с текущей, и они доживут до своего TTL.
+    
+    Args:
+        *tags: Имена тегов
+    """
+    request_cache.forget([*(get_tag_key(tag) for tag in tags), *(get_tag_modified_key(tag) for tag in tags)])
+    for tag in tags:
+        key = get_tag_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _new_tag_version(), timeout=None)
+        except Exception as e:
+            logger.error(f"Error invalidating cache tag {tag}: {e}")
+    try:
+        now = time.time()
+        cache.set_many({get_tag_modified_key(tag): now for tag in tags}, timeout=None)
+    except Exception as e:
+        logger.error(f"Error stamping cache tags {tags}: {e}")
+    publish_local_invalidation(tags=tags)
+    logger.info(f"Cache tags invalidated: {', '.join(tags)}")
+
+class LocalCache:
+    """
+    Ограниченный LRU-кеш с TTL в памяти процесса (L1 перед Redis)
+    
+    Хранит значения как есть, без сериализации: класть сюда можно только
+    неизменяемые данные (списки словарей, строки), а не модели и QuerySet.
+    """
+    
+    def __init__(self, maxsize: int = L1_MAXSIZE, timeout: int = L1_TIMEOUT):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, tags, expires_at = item
+            if time.monotonic() >= expires_at:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: Any, tags: Iterable[str] = (), timeout: Optional[int] = None):
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        with self._lock:
+            self._data[key] = (value, frozenset(tags), time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def invalidate_tags(self, tags: Iterable[str]):
+        tags = set(tags)
+        with self._lock:
+            for key in [key for key, item in self._data.items() if item[1] & tags]:
+                del self._data[key]
+    
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+    
+    def __len__(self):
+        return len(self._data)
+
+local_cache = LocalCache()
+
+_MISSING = object()
+_subscriber = {'pid': None}
+
+def _uses_redis() -> bool:
+    return settings.CACHES['default']['BACKEND'].startswith('django_redis')
+
+def _apply_local_invalidation(message: Dict):
+    for key in message.get('keys', ()):
+        local_cache.delete(key)
+    if message.get('tags'):
+        local_cache.invalidate_tags(message['tags'])
+
+def publish_local_invalidation(keys: Iterable[str] = (), tags: Iterable[str] = ()):
+    """
+    Сбросить ключи/теги в L1 этого процесса и разослать сброс остальным воркерам
+    
+    Рассылка идет через Redis pub/sub; если сообщение потеряется (Redis
+    недоступен), копии в L1 доживут не дольше L1_TIMEOUT секунд.
+    """
+    message = {'keys': list(keys), 'tags': list(tags)}
+    _apply_local_invalidation(message)
+    if not _uses_redis():
+        return
+    try:
+        from django_redis import get_redis_connection
+        get_redis_connection('default').publish(L1_INVALIDATION_CHANNEL, json.dumps(message))
+    except Exception as e:
+        logger.error(f"L1 invalidation publish error: {e}")
+
+def _listen_invalidations():
+    from django_redis import get_redis_connection
+    delay = 1
+    while True:
+        try:
+            pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(L1_INVALIDATION_CHANNEL)
+            # После (пере)подключения сообщения могли быть пропущены
+            local_cache.clear()
+            delay = 1
+            for message in pubsub.listen():
+                _apply_local_invalidation(json.loads(message['data']))
+        except Exception as e:
+            logger.warning(f"L1 invalidation listener error: {e}; retry in {delay}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 60)
+
+def _ensure_subscriber():
+    """Подписчик на сбросы L1 - один поток на процесс (заново после fork)"""
+    pid = os.getpid()
+    if _subscriber['pid'] == pid or not _uses_redis():
+        return
+    _subscriber['pid'] = pid
+    local_cache.clear()
+    threading.Thread(target=_listen_invalidations, name='cache-l1-invalidation', daemon=True).start()
+
+def _is_current(entry: Any, stamp: Optional[Dict[str, int]]) -> bool:
+    """Запись-обертка есть и помечена текущими версиями тегов"""
+    return entry is not None and entry['tags'] == stamp
+
+def _should_refresh(entry: Dict, now: float) -> bool:
+    """
+    Вероятностное раннее истечение (XFetch)
+    
+    Чем ближе логический срок и чем дольше считалось значение, тем выше
+    шанс, что очередной читатель обновит его заранее - горячий ключ
+    пересчитывается одним запросом до того, как истечет у всех сразу.
+    """
+    if entry['expires_at'] is None:
+        return False
+    jitter = -entry['delta'] * EARLY_EXPIRATION_BETA * math.log(1.0 - random.random())
+    return now + jitter >= entry['expires_at']
+
+def _compute_entry(cache_key, callback, timeout, version, stamp, single_flight, soft_timeout=None):
+    started = time.time()
+    fresh_data = callback()
+    finished = time.time()
+    entry = {
+        'value': fresh_data,
+        'tags': stamp,
+        'expires_at': finished + (soft_timeout or timeout) if timeout else None,
+        'delta': finished - started,
+    }
+    cache_stats.record(cache_key, computed=1, callback_us=int((finished - started) * 1_000_000),
+                       **cache_stats.size_metrics(entry))
+    # Для single-flight запись физически живет дольше логического срока,
+    # чтобы во время пересчета остальным было что отдать; в режиме
+    # stale-while-revalidate логический срок - мягкий TTL, физический - timeout
+    if timeout and single_flight and not soft_timeout:
+        storage_timeout = timeout + SINGLE_FLIGHT_STALE_GRACE
+    else:
+        storage_timeout = timeout
+    if single_flight or version is not None:
+        # Под блокировкой single-flight запись не откладываем: ее ждут другие процессы
+        cache.set(cache_key, entry, timeout=storage_timeout, version=version)
+    else:
+        request_cache.set(cache_key, entry, storage_timeout)
+    return fresh_data
+
+def _acquire_lock(cache_key: str, version: Optional[int]) -> Optional[str]:
+    """Блокировка пересчета ключа; токен владельца или None, если она занята"""
+    token = uuid.uuid4().hex
+    if cache.add(f"{cache_key}:lock", token, timeout=SINGLE_FLIGHT_LOCK_TIMEOUT, version=version):
+        return token
+    return None
+
+def _release_lock(cache_key: str, version: Optional[int], token: str):
+    lock_key = f"{cache_key}:lock"
+    if cache.get(lock_key, version=version) == token:
+        cache.delete(lock_key, version=version)
+
+def _refresh_in_background(cache_key, callback, timeout, version, stamp, soft_timeout, delay=0.0, publish=False):
+    """
+    Пересчитать значение в фоновом потоке (не больше одного пересчета на ключ)
+    
+    Поток работает со своим соединением с БД вне транзакции запроса
+    и закрывает его по завершении.
+    
+    Returns:
+        bool: Пересчет запущен (False - им уже занят другой процесс)
+    """
+    token = _acquire_lock(cache_key, version)
+    if token is None:
+        return False
+    
+    def refresh():
+        try:
+            time.sleep(delay)
+            _compute_entry(cache_key, callback, timeout, version, stamp, False, soft_timeout)
+            if publish:
+                publish_local_invalidation(keys=[cache_key])
+            logger.debug(f"Cache REFRESHED in background: {cache_key}")
+        except Exception as e:
+            logger.error(f"Background refresh error for key {cache_key}: {e}")
+        finally:
+            _release_lock(cache_key, version, token)
+            connections.close_all()
+    
+    threading.Thread(target=refresh, name=f'cache-refresh:{cache_key}', daemon=True).start()
+    return True
+
+def _get_entry(cache_key, callback, timeout, version, tags, single_flight, soft_timeout):
+    """get_cached_or_set() для значений в обертке: теги, single-flight, stale-while-revalidate"""
+    tags = list(tags or ())
+    keys = [cache_key, *(get_tag_key(tag) for tag in tags)]
+    if version is None:
+        values = request_cache.get_many(keys)
+    else:
+        values = cache.get_many(keys, version=version)
+    stamp = _read_tag_versions(tags, values) if tags else None
+    entry = values.get(cache_key)
+    current = _is_current(entry, stamp)
+    
+    if current and soft_timeout:
+        # Мягкий TTL истек: отдаем значение сразу, обновляем в фоне.
+        # После жесткого TTL (timeout) записи нет - обычный пересчет ниже
+        if entry['expires_at'] is not None and time.time() >= entry['expires_at']:
+            logger.debug(f"Cache STALE (revalidating): {cache_key}")
+            _count('redis', 'stale', cache_key)
+            _refresh_in_background(cache_key, callback, timeout, version, stamp, soft_timeout)
+        else:
+            logger.debug(f"Cache HIT: {cache_key}")
+            _count('redis', 'hits', cache_key)
+        return entry['value']
+    
+    if current and not (single_flight and _should_refresh(entry, time.time())):
+        logger.debug(f"Cache HIT: {cache_key}")
+        _count('redis', 'hits', cache_key)
+        return entry['value']
+    
+    _count('redis', 'misses', cache_key)
+    if not single_flight:
+        logger.debug(f"Cache MISS: {cache_key}")
+        return _compute_entry(cache_key, callback, timeout, version, stamp, single_flight, soft_timeout)
+    
+    token = _acquire_lock(cache_key, version)
+    if token is not None:
+        logger.debug(f"Cache MISS (single-flight leader): {cache_key}")
+        try:
+            return _compute_entry(cache_key, callback, timeout, version, stamp, single_flight, soft_timeout)
+        finally:
+            _release_lock(cache_key, version, token)
+    
+    # Пересчетом уже занят другой процесс: отдаем прежнее значение, а если
+    # его нет - недолго ждем, пока появится новое
+    if current:
+        logger.debug(f"Cache STALE (refresh in progress): {cache_key}")
+        return entry['value']
+    
+    deadline = time.monotonic() + SINGLE_FLIGHT_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+        entry = cache.get(cache_key, version=version)
+        if _is_current(entry, stamp):
+            logger.debug(f"Cache HIT after wait: {cache_key}")
+            return entry['value']
+    
+    logger.warning(f"Single-flight wait timed out: {cache_key}")
+    return _compute_entry(cache_key, callback, timeout, version, stamp, single_flight, soft_timeout)
 
 def get_cached_or_set(
     cache_key: str,
     callback: Callable,
     timeout: Optional[int] = None,
-    version: Optional[int] = None
+    version: Optional[int] = None,
+    tags: Optional[Iterable[str]] = None,
+    single_flight: bool = False,
+    soft_timeout: Optional[int] = None,
+    local: bool = False
 ) -> Any:
     """
     Получить данные из кеша или выполнить callback и закешировать результат
@@ -46,29 +451,115 @@ def get_cached_or_set(
         callback: Функция для получения данных, если их нет в кеше
         timeout: Время жизни кеша в секундах (None = default из settings)
         version: Версия ключа кеша (для инвалидации)
+        tags: Теги значения; значение сохраняется с меткой версий тегов и
+            считается промахом, если после этого вызван invalidate_tags()
+            хотя бы для одного из них. Ключ и версии читаются одним get_many.
+        single_flight: Защита от "стада" при истечении горячего ключа:
+            callback выполняет один вызывающий (блокировка в кеше), остальные
+            получают прежнее значение или ждут до SINGLE_FLIGHT_WAIT секунд.
+            Значение обновляется заранее с вероятностью, растущей к концу TTL.
+        soft_timeout: Мягкий TTL (stale-while-revalidate, меньше timeout):
+            после него значение отдается сразу, а один фоновый поток
+            пересчитывает его; после timeout (жесткого TTL) значение
+            пересчитывается синхронно, как обычно.
+        local: Держать копию в памяти воркера (L1, не дольше L1_TIMEOUT).
+            Только для маленьких неизменяемых значений; сбрасывается
+            invalidate_tags() и invalidate_cache() во всех воркерах.
     
     Returns:
         Any: Закешированные или свежие данные
     """
     try:
-        cached_data = cache.get(cache_key, version=version)
+        if timeout is None:
+            timeout = settings.CACHES['default'].get('TIMEOUT', 300)
+        tags = list(tags) if tags else None
+        
+        if local:
+            _ensure_subscriber()
+            local_key = f"{cache_key}:{version}" if version is not None else cache_key
+            value = local_cache.get(local_key, _MISSING)
+            if value is not _MISSING:
+                _count('l1', 'hits', cache_key)
+                return value
+            _count('l1', 'misses')
+            value = get_cached_or_set(cache_key, callback, timeout, version, tags, single_flight, soft_timeout)
+            local_cache.set(local_key, value, tags=tags or (), timeout=timeout)
+            return value
+        
+        if tags or single_flight or soft_timeout:
+            return _get_entry(cache_key, callback, timeout, version, tags, single_flight, soft_timeout)
+        
+        if version is None:
+            cached_data = request_cache.get(cache_key)
+        else:
+            cached_data = cache.get(cache_key, version=version)
         if cached_data is not None:
             logger.debug(f"Cache HIT: {cache_key}")
+            _count('redis', 'hits', cache_key)
             return cached_data
         
         logger.debug(f"Cache MISS: {cache_key}")
+        _count('redis', 'misses', cache_key)
+        started = time.time()
         fresh_data = callback()
-        
-        if timeout is None:
-            timeout = settings.CACHES['default'].get('TIMEOUT', 300)
-        
-        cache.set(cache_key, fresh_data, timeout=timeout, version=version)
+        cache_stats.record(cache_key, computed=1, callback_us=int((time.time() - started) * 1_000_000),
+                           **cache_stats.size_metrics(fresh_data))
+        if version is None:
+            request_cache.set(cache_key, fresh_data, timeout)
+        else:
+            cache.set(cache_key, fresh_data, timeout=timeout, version=version)
         return fresh_data
     
+    except Http404:
+        # "Не найдено" из callback - ответ view, а не сбой кеша: не кешируем и не пересчитываем
+        raise
     except Exception as e:
         logger.error(f"Cache error for key {cache_key}: {e}")
+        cache_stats.record(cache_key, errors=1)
         return callback()
 
+def refresh_cache(
+    cache_key: str,
+    callback: Callable,
+    timeout: Optional[int] = None,
+    soft_timeout: Optional[int] = None,
+    background: bool = False,
+    delay: float = 0.0
+) -> bool:
+    """
+    Пересчитать значение get_cached_or_set() заранее, не дожидаясь промаха
+    
+    Для ключей без тегов. Одновременно идет не больше одного пересчета ключа
+    (та же блокировка, что у single-flight); после записи копии в L1 всех
+    воркеров сбрасываются.
+    
+    Args:
+        cache_key: Ключ кеша
+        callback: Функция для получения данных
+        timeout: Время жизни кеша в секундах (None = default из settings)
+        soft_timeout: Мягкий TTL, как в get_cached_or_set()
+        background: Пересчитать в фоновом потоке
+        delay: Пауза перед пересчетом в фоне: изменения, сделанные за это
+            время, попадут в тот же пересчет
+    
+    Returns:
+        bool: Пересчет выполнен или запущен (False - им уже занят другой процесс)
+    """
+    if timeout is None:
+        timeout = settings.CACHES['default'].get('TIMEOUT', 300)
+    if background:
+        return _refresh_in_background(cache_key, callback, timeout, None, None, soft_timeout, delay, publish=True)
+    
+    token = _acquire_lock(cache_key, None)
+    if token is None:
+        return False
+    try:
+        _compute_entry(cache_key, callback, timeout, None, None, False, soft_timeout)
+        publish_local_invalidation(keys=[cache_key])
+    finally:
+        _release_lock(cache_key, None, token)
+    return True
+
 def invalidate_cache(cache_key: str, version: Optional[int] = None):
     """
     Инвалидация (удаление) конкретного ключа кеша
@@ -78,54 +569,10 @@ def invalidate_cache(cache_key: str, version: Optional[int] = None):
         version: Версия ключа
     """
     try:
+        if version is None:
+            request_cache.forget([cache_key])
         cache.delete(cache_key, version=version)
+        publish_local_invalidation(keys=[cache_key if version is None else f"{cache_key}:{version}"])
         logger.info(f"Cache invalidated: {cache_key}")
     except Exception as e:
         logger.error(f"Error invalidating cache key {cache_key}: {e}")
-
-def invalidate_cache_pattern(pattern: str):
-    """
-    Инвалидация всех ключей, соответствующих паттерну (только для Redis)
-    
-    Args:
-        pattern: Паттерн для поиска ключей (например, 'bboard:rubrics:*')
-    """
-    try:
-        cache.delete_pattern(pattern)
-        logger.info(f"Cache pattern invalidated: {pattern}")
-    except AttributeError:
-        logger.warning("delete_pattern not supported for current cache backend")
-    except Exception as e:
-        logger.error(f"Error invalidating cache pattern {pattern}: {e}")
-
-def cache_view_result(timeout: int = 300, key_prefix: str = 'view'):
-    """
-    Декоратор для кеширования результата view-функции
-    
-    Args:
-        timeout: Время жизни кеша в секундах
-        key_prefix: Префикс для ключа кеша
-    
-    Usage:
-        @cache_view_result(timeout=600, key_prefix='bb_list')
-        def my_view(request):
-            ...
-    """
-    def decorator(view_func):
-        @wraps(view_func)
-        def wrapper(request, *args, **kwargs):
-            cache_key = generate_cache_key(
-                key_prefix,
-                request.path,
-                request.GET.dict(),
-                request.user.is_authenticated,
-                request.user.pk if request.user.is_authenticated else None
-            )
-            
-            def execute_view():
-                return view_func(request, *args, **kwargs)
-            
-            return get_cached_or_set(cache_key, execute_view, timeout=timeout)
-        
-        return wrapper
-    return decorator
\ No newline at end of file
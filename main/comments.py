@@ -0,0 +1,58 @@
+"""
+Комментарии к объявлению страницами из кеша
+
+Страница - COMMENTS_PAGE_SIZE активных комментариев в порядке (created_at, pk)
+по убыванию; следующая выбирается курсором последней строки, поэтому любая
+страница читается одним запросом по индексу (bb, created_at). Страницы
+помечены тегом bb:<pk> и сбрасываются вместе со страницей объявления
+сигналами Comment. Первая страница выводится в bb_detail, остальные
+подгружает bb_comments (JSON с HTML-фрагментом).
+"""
+from typing import Dict, Optional
+
+from django.db.models import Q
+
+from .cache_utils import generate_cache_key, get_cached_or_set
+from .models import Comment
+from .pagination import decode_cursor, encode_cursor
+
+COMMENTS_PAGE_SIZE = 20
+COMMENTS_TIMEOUT = 600
+
+COMMENT_FIELDS = ('pk', 'author', 'content', 'rating', 'created_at')
+
+
+def get_comments_cache_key(bb_id: int, after: Optional[str] = None) -> str:
+    return generate_cache_key('bb_comments', bb_id, after or '')
+
+
+def compute_comments_page(bb_id: int, after: Optional[str] = None) -> Dict:
+    """
+    Одна страница комментариев из базы
+
+    Returns:
+        dict: {'comments': [{'pk', 'author', 'content', 'rating', 'created_at'}, ...],
+               'next': курсор следующей страницы или None}
+    """
+    comments = Comment.objects.filter(bb_id=bb_id, is_active=True)
+    cursor = decode_cursor(after)
+    if cursor is not None:
+        created_at, pk = cursor
+        comments = comments.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    rows = list(comments.order_by('-created_at', '-pk').values(*COMMENT_FIELDS)[:COMMENTS_PAGE_SIZE + 1])
+    has_more = len(rows) > COMMENTS_PAGE_SIZE
+    rows = rows[:COMMENTS_PAGE_SIZE]
+    return {
+        'comments': rows,
+        'next': encode_cursor(rows[-1]['created_at'], rows[-1]['pk']) if has_more else None,
+    }
+
+
+def get_comments_page(bb_id: int, after: Optional[str] = None) -> Dict:
+    """Страница комментариев (после курсора after) из кеша"""
+    return get_cached_or_set(
+        get_comments_cache_key(bb_id, after),
+        lambda: compute_comments_page(bb_id, after),
+        timeout=COMMENTS_TIMEOUT,
+        tags=[f'bb:{bb_id}'],
+    )
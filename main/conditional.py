@@ -0,0 +1,88 @@
+"""
+Условные GET-запросы (ETag / Last-Modified) для страниц по версиям тегов кеша
+
+Версии тегов ('bb:5', 'rubric:3', 'sidebar') меняют сигналы при каждом
+изменении объявления, комментария или рубрики. Счетчики рубрик в сайдбаре
+тегов не меняют: ETag включает номер периода PAGE_CACHE_TIMEOUT, и они
+отстают не дольше, чем в кеше страниц. Ответ 304 строит
+main.middleware.ConditionalPageMiddleware до вызова view и до открытия
+транзакции ATOMIC_REQUESTS: нужен только один get_many в Redis, без
+запросов к базе.
+"""
+import datetime
+import hashlib
+import time
+from typing import Callable, List, Optional
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+
+from .cache_utils import get_tag_stamps
+
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+
+
+def _page_stamps(request, tags: List[str]):
+    """Версии тегов страницы; читаются один раз на запрос (ETag, Last-Modified, кеш страниц)"""
+    if not hasattr(request, '_page_stamps'):
+        request._page_stamps = {}
+    key = tuple(tags)
+    if key not in request._page_stamps:
+        request._page_stamps[key] = get_tag_stamps(tags)
+    return request._page_stamps[key]
+
+
+def _is_conditional(request) -> bool:
+    # Непоказанные сообщения (messages) должны попасть в новую отрисовку
+    return request.method in ('GET', 'HEAD') and not request.session.get('_messages')
+
+
+def page_etag(request, tags: List[str]) -> Optional[str]:
+    """
+    ETag страницы: версии тегов + то, от чего зависит отрисовка для пользователя
+
+    Пользователь и часовой пояс берутся из сессии, а не из request.user,
+    чтобы не делать запрос к таблице пользователей.
+    """
+    if not _is_conditional(request):
+        return None
+    versions, _ = _page_stamps(request, tags)
+    if len(versions) < len(tags):
+        return None
+    parts = [f'{tag}={versions[tag]}' for tag in tags]
+    parts.append(f"user={request.session.get(SESSION_KEY, '')}")
+    parts.append(f"tz={request.session.get('django_timezone', '')}")
+    # Сайдбар со счетчиками тегами не покрыт - копия браузера живет не дольше периода
+    parts.append(f'period={int(time.time()) // PAGE_CACHE_TIMEOUT}')
+    return hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def page_last_modified(request, tags: List[str]) -> Optional[datetime.datetime]:
+    if not _is_conditional(request):
+        return None
+    _, modified = _page_stamps(request, tags)
+    if modified is None:
+        return None
+    return datetime.datetime.fromtimestamp(modified, tz=datetime.timezone.utc)
+
+
+def conditional_page(get_tags: Callable[..., List[str]]):
+    """
+    Пометить view как страницу с ETag/Last-Modified по версиям тегов
+
+    Заголовки и ответ 304 добавляет ConditionalPageMiddleware. Страница
+    персональная, поэтому Cache-Control: private, no-cache - браузер хранит
+    копию, но каждый раз перепроверяет ее.
+
+    Args:
+        get_tags: Функция (request, *args, **kwargs view) -> список тегов страницы
+
+    Usage:
+        @conditional_page(lambda request, pk: [f'rubric:{pk}', 'sidebar'])
+        def rubric_bbs(request, pk):
+            ...
+    """
+    def decorator(view_func):
+        view_func.conditional_page_tags = get_tags
+        return view_func
+    return decorator
@@ -0,0 +1,160 @@
+"""
+Денормализованные счетчики объявления: комментарии и оценки
+
+Bb.comment_count, rating_sum и rating_count учитывают активные комментарии
+(оценки - только ненулевые). Они меняются атомарным UPDATE ... SET
+x = x + delta (F-выражения) в той же транзакции, что и комментарий:
+из сигналов Comment и из массового снятия с публикации в админке.
+Точные значения пересчитывает recompute_bb_counters()
+(команда bb_counters_recompute).
+"""
+import logging
+from typing import Dict, List, Tuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+
+from .cache_utils import generate_cache_key, invalidate_tags
+from .listings import get_bb_row_cache_key
+from .models import Bb, Comment
+
+logger = logging.getLogger(__name__)
+
+COUNTER_FIELDS = Bb.COUNTER_FIELDS
+
+
+def comment_contribution(is_active: bool, rating: int) -> Tuple[int, int, int]:
+    """Вклад комментария в (comment_count, rating_sum, rating_count)"""
+    if not is_active:
+        return 0, 0, 0
+    return (1, rating, 1) if rating else (1, 0, 0)
+
+
+def apply_counter_delta(bb_id: int, comments: int = 0, rating_sum: int = 0, rating_count: int = 0):
+    """Изменить счетчики объявления одним UPDATE с F-выражениями"""
+    deltas = zip(COUNTER_FIELDS, (comments, rating_sum, rating_count))
+    changes = {field: F(field) + delta for field, delta in deltas if delta}
+    if changes:
+        Bb.objects.filter(pk=bb_id).update(**changes)
+
+
+def invalidate_bb_comment_caches(*bb_ids: int):
+    """
+    Сбросить после коммита запись объявления и строку списка (в них счетчики)
+    и версии страницы объявления, его рубрики и главной: карточки списков
+    показывают оценку и число комментариев
+    """
+    if not bb_ids:
+        return
+    keys = [key for bb_id in bb_ids for key in (generate_cache_key('bb_detail', bb_id), get_bb_row_cache_key(bb_id))]
+    rubric_ids = set(Bb.objects.filter(pk__in=bb_ids).values_list('rubric_id', flat=True))
+    tags = ['index', *(f'bb:{bb_id}' for bb_id in bb_ids), *(f'rubric:{rubric_id}' for rubric_id in rubric_ids)]
+
+    def invalidate():
+        cache.delete_many(keys)
+        invalidate_tags(*tags)
+
+    transaction.on_commit(invalidate)
+
+
+def deactivate_comments(queryset) -> int:
+    """
+    Снять комментарии с публикации одним UPDATE и вычесть их из счетчиков
+
+    Returns:
+        int: Сколько комментариев снято
+    """
+    from .popular import refresh_popular_bbs
+
+    with transaction.atomic():
+        pks = list(queryset.filter(is_active=True).values_list('pk', flat=True))
+        if not pks:
+            return 0
+        stats = list(
+            Comment.objects.filter(pk__in=pks)
+            .values('bb_id')
+            .annotate(
+                comments=Count('id'),
+                rating_sum=Sum('rating', filter=Q(rating__gt=0), default=0),
+                rating_count=Count('id', filter=Q(rating__gt=0)),
+            )
+            .order_by()
+        )
+        updated = Comment.objects.filter(pk__in=pks).update(is_active=False)
+        for row in stats:
+            apply_counter_delta(row['bb_id'], -row['comments'], -row['rating_sum'], -row['rating_count'])
+        invalidate_bb_comment_caches(*(row['bb_id'] for row in stats))
+        transaction.on_commit(lambda: refresh_popular_bbs(background=True))
+    return updated
+
+
+def compute_bb_counters() -> Dict[int, Tuple[int, int, int]]:
+    """Точные счетчики одним GROUP BY по активным комментариям: {pk объявления: (comments, sum, count)}"""
+    rows = (
+        Comment.objects.filter(is_active=True)
+        .values('bb_id')
+        .annotate(
+            comments=Count('id'),
+            rating_sum=Sum('rating', filter=Q(rating__gt=0), default=0),
+            rating_count=Count('id', filter=Q(rating__gt=0)),
+        )
+        .order_by()
+    )
+    return {row['bb_id']: (row['comments'], row['rating_sum'], row['rating_count']) for row in rows}
+
+
+def recompute_bb_counters(batch_size: int = 500) -> List[int]:
+    """
+    Пересчитать счетчики всех объявлений и записать расходящиеся
+
+    Returns:
+        List[int]: PK исправленных объявлений
+    """
+    with transaction.atomic():
+        actual = compute_bb_counters()
+        fixed = []
+        for bb in Bb.objects.only('pk', *COUNTER_FIELDS).order_by().iterator(chunk_size=batch_size):
+            values = actual.get(bb.pk, (0, 0, 0))
+            if tuple(getattr(bb, field) for field in COUNTER_FIELDS) != values:
+                for field, value in zip(COUNTER_FIELDS, values):
+                    setattr(bb, field, value)
+                fixed.append(bb)
+        Bb.objects.bulk_update(fixed, COUNTER_FIELDS, batch_size=batch_size)
+        pks = [bb.pk for bb in fixed]
+        invalidate_bb_comment_caches(*pks)
+    logger.info(f"Bb counters recomputed: {len(pks)} fixed")
+    return pks
+
+
+def rating_summary(rating_sum: int, rating_count: int) -> Dict:
+    """Средняя оценка, подписи и звезды для main/bb_detail.html из счетчиков"""
+    avg_rating_value = rating_sum / rating_count if rating_count else 0.0
+    full_stars = min(int(avg_rating_value), 5)
+    has_half_star = full_stars < 5 and (avg_rating_value - full_stars) >= 0.5
+    empty_stars = max(5 - full_stars - (1 if has_half_star else 0), 0)
+    avg_rating = round(avg_rating_value, 1) if rating_count else 0
+
+    if rating_count:
+        avg_rating_text = f'{avg_rating:.1f} из 5'
+        last_digit = rating_count % 10
+        last_two_digits = rating_count % 100
+        if last_digit == 1 and last_two_digits != 11:
+            rating_label = f'{rating_count} оценка'
+        elif last_digit in (2, 3, 4) and not 12 <= last_two_digits <= 14:
+            rating_label = f'{rating_count} оценки'
+        else:
+            rating_label = f'{rating_count} оценок'
+    else:
+        avg_rating_text = 'Нет оценок'
+        rating_label = ''
+
+    return {
+        'avg_rating': avg_rating,
+        'rating_count': rating_count,
+        'avg_rating_text': avg_rating_text,
+        'rating_label': rating_label,
+        'full_stars': full_stars,
+        'has_half_star': has_half_star,
+        'empty_stars': empty_stars,
+    }
@@ -0,0 +1,86 @@
+"""
+SQLite под несколькими воркерами gunicorn
+
+Каждое новое соединение получает PRAGMA из settings.SQLITE_PRAGMAS: WAL
+(читатели не ждут писателя), synchronous=NORMAL, кеш страниц, mmap и
+busy_timeout - ожидание блокировки вместо немедленного "database is locked".
+Транзакции открываются как BEGIN IMMEDIATE (OPTIONS transaction_mode),
+поэтому GET и HEAD выполняются без обертки ATOMIC_REQUESTS - иначе каждый
+GET занимал бы блокировку записи: свои view помечены @non_atomic_reads,
+URL сторонних приложений (админка, CAPTCHA) - через non_atomic_read_urls().
+"""
+from functools import wraps
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import URLPattern, URLResolver
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def pragma_statements(pragmas: Optional[Dict] = None) -> List[str]:
+    """PRAGMA для соединения (по умолчанию settings.SQLITE_PRAGMAS)"""
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {}) if pragmas is None else pragmas
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Применить PRAGMA к новому соединению SQLite"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements():
+            cursor.execute(statement)
+
+
+def non_atomic_reads(view_func):
+    """
+    GET и HEAD без транзакции ATOMIC_REQUESTS, остальные методы - в транзакции
+
+    Для view, которые на GET только читают (запись вне транзакции, как
+    CAPTCHA в форме комментария, выполняется в autocommit). Ставится
+    первым декоратором, чтобы атрибуты @conditional_page и
+    @anonymous_page_cache остались на итоговой функции.
+
+    Usage:
+        @non_atomic_reads
+        @conditional_page(...)
+        def bb_detail(request, rubric_pk, pk):
+            ...
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return view_func(request, *args, **kwargs)
+        with transaction.atomic():
+            return view_func(request, *args, **kwargs)
+    return transaction.non_atomic_requests(wrapper)
+
+
+def _wrap_patterns(patterns):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            _wrap_patterns(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and 'default' not in getattr(pattern.callback, '_non_atomic_requests', set()):
+            pattern.callback = non_atomic_reads(pattern.callback)
+
+
+def non_atomic_read_urls(urls):
+    """
+    @non_atomic_reads на всех view включаемого URLconf стороннего приложения
+
+    Принимает то же, что path() получает от include() или admin.site.urls:
+    кортеж (модуль или список URL, app_name, namespace).
+
+    Usage:
+        path('admin/', non_atomic_read_urls(admin.site.urls)),
+        path('captcha/', non_atomic_read_urls(include('captcha.urls'))),
+    """
+    urlconf, app_name, namespace = urls
+    patterns = getattr(urlconf, 'urlpatterns', urlconf)
+    _wrap_patterns(patterns)
+    return patterns, app_name, namespace
@@ -0,0 +1,235 @@
+"""
+Предрасчитанные фасеты: число активных объявлений по рубрикам и гистограмма цен
+
+Счетчики лежат в Redis и обновляются сигналами Bb на каждое изменение
+(инкрементально, после коммита транзакции). Чтение фасета - один get_many
+по O(рубрик) ключам, без сканирования Bb. Дрейф (массовые update() мимо
+сигналов, вытеснение ключей) исправляет reconcile_facets(): команда
+facets_reconcile по расписанию или автоматически при пропавших ключах -
+не чаще раза в FACETS_RECONCILE_INTERVAL секунд на весь сайт (блокировка
+cache.add). Пока пересчет занят или Redis недоступен, читатель получает
+последние прочитанные воркером значения (или нули), без запросов к Bb.
+Теги страниц изменения счетчиков не затрагивают: в закешированных страницах
+и ответах 304 сайдбар отстает не более чем на PAGE_CACHE_TIMEOUT секунд.
+"""
+import logging
+from bisect import bisect_right
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, When, Value, IntegerField, Count, QuerySet
+
+from . import request_cache
+from .models import Bb, SubRubric
+from .cache_utils import generate_cache_key
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограммы цен (в рублях); корзина -1 - объявления без цены
+PRICE_BUCKETS = (1_000, 5_000, 10_000, 50_000, 100_000, 500_000, 1_000_000)
+NO_PRICE_BUCKET = -1
+ALL_BUCKETS = (NO_PRICE_BUCKET, *range(len(PRICE_BUCKETS) + 1))
+ALL_RUBRICS = 'all'
+
+FACETS_RECONCILE_INTERVAL = getattr(settings, 'FACETS_RECONCILE_INTERVAL', 60)
+
+# Последние прочитанные из Redis значения счетчиков (на воркер)
+_last_values: Dict[str, int] = {}
+
+
+def price_bucket(price: Optional[float]) -> int:
+    """Номер корзины гистограммы для цены"""
+    if price is None:
+        return NO_PRICE_BUCKET
+    return bisect_right(PRICE_BUCKETS, price)
+
+
+def price_bucket_expression() -> Case:
+    """То же, что price_bucket(), но выражением SQL для GROUP BY"""
+    return Case(
+        When(price__isnull=True, then=Value(NO_PRICE_BUCKET)),
+        *[When(price__lt=bound, then=Value(i)) for i, bound in enumerate(PRICE_BUCKETS)],
+        default=Value(len(PRICE_BUCKETS)),
+        output_field=IntegerField(),
+    )
+
+
+def price_bucket_label(bucket: int) -> str:
+    if bucket == NO_PRICE_BUCKET:
+        return 'Без цены'
+    if bucket == 0:
+        return f'до {PRICE_BUCKETS[0]:,} ₽'.replace(',', ' ')
+    if bucket == len(PRICE_BUCKETS):
+        return f'от {PRICE_BUCKETS[-1]:,} ₽'.replace(',', ' ')
+    return f'{PRICE_BUCKETS[bucket - 1]:,} – {PRICE_BUCKETS[bucket]:,} ₽'.replace(',', ' ')
+
+
+def price_bucket_bounds(bucket: int) -> tuple:
+    """(min_price, max_price) корзины; None - граница отсутствует"""
+    if bucket == NO_PRICE_BUCKET:
+        return None, None
+    low = PRICE_BUCKETS[bucket - 1] if bucket > 0 else None
+    high = PRICE_BUCKETS[bucket] if bucket < len(PRICE_BUCKETS) else None
+    return low, high
+
+
+def get_rubric_count_key(rubric_id) -> str:
+    return generate_cache_key('facet_rubric', rubric_id)
+
+
+def get_price_count_key(scope, bucket: int) -> str:
+    return generate_cache_key('facet_price', scope, bucket)
+
+
+def get_price_count_keys(scope=ALL_RUBRICS) -> List[str]:
+    """Ключи всех корзин гистограммы (для @prefetch_cache_keys)"""
+    return [get_price_count_key(scope, bucket) for bucket in ALL_BUCKETS]
+
+
+def apply_delta(rubric_id: int, price: Optional[float], delta: int):
+    """
+    Изменить счетчики рубрики и гистограммы цен на delta (+1 / -1)
+
+    Пропавшие счетчики не создаются: их целиком пересчитает reconcile_facets()
+    при следующем чтении.
+    """
+    bucket = price_bucket(price)
+    keys = (
+        get_rubric_count_key(rubric_id),
+        get_price_count_key(rubric_id, bucket),
+        get_price_count_key(ALL_RUBRICS, bucket),
+    )
+    request_cache.forget(keys)
+    for key in keys:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            logger.debug(f"Facet counter missing: {key}")
+        except Exception as e:
+            logger.error(f"Facet counter error for {key}: {e}")
+
+
+def compute_facets() -> Dict[str, int]:
+    """
+    Точные значения всех счетчиков одним GROUP BY по активным объявлениям
+
+    Returns:
+        dict: {ключ кеша: значение}, включая нули
+    """
+    rubric_counts = defaultdict(int)
+    price_counts = defaultdict(int)
+
+    rows = (
+        Bb.objects.filter(is_active=True)
+        .annotate(bucket=price_bucket_expression())
+        .values('rubric', 'bucket')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    for row in rows:
+        rubric_counts[row['rubric']] += row['n']
+        price_counts[(row['rubric'], row['bucket'])] += row['n']
+        price_counts[(ALL_RUBRICS, row['bucket'])] += row['n']
+
+    values = {}
+    for rubric_id in SubRubric.objects.values_list('pk', flat=True):
+        values[get_rubric_count_key(rubric_id)] = rubric_counts[rubric_id]
+        for bucket in ALL_BUCKETS:
+            values[get_price_count_key(rubric_id, bucket)] = price_counts[(rubric_id, bucket)]
+    for bucket in ALL_BUCKETS:
+        values[get_price_count_key(ALL_RUBRICS, bucket)] = price_counts[(ALL_RUBRICS, bucket)]
+    return values
+
+
+def reconcile_facets() -> Dict[str, int]:
+    """Пересчитать все счетчики и записать их в Redis без срока жизни"""
+    values = compute_facets()
+    try:
+        cache.set_many(values, timeout=None)
+    except Exception as e:
+        logger.error(f"Facets reconcile error: {e}")
+    request_cache.forget(values)
+    logger.info(f"Facets reconciled: {len(values)} counters")
+    return values
+
+
+def _acquire_reconcile() -> bool:
+    """
+    Право на автоматический пересчет: одно на FACETS_RECONCILE_INTERVAL секунд
+
+    Блокировка не снимается после пересчета - она ограничивает частоту. Без
+    Redis (ошибка или IGNORE_EXCEPTIONS) права нет.
+    """
+    try:
+        return bool(cache.add(f"{generate_cache_key('facets')}:lock", 1, timeout=FACETS_RECONCILE_INTERVAL))
+    except Exception as e:
+        logger.error(f"Facets reconcile lock error: {e}")
+        return False
+
+
+def _read_counters(keys: List[str]) -> Dict[str, int]:
+    try:
+        values = request_cache.get_many(keys)
+    except Exception as e:
+        # Redis недоступен: пересчет все равно некуда записать
+        logger.error(f"Facets read error: {e}")
+        return {key: _last_values.get(key, 0) for key in keys}
+    if len(values) < len(keys):
+        if _acquire_reconcile():
+            values = reconcile_facets()
+        else:
+            logger.debug(f"Facets missing: {len(keys) - len(values)} of {len(keys)}, reconcile skipped")
+            return {key: values.get(key, _last_values.get(key, 0)) for key in keys}
+    _last_values.update((key, values[key]) for key in keys if key in values)
+    return values
+
+
+def get_rubric_counts(rubric_ids: Iterable[int]) -> Dict[int, int]:
+    """
+    Число активных объявлений по рубрикам
+
+    Returns:
+        dict: {pk рубрики: число объявлений}
+    """
+    keys = {rubric_id: get_rubric_count_key(rubric_id) for rubric_id in rubric_ids}
+    values = _read_counters(list(keys.values()))
+    return {rubric_id: max(values.get(key, 0), 0) for rubric_id, key in keys.items()}
+
+
+def histogram_rows(counts: Dict[int, int]) -> List[Dict]:
+    """Строки гистограммы для includes/_price_histogram.html (непустые корзины)"""
+    peak = max(counts.values(), default=0)
+    rows = []
+    for bucket in ALL_BUCKETS:
+        count = max(counts.get(bucket, 0), 0)
+        if not count:
+            continue
+        low, high = price_bucket_bounds(bucket)
+        rows.append({
+            'bucket': bucket,
+            'label': price_bucket_label(bucket),
+            'count': count,
+            'percent': round(count * 100 / peak) if peak else 0,
+            'min_price': low,
+            'max_price': high,
+        })
+    return rows
+
+
+def get_price_histogram(rubric_id=ALL_RUBRICS) -> List[Dict]:
+    """Гистограмма цен активных объявлений рубрики (или всего сайта) из счетчиков"""
+    keys = {bucket: get_price_count_key(rubric_id, bucket) for bucket in ALL_BUCKETS}
+    values = _read_counters(list(keys.values()))
+    return histogram_rows({bucket: values.get(key, 0) for bucket, key in keys.items()})
+
+
+def compute_price_histogram(queryset: QuerySet) -> Dict[int, int]:
+    """
+    Гистограмма цен для произвольной выборки (результатов поиска) одним GROUP BY
+
+    Вызывается только при промахе кеша, вместе с подсчетом числа найденных.
+    """
+    rows = queryset.annotate(bucket=price_bucket_expression()).values('bucket').annotate(n=Count('id')).order_by()
+    return {row['bucket']: row['n'] for row in rows}
@@ -74,7 +74,20 @@ class SubRubricForm(forms.ModelForm):
         fields = '__all__' 
 
 class SearchForm(forms.Form): 
+    SORT_CHOICES = (
+        ('new', 'Сначала новые'),
+        ('cheap', 'Сначала дешевые'),
+        ('expensive', 'Сначала дорогие'),
+    )
+    # Поле сортировки для keyset-пагинации; при сортировке по цене объявления без цены не выводятся
+    SORT_ORDERINGS = {'new': '-created_at', 'cheap': 'price', 'expensive': '-price'}
+
     keyword = forms.CharField(required=False, max_length=20, label='') 
+    min_price = forms.IntegerField(required=False, min_value=0, label='Цена от',
+                                   widget=forms.NumberInput(attrs={'placeholder': 'от'}))
+    max_price = forms.IntegerField(required=False, min_value=0, label='Цена до',
+                                   widget=forms.NumberInput(attrs={'placeholder': 'до'}))
+    sort = forms.ChoiceField(required=False, choices=SORT_CHOICES, label='Сортировка')
 
 class BbForm(forms.ModelForm):
     price = forms.CharField(
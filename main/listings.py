@@ -0,0 +1,136 @@
+"""
+Компактные записи объявлений для кеша: строки списков и страница объявления
+
+Записи - простые словари без моделей и QuerySet: их можно безопасно
+хранить между релизами (формат задает settings.CACHE_SCHEMA_VERSION).
+"""
+import logging
+from typing import Dict, List, Optional
+
+from django.utils.text import Truncator
+from easy_thumbnails.files import get_thumbnailer
+
+from . import request_cache
+from .models import Bb
+from .cache_utils import generate_cache_key, get_tag_key
+
+logger = logging.getLogger(__name__)
+
+BB_ROW_TIMEOUT = 3600
+
+# Поля, которые выводит includes/_bbs_list.html
+LISTING_FIELDS = ('pk', 'rubric_id', 'title', 'content', 'price', 'image', 'created_at', 'comment_count',
+                  'rating_sum', 'rating_count')
+
+
+def get_bb_row_cache_key(pk: int) -> str:
+    return generate_cache_key('bb_row', pk)
+
+
+def get_thumbnail_url(image) -> Optional[str]:
+    """URL миниатюры 'default' (та же, что дает тег {% thumbnail %})"""
+    if not image:
+        return None
+    try:
+        return get_thumbnailer(image)['default'].url
+    except Exception as e:
+        logger.error(f"Thumbnail error for {image.name}: {e}")
+        return None
+
+
+def bb_row(bb: Bb) -> Dict:
+    """
+    Компактная строка объявления для карточки в списке
+
+    Args:
+        bb: Объявление, загруженное хотя бы с LISTING_FIELDS
+
+    Returns:
+        dict: Только то, что выводит карточка
+    """
+    return {
+        'pk': bb.pk,
+        'rubric_id': bb.rubric_id,
+        'title': bb.title,
+        'content': Truncator(bb.content).chars(150),
+        'price': bb.price,
+        'created_at': bb.created_at,
+        'thumbnail_url': get_thumbnail_url(bb.image),
+        'comment_count': bb.comment_count,
+        'rating': round(bb.rating_sum / bb.rating_count, 1) if bb.rating_count else None,
+        'rating_count': bb.rating_count,
+    }
+
+
+def bb_detail_record(bb: Bb) -> Dict:
+    """
+    Компактная запись страницы объявления (main/bb_detail.html)
+
+    Args:
+        bb: Объявление с загруженной рубрикой
+
+    Returns:
+        dict: Поля объявления, рубрика, URL всех фотографий и счетчики комментариев и оценок
+    """
+    return {
+        'pk': bb.pk,
+        'rubric': {'pk': bb.rubric_id, 'name': bb.rubric.name},
+        'title': bb.title,
+        'content': bb.content,
+        'price': bb.price,
+        'contacts': bb.contacts,
+        'created_at': bb.created_at,
+        'image_url': bb.image.url if bb.image else None,
+        'image_urls': [ai.image.url for ai in bb.additionalimage_set.all()],
+        'comment_count': bb.comment_count,
+        'rating_sum': bb.rating_sum,
+        'rating_count': bb.rating_count,
+    }
+
+
+def get_bb_rows(pks: List[int]) -> List[Dict]:
+    """
+    Строки объявлений в порядке pks: один get_many по кешу, промахи - одним запросом
+
+    Строка помечена версией тега bb:<pk>, прочитанной до запроса к базе (тем
+    же get_many). Запись, отложенная до конца запроса, могла прочитать строку
+    до коммита изменения - после смены версии тега она просто не читается.
+    Отсутствующий тег не создается: метка None перестает совпадать, как
+    только invalidate_tags() заведет счетчик.
+
+    Args:
+        pks: PK объявлений текущей страницы
+
+    Returns:
+        List[dict]: Строки найденных объявлений (удаленные пропускаются)
+    """
+    if not pks:
+        return []
+
+    keys = {pk: get_bb_row_cache_key(pk) for pk in pks}
+    tag_keys = {pk: get_tag_key(f'bb:{pk}') for pk in pks}
+    try:
+        cached = request_cache.get_many([*keys.values(), *tag_keys.values()])
+    except Exception as e:
+        logger.error(f"Cache get_many error for bb rows: {e}")
+        cached = {}
+
+    stamps = {pk: cached.get(tag_keys[pk]) for pk in pks}
+    rows = {
+        pk: cached[key]['row'] for pk, key in keys.items()
+        if key in cached and cached[key]['tag'] == stamps[pk]
+    }
+    missing = [pk for pk in pks if pk not in rows]
+
+    if missing:
+        logger.debug(f"Bb rows MISS: {len(missing)} of {len(pks)}")
+        fresh = {bb.pk: bb_row(bb) for bb in Bb.objects.filter(pk__in=missing).only(*LISTING_FIELDS).order_by()}
+        rows.update(fresh)
+        try:
+            request_cache.set_many(
+                {keys[pk]: {'row': row, 'tag': stamps[pk]} for pk, row in fresh.items()}, BB_ROW_TIMEOUT
+            )
+        except Exception as e:
+            logger.error(f"Cache set_many error for bb rows: {e}")
+
+    return [rows[pk] for pk in pks if pk in rows]
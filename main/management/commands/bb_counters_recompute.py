@@ -0,0 +1,20 @@
+"""
+Management команда для точного пересчета счетчиков комментариев и оценок объявлений
+"""
+from django.core.management.base import BaseCommand
+from main.counters import recompute_bb_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчет Bb.comment_count, rating_sum и rating_count по активным комментариям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки bulk_update')
+
+    def handle(self, *args, **options):
+        self.stdout.write('🧮 Пересчет счетчиков комментариев и оценок...')
+        fixed = recompute_bb_counters(batch_size=options['batch_size'])
+        if fixed:
+            self.stdout.write(self.style.WARNING(f'✓ Исправлено объявлений: {len(fixed)}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✓ Все счетчики верны'))
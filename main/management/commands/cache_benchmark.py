@@ -0,0 +1,138 @@
+"""
+Management команда для выбора сериализатора и сжатия кеша по реальным данным
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from main.models import Bb
+from main.listings import bb_row, bb_detail_record
+from main.facets import compute_facets
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк форматов кеша: размер и время encode/decode на выборке реальных ключей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sample', type=int, default=200, help='Сколько ключей взять из Redis')
+        parser.add_argument('--pattern', default=None, help='Шаблон ключей (по умолчанию все ключи проекта)')
+        parser.add_argument('--iterations', type=int, default=20, help='Повторов encode/decode на значение')
+        parser.add_argument('--min-length', type=int, default=None,
+                            help='Порог сжатия в байтах (по умолчанию CACHE_COMPRESS_MIN_LENGTH)')
+        parser.add_argument('--from-db', action='store_true',
+                            help='Не читать Redis, собрать типичные записи из базы')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('📏 Бенчмарк форматов кеша...'))
+
+        values = [] if options['from_db'] else self._sample_redis(options)
+        if not values:
+            self.stdout.write('📦 Ключей в Redis нет, собираем типичные записи из базы...')
+            values = self._sample_db(options['sample'])
+        if not values:
+            self.stdout.write(self.style.ERROR('❌ Нечего измерять: ни ключей, ни объявлений'))
+            return
+        self.stdout.write(f'  Значений в выборке: {len(values)}\n')
+
+        compressor_options = {}
+        if options['min_length'] is not None:
+            compressor_options['COMPRESS_MIN_LENGTH'] = options['min_length']
+
+        results = []
+        for serializer_name, serializer_path in settings.CACHE_SERIALIZERS.items():
+            for compressor_name, compressor_path in settings.CACHE_COMPRESSORS.items():
+                try:
+                    serializer = import_string(serializer_path)({})
+                    compressor = import_string(compressor_path)(compressor_options)
+                except ImportError as e:
+                    self.stdout.write(f'  ⏭ {serializer_name}+{compressor_name}: не установлен пакет ({e.name})')
+                    continue
+                results.append(self._measure(serializer_name, compressor_name, serializer, compressor,
+                                             values, options['iterations']))
+
+        self._report(results)
+
+    def _sample_redis(self, options):
+        """Значения реальных ключей (строки), декодированные текущими настройками"""
+        try:
+            from django_redis import get_redis_connection
+            client = get_redis_connection('default')
+            pattern = options['pattern'] or f"{settings.CACHES['default']['KEY_PREFIX']}:*"
+            values = []
+            for key in client.scan_iter(match=pattern, count=500):
+                if client.type(key) != b'string':
+                    continue
+                value = cache.client.decode(client.get(key))
+                if isinstance(value, int):
+                    continue  # счетчики хранятся как числа, без сериализации
+                values.append(value)
+                if len(values) >= options['sample']:
+                    break
+            return values
+        except Exception as e:
+            self.stdout.write(f'  ⚠ Redis недоступен: {e}')
+            return []
+
+    def _sample_db(self, sample):
+        """Те же записи, что кладут в кеш списки, страница объявления и фасеты"""
+        bbs = list(Bb.objects.filter(is_active=True).select_related('rubric')[:sample])
+        values = [bb_row(bb) for bb in bbs]
+        values += [bb_detail_record(bb) for bb in bbs[:max(sample // 10, 1)]]
+        if bbs:
+            # Широкий поиск: кешированный список PK с курсорами
+            ids = list(Bb.objects.filter(is_active=True).values_list('pk', flat=True)[:1000])
+            values.append({'ids': ids, 'next': f'1712345678123456-{ids[-1]}', 'prev': None})
+            values.append(compute_facets())
+        return values
+
+    def _measure(self, serializer_name, compressor_name, serializer, compressor, values, iterations):
+        size = 0
+        lossy = 0
+        encode_time = 0.0
+        decode_time = 0.0
+        for value in values:
+            try:
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    encoded = compressor.compress(serializer.dumps(value))
+                encode_time += time.perf_counter() - started
+
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    try:
+                        decoded = serializer.loads(compressor.decompress(encoded))
+                    except Exception:
+                        decoded = serializer.loads(encoded)  # короче порога - не сжато
+                decode_time += time.perf_counter() - started
+            except Exception:
+                lossy += 1
+                continue
+            size += len(encoded)
+            if decoded != value:
+                lossy += 1
+
+        return {
+            'name': f'{serializer_name}+{compressor_name}',
+            'current': (serializer_name, compressor_name) == (settings.CACHE_SERIALIZER, settings.CACHE_COMPRESSOR),
+            'size': size,
+            'encode_us': encode_time / (iterations * len(values)) * 1_000_000,
+            'decode_us': decode_time / (iterations * len(values)) * 1_000_000,
+            'lossy': lossy,
+        }
+
+    def _report(self, results):
+        if not results:
+            return
+        baseline = next((r['size'] for r in results if r['name'] == 'pickle+none'), results[0]['size']) or 1
+        self.stdout.write(f"{'Формат':<18}{'Байт':>12}{'%':>7}{'encode, мкс':>14}{'decode, мкс':>14}{'Неточно':>10}")
+        for r in sorted(results, key=lambda r: r['size']):
+            line = (f"{r['name']:<18}{r['size']:>12}{r['size'] * 100 / baseline:>6.0f}%"
+                    f"{r['encode_us']:>14.1f}{r['decode_us']:>14.1f}{r['lossy']:>10}")
+            if r['current']:
+                line += '  ← текущие настройки'
+            self.stdout.write(line)
+        self.stdout.write('\n"Неточно" - значения, которые формат не смог сохранить или вернул с другим типом')
+        self.stdout.write(self.style.SUCCESS('\n🎉 Бенчмарк завершён!'))
@@ -0,0 +1,121 @@
+"""
+Management команда для просмотра статистики кеша по префиксам ключей
+"""
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from main import cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Статистика кеша по префиксам: hit ratio, время callback, размер значений и занятая память'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Обновлять таблицу каждые N секунд (0 - показать один раз)')
+        parser.add_argument('--min-hit-ratio', type=float, default=0.5,
+                            help='Префиксы с меньшей долей попаданий помечаются как неокупаемые')
+        parser.add_argument('--min-lookups', type=int, default=100,
+                            help='Сколько обращений нужно, чтобы судить о доле попаданий')
+        parser.add_argument('--no-scan', action='store_true',
+                            help='Не считать ключи в Redis (SCAN) - без колонок "Ключей" и "Память"')
+        parser.add_argument('--reset', action='store_true', help='Обнулить статистику и выйти')
+
+    def handle(self, *args, **options):
+        if not cache_stats.uses_redis():
+            self.stdout.write(self.style.ERROR('❌ Общая статистика хранится в Redis, а кеш настроен на другой бэкенд'))
+            return
+
+        if options['reset']:
+            try:
+                cache_stats.reset_stats()
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f'❌ Redis недоступен: {e}'))
+                return
+            self.stdout.write(self.style.SUCCESS('🧹 Статистика кеша обнулена'))
+            return
+
+        self.stdout.write(self.style.SUCCESS('📊 Статистика кеша по префиксам...'))
+        try:
+            while True:
+                self._report(options)
+                if not options['interval']:
+                    break
+                time.sleep(options['interval'])
+                self.stdout.write('')
+        except KeyboardInterrupt:
+            pass
+
+    def _count_keys(self):
+        """Число ключей каждого префикса (SCAN по ключам проекта)"""
+        from django_redis import get_redis_connection
+        client = get_redis_connection('default')
+        # django-redis добавляет к нашему ключу 'bboard:bb_detail:v1:...' свой префикс и версию
+        redis_prefix = cache.make_key('')
+        counts = Counter()
+        for key in client.scan_iter(match=f'{redis_prefix}*', count=1000):
+            key = key.decode()
+            if key.endswith(':lock'):
+                continue
+            counts[cache_stats.key_prefix(key[len(redis_prefix):])] += 1
+        return counts
+
+    @staticmethod
+    def _average_size(row) -> float:
+        """Средний размер значения в байтах по измеренной выборке (sized)"""
+        sized = row.get('sized', row.get('computed', 0))
+        return row.get('bytes', 0) / sized if sized else 0.0
+
+    def _estimated_bytes(self, row) -> float:
+        return self._average_size(row) * row.get('computed', 0)
+
+    def _report(self, options):
+        try:
+            stats = cache_stats.get_shared_stats()
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'❌ Redis недоступен: {e}'))
+            return
+        if not stats:
+            self.stdout.write('  Статистики пока нет: воркеры отправляют ее раз в '
+                              f'{cache_stats.CACHE_STATS_FLUSH_INTERVAL} с')
+            return
+        key_counts = None if options['no_scan'] else self._count_keys()
+
+        self.stdout.write(
+            f"{'Префикс':<20}{'Обращений':>11}{'Hit %':>8}{'Stale':>8}{'Ошибок':>8}"
+            f"{'Callback, мс':>14}{'Размер, КБ':>12}{'Ключей':>9}{'Память, КБ':>12}"
+        )
+        flagged = []
+        for prefix, row in sorted(stats.items(), key=lambda item: -self._estimated_bytes(item[1])):
+            hits = row.get('hits', 0) + row.get('stale', 0)
+            lookups = hits + row.get('misses', 0)
+            computed = row.get('computed', 0)
+            hit_ratio = hits / lookups if lookups else 0.0
+            avg_callback_ms = row.get('callback_us', 0) / computed / 1000 if computed else 0.0
+            avg_size_kb = self._average_size(row) / 1024
+
+            if key_counts is None:
+                keys, memory = '-', '-'
+            else:
+                keys = key_counts.get(prefix, 0)
+                memory = f'{keys * avg_size_kb:.0f}'
+
+            line = (
+                f"{prefix:<20}{lookups:>11}{hit_ratio * 100:>7.0f}%{row.get('stale', 0):>8}"
+                f"{row.get('errors', 0):>8}{avg_callback_ms:>14.1f}{avg_size_kb:>12.1f}{keys:>9}{memory:>12}"
+            )
+            if lookups >= options['min_lookups'] and hit_ratio < options['min_hit_ratio']:
+                flagged.append(prefix)
+                self.stdout.write(self.style.WARNING(line + '  ⚠'))
+            else:
+                self.stdout.write(line)
+
+        self.stdout.write('\n"Память" - оценка: число ключей × средний размер значения')
+        if flagged:
+            self.stdout.write(self.style.WARNING(
+                f"⚠ Hit ratio ниже {options['min_hit_ratio']:.0%}: {', '.join(flagged)} - "
+                'кеш этих ключей, вероятно, не окупает память'
+            ))
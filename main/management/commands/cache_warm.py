@@ -1,33 +1,47 @@
 """
 Management команда для прогрева кеша (cache warming)
 """
+import time
+
 from django.core.management.base import BaseCommand
-from main.models import SubRubric, Bb
-from main.cache_utils import generate_cache_key, get_cached_or_set
+
+from main.warmup import warm_cache
 
 
 class Command(BaseCommand):
-    help = 'Прогрев кеша: предварительное заполнение часто используемых данных'
+    help = 'Прогрев кеша: списки, объявления, API и частые поисковые запросы через обычные view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=3, help='Сколько первых страниц главной и каждой рубрики')
+        parser.add_argument('--top-bbs', type=int, default=100,
+                            help='Сколько объявлений (больше всего комментариев) прогреть')
+        parser.add_argument('--top-queries', type=int, default=50,
+                            help='Сколько частых поисковых запросов из журнала прогреть')
+        parser.add_argument('--workers', type=int, default=4, help='Размер пула потоков')
+        parser.add_argument('--rate', type=float, default=20,
+                            help='Лимит запросов в секунду на весь прогрев (0 - без лимита)')
+        parser.add_argument('--host', default=None,
+                            help='Заголовок Host живого трафика (по умолчанию первый из ALLOWED_HOSTS)')
+        parser.add_argument('--scheme', default='http', choices=('http', 'https'),
+                            help='Схема, с которой Django видит запросы за прокси')
 
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('🔥 Запуск прогрева кеша...'))
-        
-        self.stdout.write('📂 Кеширование рубрик...')
-        cache_key = generate_cache_key('sidebar_rubrics')
-        
-        def fetch_rubrics():
-            return list(SubRubric.objects.select_related('super_rubric').all())
-        
-        rubrics = get_cached_or_set(cache_key, fetch_rubrics, timeout=3600)
-        self.stdout.write(self.style.SUCCESS(f'  ✓ Закешировано рубрик: {len(rubrics)}'))
-        
-        self.stdout.write('🏠 Кеширование главной страницы...')
-        cache_key = generate_cache_key('index_page', '', 1)
-        
-        def fetch_index_bbs():
-            return list(Bb.objects.filter(is_active=True).select_related('rubric')[:5])
-        
-        bbs = get_cached_or_set(cache_key, fetch_index_bbs, timeout=300)
-        self.stdout.write(self.style.SUCCESS(f'  ✓ Закешировано объявлений на главной: {len(bbs)}'))
-        
+        started = time.monotonic()
+
+        stats = warm_cache(
+            pages=options['pages'],
+            top_bbs=options['top_bbs'],
+            top_queries=options['top_queries'],
+            workers=options['workers'],
+            rate=options['rate'],
+            host=options['host'],
+            scheme=options['scheme'],
+            log=self.stdout.write,
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"  ✓ Запросов: {stats['requests']}, ошибок: {stats['errors']}, "
+            f"{time.monotonic() - started:.1f} с"
+        ))
         self.stdout.write(self.style.SUCCESS('\n🎉 Прогрев кеша завершён!'))
@@ -0,0 +1,165 @@
+"""
+Management команда для сравнения настроек SQLite под параллельной нагрузкой
+
+Несколько процессов (как воркеры gunicorn) одновременно читают списки
+объявлений и добавляют комментарии во временную базу:
+  default - rollback journal, каждый запрос в DEFERRED-транзакции (ATOMIC_REQUESTS);
+  tuned   - PRAGMA из settings.SQLITE_PRAGMAS (WAL и др.), чтение в autocommit,
+            запись в BEGIN IMMEDIATE (как main.db и OPTIONS transaction_mode).
+"""
+import multiprocessing
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from main.db import pragma_statements
+
+MODES = ('default', 'tuned')
+
+
+def _connect(path, mode, timeout_ms, pragmas):
+    conn = sqlite3.connect(path, timeout=timeout_ms / 1000, isolation_level=None)
+    if mode == 'tuned':
+        for statement in pragma_statements(pragmas):
+            conn.execute(statement)
+    return conn
+
+
+def _read(conn, mode, rnd, size):
+    if mode == 'default':
+        conn.execute('BEGIN')
+    try:
+        created_at = rnd.randint(1, size)
+        conn.execute(
+            'SELECT id, title, price, comment_count FROM bb WHERE is_active = 1 AND created_at <= ? '
+            'ORDER BY created_at DESC LIMIT 20', (created_at,)
+        ).fetchall()
+        conn.execute('SELECT COUNT(*) FROM bb WHERE is_active = 1').fetchone()
+    finally:
+        if conn.in_transaction:
+            conn.execute('COMMIT')
+
+
+def _write(conn, mode, rnd, size):
+    conn.execute('BEGIN' if mode == 'default' else 'BEGIN IMMEDIATE')
+    try:
+        # Как POST в bb_detail: сначала чтение объявления, потом запись
+        bb_id = rnd.randint(1, size)
+        conn.execute('SELECT id, title FROM bb WHERE id = ?', (bb_id,)).fetchone()
+        conn.execute(
+            'INSERT INTO comment (bb_id, content, rating, created_at) VALUES (?, ?, ?, ?)',
+            (bb_id, 'Комментарий', rnd.randint(0, 5), time.time())
+        )
+        conn.execute('UPDATE bb SET comment_count = comment_count + 1 WHERE id = ?', (bb_id,))
+        conn.execute('COMMIT')
+    except sqlite3.OperationalError:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+
+
+def _worker(path, mode, seconds, write_ratio, timeout_ms, pragmas, size, seed):
+    """Один процесс нагрузки: (чтений, записей, ошибок блокировки, задержки в мс)"""
+    rnd = random.Random(seed)
+    conn = _connect(path, mode, timeout_ms, pragmas)
+    reads = writes = errors = 0
+    latencies = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        is_write = rnd.random() < write_ratio
+        started = time.perf_counter()
+        try:
+            if is_write:
+                _write(conn, mode, rnd, size)
+                writes += 1
+            else:
+                _read(conn, mode, rnd, size)
+                reads += 1
+        except sqlite3.OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+    conn.close()
+    return reads, writes, errors, latencies
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк SQLite: rollback journal и транзакции на каждый запрос против WAL и PRAGMA'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Параллельных процессов')
+        parser.add_argument('--seconds', type=float, default=5.0, help='Длительность каждого режима')
+        parser.add_argument('--write-ratio', type=float, default=0.2, help='Доля запросов на запись')
+        parser.add_argument('--size', type=int, default=20_000, help='Объявлений во временной базе')
+        parser.add_argument('--timeout', type=int, default=None,
+                            help='Ожидание блокировки, мс (по умолчанию busy_timeout из SQLITE_PRAGMAS)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        pragmas = dict(getattr(settings, 'SQLITE_PRAGMAS', {}))
+        timeout_ms = options['timeout'] if options['timeout'] is not None else int(pragmas.get('busy_timeout', 5000))
+        pragmas.pop('busy_timeout', None)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n🏁 {options['workers']} процессов, {options['seconds']:.0f} с на режим, "
+            f"записей {options['write_ratio']:.0%}, ожидание блокировки {timeout_ms} мс"
+        ))
+        for mode in MODES:
+            fd, path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(fd)
+            try:
+                self._populate(path, mode, pragmas, options['size'])
+                args = [
+                    (path, mode, options['seconds'], options['write_ratio'], timeout_ms, pragmas,
+                     options['size'], options['seed'] + worker)
+                    for worker in range(options['workers'])
+                ]
+                with multiprocessing.get_context('spawn').Pool(options['workers']) as pool:
+                    results = pool.starmap(_worker, args)
+                self._report(mode, results, options['seconds'])
+            finally:
+                for suffix in ('', '-wal', '-shm', '-journal'):
+                    if os.path.exists(path + suffix):
+                        os.remove(path + suffix)
+
+    def _populate(self, path, mode, pragmas, size):
+        conn = _connect(path, mode, 5000, pragmas)
+        conn.execute(
+            'CREATE TABLE bb (id INTEGER PRIMARY KEY, title TEXT, price REAL, is_active INTEGER, '
+            'created_at INTEGER, comment_count INTEGER NOT NULL DEFAULT 0)'
+        )
+        conn.execute('CREATE INDEX bb_active_created ON bb (is_active, created_at)')
+        conn.execute(
+            'CREATE TABLE comment (id INTEGER PRIMARY KEY, bb_id INTEGER, content TEXT, '
+            'rating INTEGER, created_at REAL)'
+        )
+        conn.execute('CREATE INDEX comment_bb ON comment (bb_id, created_at)')
+        conn.execute('BEGIN')
+        conn.executemany(
+            'INSERT INTO bb (id, title, price, is_active, created_at) VALUES (?, ?, ?, ?, ?)',
+            ((pk, f'Объявление {pk}', pk % 1000 * 100, int(pk % 10 != 0), pk) for pk in range(1, size + 1))
+        )
+        conn.execute('COMMIT')
+        conn.close()
+
+    def _report(self, mode, results, seconds):
+        reads = sum(r[0] for r in results)
+        writes = sum(r[1] for r in results)
+        errors = sum(r[2] for r in results)
+        latencies = sorted(ms for r in results for ms in r[3])
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+        avg = statistics.mean(latencies) if latencies else 0.0
+        style = self.style.WARNING if errors else self.style.SUCCESS
+        self.stdout.write(
+            f'  {mode:<8} {(reads + writes) / seconds:8.0f} оп/с  '
+            f'чтений={reads} записей={writes}  avg={avg:6.2f} мс  p95={p95:6.2f} мс  '
+            + style(f'ошибок блокировки={errors}')
+        )
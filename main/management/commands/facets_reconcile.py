@@ -0,0 +1,14 @@
+"""
+Management команда для сверки счетчиков фасетов с базой
+"""
+from django.core.management.base import BaseCommand
+from main.facets import reconcile_facets
+
+
+class Command(BaseCommand):
+    help = 'Пересчет счетчиков объявлений по рубрикам и гистограммы цен (исправляет дрейф)'
+
+    def handle(self, *args, **options):
+        self.stdout.write('📊 Пересчет фасетов...')
+        values = reconcile_facets()
+        self.stdout.write(self.style.SUCCESS(f'✓ Обновлено счетчиков: {len(values)}'))
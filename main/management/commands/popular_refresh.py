@@ -0,0 +1,16 @@
+"""
+Management команда для пересчета рейтинга популярных объявлений
+"""
+from django.core.management.base import BaseCommand
+from main.popular import POPULAR_SIZE, refresh_popular_bbs
+
+
+class Command(BaseCommand):
+    help = f'Пересчет рейтинга популярных объявлений (топ-{POPULAR_SIZE} для /api/async/popular/)'
+
+    def handle(self, *args, **options):
+        self.stdout.write('🏆 Пересчет рейтинга популярных...')
+        if refresh_popular_bbs():
+            self.stdout.write(self.style.SUCCESS('✓ Рейтинг обновлен'))
+        else:
+            self.stdout.write(self.style.WARNING('⏭ Пересчет уже идет в другом процессе'))
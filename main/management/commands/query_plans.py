@@ -0,0 +1,70 @@
+"""
+Management команда для проверки планов запросов страниц и подсказки индексов
+"""
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from main.query_plans import analyze_queries, collect_view_queries, plan_urls, seed_plan_data
+
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'KEY_PREFIX': 'query-plans'},
+}
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN QUERY PLAN для запросов страниц: полные проходы, временные сортировки и подсказки индексов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=30, help='Объявлений во временных данных')
+        parser.add_argument('--all', action='store_true', help='Показать и допустимые проблемы (справочники, поиск)')
+        parser.add_argument('--plans', action='store_true', help='Выводить SQL и план каждой проблемы')
+        parser.add_argument('--fail', action='store_true', help='Код ошибки при недопустимых проблемах (для CI)')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Поддерживается только SQLite (EXPLAIN QUERY PLAN)')
+
+        # Данные - во временной базе с теми же миграциями (рабочая не читается и не блокируется),
+        # кеш - в памяти процесса
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(CACHES=LOCMEM_CACHES):
+                self.stdout.write(f"🌱 Временная база: {options['size']} объявлений")
+                data = seed_plan_data(options['size'])
+                queries = collect_view_queries(Client(HTTP_HOST='localhost'), plan_urls(data))
+                findings = analyze_queries(queries)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.stdout.write(f'🔎 Запросов: {len(queries)}, уникальных страниц: {len({label for label, _, _ in queries})}')
+        problems = [finding for finding in findings if not finding['allowed']]
+        for finding in findings if options['all'] else problems:
+            style = self.style.SUCCESS if finding['allowed'] else self.style.WARNING
+            mark = '  ' if finding['allowed'] else '⚠️ '
+            self.stdout.write(style(f"{mark}{finding['label']}: {finding['problem']}"))
+            if finding['suggestion']:
+                self.stdout.write(f"   💡 индекс {finding['suggestion']}")
+            if options['plans']:
+                self.stdout.write(f"   SQL: {finding['sql']}")
+                for line in finding['plan']:
+                    self.stdout.write(f'     {line}')
+
+        suggestions = Counter(finding['suggestion'] for finding in problems if finding['suggestion'])
+        if suggestions:
+            self.stdout.write(self.style.WARNING('\n💡 Предлагаемые индексы:'))
+            for suggestion, count in suggestions.most_common():
+                self.stdout.write(f'  {suggestion}  (запросов: {count})')
+
+        if problems:
+            message = f'Недопустимых проблем в планах: {len(problems)}'
+            if options['fail']:
+                raise CommandError(message)
+            self.stdout.write(self.style.WARNING(f'\n⚠️ {message}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('\n✅ Все запросы страниц идут по индексам'))
@@ -0,0 +1,108 @@
+"""
+Management команда для сравнения поиска icontains и FTS5 на синтетических данных
+"""
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from main.search import document_terms, normalize_keyword, get_morph
+
+VOCABULARY = (
+    'велосипед', 'самокат', 'телефон', 'айфон', 'ноутбук', 'диван', 'шкаф', 'кровать',
+    'холодильник', 'машина', 'колесо', 'шина', 'куртка', 'ботинок', 'платье', 'коляска',
+    'игрушка', 'книга', 'гитара', 'пианино', 'стол', 'стул', 'лампа', 'телевизор',
+    'квартира', 'дом', 'гараж', 'участок', 'собака', 'кошка', 'аквариум', 'палатка',
+    'красный', 'новый', 'старый', 'детский', 'горный', 'кожаный', 'большой', 'удобный',
+)
+
+
+class Command(BaseCommand):
+    help = 'Бенчмарк поиска: LIKE (icontains) против FTS5 с лемматизацией'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100_000, 1_000_000], help='Размеры каталога')
+        parser.add_argument('--queries', type=int, default=20, help='Количество запросов на каждый размер')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        morph = get_morph()
+        forms = {word: sorted({f.word for f in morph.parse(word)[0].lexeme}) for word in VOCABULARY}
+
+        for size in options['sizes']:
+            self.stdout.write(self.style.SUCCESS(f'\n📦 Каталог: {size} объявлений'))
+            fd, path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(fd)
+            try:
+                conn = sqlite3.connect(path)
+                self._populate(conn, rnd, forms, size)
+                queries = [
+                    ' '.join(rnd.choice(forms[rnd.choice(VOCABULARY)]) for _ in range(rnd.randint(1, 2)))
+                    for _ in range(options['queries'])
+                ]
+                self._report('icontains', [self._run_like(conn, q) for q in queries])
+                self._report('fts5', [self._run_fts(conn, q) for q in queries])
+                conn.close()
+            finally:
+                os.remove(path)
+
+    def _populate(self, conn, rnd, forms, size):
+        started = time.perf_counter()
+        conn.execute(
+            'CREATE TABLE bb (id INTEGER PRIMARY KEY, title TEXT, content TEXT, '
+            'is_active INTEGER, created_at REAL)'
+        )
+        conn.execute('CREATE INDEX bb_is_active ON bb (is_active)')
+        conn.execute('CREATE INDEX bb_created_at ON bb (created_at)')
+        conn.execute("CREATE VIRTUAL TABLE bb_search USING fts5(terms, tokenize='unicode61')")
+
+        batch = []
+        for pk in range(1, size + 1):
+            words = [rnd.choice(forms[rnd.choice(VOCABULARY)]) for _ in range(12)]
+            title = ' '.join(words[:3]).capitalize()
+            content = ' '.join(words[3:])
+            batch.append((pk, title, content, int(rnd.random() > 0.1), pk, document_terms(title, content)))
+            if len(batch) >= 10_000:
+                self._flush(conn, batch)
+                batch = []
+        if batch:
+            self._flush(conn, batch)
+        conn.commit()
+        self.stdout.write(f'  Заполнение: {time.perf_counter() - started:.1f} с')
+
+    def _flush(self, conn, batch):
+        conn.executemany('INSERT INTO bb VALUES (?, ?, ?, ?, ?)', [row[:5] for row in batch])
+        conn.executemany('INSERT INTO bb_search (rowid, terms) VALUES (?, ?)', [(row[0], row[5]) for row in batch])
+
+    def _run_like(self, conn, keyword):
+        words = keyword.split()
+        where = ' AND '.join(["(title LIKE ? ESCAPE '\\' OR content LIKE ? ESCAPE '\\')"] * len(words))
+        params = [p for word in words for p in (f'%{word}%', f'%{word}%')]
+        return self._timed(conn, f'SELECT id FROM bb WHERE is_active = 1 AND {where} ORDER BY created_at DESC', params)
+
+    def _run_fts(self, conn, keyword):
+        match = ' '.join(f'"{term}"' for term in normalize_keyword(keyword).split())
+        return self._timed(
+            conn,
+            'SELECT id FROM bb WHERE is_active = 1 AND id IN '
+            '(SELECT rowid FROM bb_search WHERE bb_search MATCH ?) ORDER BY created_at DESC',
+            [match]
+        )
+
+    def _timed(self, conn, sql, params):
+        started = time.perf_counter()
+        found = len(conn.execute(sql, params).fetchall())
+        return (time.perf_counter() - started) * 1000, found
+
+    def _report(self, label, results):
+        timings = sorted(ms for ms, _ in results)
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        found = statistics.mean(count for _, count in results)
+        self.stdout.write(
+            f'  {label:<10} avg={statistics.mean(timings):8.1f} мс  '
+            f'p95={p95:8.1f} мс  найдено в среднем={found:.0f}'
+        )
@@ -0,0 +1,32 @@
+"""
+Management команда для перестроения полнотекстового индекса объявлений
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from main.models import Bb
+from main.search import is_search_index_available, rebuild_index, rebuild_trigrams
+
+
+class Command(BaseCommand):
+    help = 'Полное перестроение поисковых индексов (FTS5 и триграммы заголовков) по всем объявлениям'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пачки вставки')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        if is_search_index_available():
+            self.stdout.write('🔎 Перестроение полнотекстового индекса...')
+            rows = Bb.objects.values_list('pk', 'title', 'content').iterator(chunk_size=batch_size)
+            with transaction.atomic():
+                total = rebuild_index(rows, batch_size=batch_size)
+            self.stdout.write(self.style.SUCCESS(f'✓ Проиндексировано объявлений: {total}'))
+        else:
+            self.stdout.write(self.style.WARNING('Полнотекстовый индекс поддерживается только на SQLite'))
+
+        self.stdout.write('🔤 Перестроение триграмм заголовков...')
+        rows = Bb.objects.values_list('pk', 'title').iterator(chunk_size=batch_size)
+        with transaction.atomic():
+            total = rebuild_trigrams(rows, batch_size=batch_size)
+        self.stdout.write(self.style.SUCCESS(f'✓ Проиндексировано заголовков: {total}'))
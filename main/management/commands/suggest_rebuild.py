@@ -0,0 +1,16 @@
+"""
+Management команда для пересборки индекса подсказок поиска
+"""
+from django.core.management.base import BaseCommand
+from main.suggest import rebuild_suggest_index
+
+
+class Command(BaseCommand):
+    help = 'Пересборка индекса подсказок (/api/async/suggest/) и публикация в Redis'
+
+    def handle(self, *args, **options):
+        self.stdout.write('🔤 Сборка индекса подсказок...')
+        data = rebuild_suggest_index()
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Слов: {len(data['terms'])}, слов в названиях рубрик: {len(data['rubrics'])}"
+        ))
@@ -1,28 +1,64 @@
 import logging
 import zoneinfo
 
+from django.conf import settings
+from django.contrib.sessions.backends.cache import KEY_PREFIX as SESSION_KEY_PREFIX
+from django.urls import Resolver404, resolve
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.contrib.messages import constants as message_constants
 
-from urllib.parse import unquote
+from urllib.parse import unquote, urlencode
 
+from . import request_cache
 from .models import SubRubric
-from .cache_utils import generate_cache_key, get_cached_or_set
+from .cache_utils import (
+    generate_cache_key, get_cached_or_set, get_tag_key, get_tag_modified_key, get_tag_versions, local_cache,
+)
+from .facets import get_rubric_count_key, get_rubric_counts
+from .conditional import page_etag, page_last_modified
+from .page_cache import is_page_cacheable, get_cached_page, page_cache_key, store_page
 
 logger = logging.getLogger(__name__)
 
-def bboard_context_processor(request):
-    """Контекстный процессор для глобальных переменных с кешированием"""
+def get_sidebar() -> dict:
+    """
+    Рубрики для сайдбара (L1 в памяти воркера + Redis)
     
+    Returns:
+        dict: {'rubrics': [{'pk', 'name', 'super_rubric': {'pk', 'name'}}, ...], 'version': версия тега sidebar}
+    """
     cache_key = generate_cache_key('sidebar_rubrics')
     
     def get_rubrics():
-        return SubRubric.objects.select_related('super_rubric').all()
+        """Компактные данные сайдбара; версия тега - ключ фрагмента шаблона"""
+        rubrics = [
+            {
+                'pk': rubric.pk,
+                'name': rubric.name,
+                'super_rubric': {'pk': rubric.super_rubric_id, 'name': rubric.super_rubric.name},
+            }
+            for rubric in SubRubric.objects.select_related('super_rubric')
+        ]
+        return {'rubrics': rubrics, 'version': get_tag_versions(['sidebar']).get('sidebar')}
+    
+    return get_cached_or_set(cache_key, get_rubrics, timeout=3600, tags=['sidebar'], local=True)
+
+def bboard_context_processor(request):
+    """Контекстный процессор для глобальных переменных с кешированием"""
     
-    rubrics = get_cached_or_set(cache_key, get_rubrics, timeout=3600)
+    sidebar = get_sidebar()
+    
+    rubric_counts = get_rubric_counts(rubric['pk'] for rubric in sidebar['rubrics'])
+    rubrics = [
+        {**rubric, 'bb_count': rubric_counts.get(rubric['pk'], 0)} for rubric in sidebar['rubrics']
+    ]
     
     context = {
         'rubrics': rubrics,
+        'rubric_counts_version': '-'.join(str(rubric['bb_count']) for rubric in rubrics),
+        'sidebar_version': sidebar['version'],
         'keyword': '',
         'all': '',
         'MESSAGE_LEVELS': {
@@ -40,16 +76,74 @@ def bboard_context_processor(request):
             context['keyword'] = '?keyword=' + keyword
             context['all'] = context['keyword']
     
-    if 'page' in request.GET:
-        page = request.GET['page']
-        if page != '1':
-            if context['all']:
-                context['all'] += '&page=' + page
-            else:
-                context['all'] = '?page=' + page
+    params = [
+        (name, request.GET[name]) for name in ('min_price', 'max_price', 'sort', 'page', 'after', 'before')
+        if request.GET.get(name) and not (name == 'page' and request.GET[name] == '1')
+    ]
+    if params:
+        query = urlencode(params)
+        context['all'] = context['all'] + '&' + query if context['all'] else '?' + query
     
     return context
 
+class RequestCacheMiddleware:
+    """
+    Пакетное чтение и отложенная запись кеша на время запроса (main.request_cache)
+
+    До view одним get_many читаются сессия, версии тегов страницы,
+    ключи из @prefetch_cache_keys и счетчики рубрик сайдбара; записи
+    GET-запроса уходят в Redis одним pipeline после ответа. Число обращений
+    к Redis за запрос пишется в лог main.request_cache (DEBUG).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        current = request_cache.RequestCache(defer_writes=request.method in ('GET', 'HEAD'))
+        token = request_cache.activate(current)
+        try:
+            try:
+                current.get_many(self.prefetch_keys(request))
+            except Exception as e:
+                logger.error(f"Request cache prefetch error: {e}")
+            response = self.get_response(request)
+            try:
+                current.flush()
+            except Exception as e:
+                logger.error(f"Request cache flush error: {e}")
+        finally:
+            request_cache.deactivate(token)
+        request_cache.logger.debug(f"{request.method} {request.path}: {current.round_trips} cache round trips")
+        return response
+
+    def prefetch_keys(self, request) -> list:
+        """Ключи, которые прочитают сессия, view и контекстный процессор"""
+        keys = []
+        session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if session_key:
+            keys.append(SESSION_KEY_PREFIX + session_key)
+
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return keys
+        view = match.func
+        for attr in ('conditional_page_tags', 'page_cache_tags'):
+            get_tags = getattr(view, attr, None)
+            if get_tags is not None:
+                for tag in get_tags(request, *match.args, **match.kwargs):
+                    keys += [get_tag_key(tag), get_tag_modified_key(tag)]
+        get_keys = getattr(view, 'prefetch_cache_keys', None)
+        if get_keys is not None:
+            keys += get_keys(request, *match.args, **match.kwargs)
+
+        # Сайдбар обычно уже в L1 воркера - тогда известны и ключи его счетчиков
+        sidebar = local_cache.get(generate_cache_key('sidebar_rubrics'))
+        if sidebar is not None:
+            keys += [get_rubric_count_key(rubric['pk']) for rubric in sidebar['rubrics']]
+        return list(dict.fromkeys(keys))
+
 class ImageUploadErrorMiddleware:
     """Middleware для логирования ошибок при загрузке изображений"""
     
@@ -81,4 +175,76 @@ class TimezoneMiddleware:
                 timezone.deactivate()
         else:
             timezone.deactivate()
-        return self.get_response(request)
\ No newline at end of file
+        return self.get_response(request)
+
+class ConditionalPageMiddleware:
+    """
+    ETag/Last-Modified и ответ 304 для view, помеченных @conditional_page
+
+    process_view выполняется до того, как Django оборачивает view в
+    транзакцию ATOMIC_REQUESTS, поэтому ответ 304 не трогает базу.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        etag = getattr(request, '_page_etag', None)
+        if etag and response.status_code in (200, 304):
+            response.headers.setdefault('ETag', quote_etag(etag))
+            last_modified = request._page_last_modified
+            if last_modified:
+                response.headers.setdefault('Last-Modified', http_date(last_modified.timestamp()))
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        get_tags = getattr(view_func, 'conditional_page_tags', None)
+        if get_tags is None:
+            return None
+
+        tags = get_tags(request, *view_args, **view_kwargs)
+        etag = page_etag(request, tags)
+        if etag is None:
+            return None
+        request._page_etag = etag
+        request._page_last_modified = page_last_modified(request, tags)
+
+        last_modified = request._page_last_modified
+        return get_conditional_response(
+            request, etag=quote_etag(etag),
+            last_modified=int(last_modified.timestamp()) if last_modified else None,
+        )
+
+class AnonymousPageCacheMiddleware:
+    """
+    Кеш готовых страниц для анонимов у view, помеченных @anonymous_page_cache
+
+    Как и ConditionalPageMiddleware, отвечает из process_view - до view
+    и до транзакции ATOMIC_REQUESTS.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        page_cache = getattr(request, '_page_cache', None)
+        if page_cache is not None:
+            store_page(request, response, *page_cache)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        get_tags = getattr(view_func, 'page_cache_tags', None)
+        if get_tags is None or not is_page_cacheable(request):
+            return None
+
+        tags = get_tags(request, *view_args, **view_kwargs)
+        request._page_cache_key = page_cache_key(request)
+        response = get_cached_page(request, tags)
+        if response is None:
+            request._page_cache = (tags, view_func.page_cache_timeout)
+        return response
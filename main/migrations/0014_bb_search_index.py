@@ -0,0 +1,55 @@
+import re
+
+from django.db import migrations
+
+# Копия main.search на момент миграции: дальнейшие правки модуля ее не меняют
+SEARCH_TABLE = 'main_bb_search'
+WORD_RE = re.compile(r'\w+')
+
+
+def document_terms(morph, title, content):
+    terms = []
+    for word in WORD_RE.findall(f'{title} {content}'):
+        word = word.lower().replace('ё', 'е')
+        if not word.isdigit():
+            word = morph.parse(word)[0].normal_form.replace('ё', 'е')
+        terms.append(word)
+    return ' '.join(terms)
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+        f"USING fts5(terms, tokenize='unicode61')"
+    )
+
+    import pymorphy3
+    morph = pymorphy3.MorphAnalyzer(lang='ru')
+
+    Bb = apps.get_model('main', 'Bb')
+    rows = [
+        (pk, document_terms(morph, title, content))
+        for pk, title, content in Bb.objects.values_list('pk', 'title', 'content').iterator()
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, terms) VALUES (%s, %s)', rows)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_alter_bb_price'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
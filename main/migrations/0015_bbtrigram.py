@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:50
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Копия main.search.text_trigrams на момент миграции
+WORD_RE = re.compile(r'\w+')
+
+
+def text_trigrams(text):
+    trigrams = set()
+    for word in WORD_RE.findall(text or ''):
+        padded = f"  {word.lower().replace('ё', 'е')} "
+        trigrams |= {padded[i:i + 3] for i in range(len(padded) - 2)}
+    return trigrams
+
+
+def populate_trigrams(apps, schema_editor):
+    Bb = apps.get_model('main', 'Bb')
+    BbTrigram = apps.get_model('main', 'BbTrigram')
+    for pk, title in Bb.objects.values_list('pk', 'title').iterator():
+        BbTrigram.objects.bulk_create(BbTrigram(bb_id=pk, trigram=trigram) for trigram in text_trigrams(title))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_bb_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BbTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('bb', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='main.bb')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trigram', 'bb'], name='main_bbtrigram_lookup')],
+            },
+        ),
+        migrations.RunPython(populate_trigrams, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_bbtrigram'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bb',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at'], name='main_bb_active_created'),
+        ),
+        migrations.AddIndex(
+            model_name='bb',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['price'], name='main_bb_active_price'),
+        ),
+        migrations.AddIndex(
+            model_name='bb',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['rubric', 'created_at'], name='main_bb_active_rubric_created'),
+        ),
+        migrations.AddIndex(
+            model_name='bb',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['rubric', 'price'], name='main_bb_active_rubric_price'),
+        ),
+    ]
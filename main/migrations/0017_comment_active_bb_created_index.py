@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_bb_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['bb', 'created_at'], name='main_comment_active_bb_created'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:29
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def fill_counters(apps, schema_editor):
+    Bb = apps.get_model('main', 'Bb')
+    Comment = apps.get_model('main', 'Comment')
+    rows = (
+        Comment.objects.filter(is_active=True)
+        .values('bb_id')
+        .annotate(
+            comments=Count('id'),
+            rating_sum=Sum('rating', filter=Q(rating__gt=0), default=0),
+            rating_count=Count('id', filter=Q(rating__gt=0)),
+        )
+        .order_by()
+    )
+    for row in rows:
+        Bb.objects.filter(pk=row['bb_id']).update(
+            comment_count=row['comments'], rating_sum=row['rating_sum'], rating_count=row['rating_count'],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0017_comment_active_bb_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bb',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.AddField(
+            model_name='bb',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число оценок'),
+        ),
+        migrations.AddField(
+            model_name='bb',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
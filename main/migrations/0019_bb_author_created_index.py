@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-18 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0018_bb_comment_rating_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bb',
+            index=models.Index(fields=['author', 'created_at'], name='main_bb_author_created'),
+        ),
+    ]
@@ -41,7 +41,8 @@ class SuperRubric(Rubric):
 
 class SubRubricManager(models.Manager):
    def get_queryset(self):
-      return super().get_queryset().filter(super_rubric__isnull=False)
+      # __str__ выводит название надрубрики - без JOIN это запрос на каждую подрубрику в списке
+      return super().get_queryset().filter(super_rubric__isnull=False).select_related('super_rubric')
 
 class SubRubric(Rubric):
    objects = SubRubricManager()
@@ -65,6 +66,22 @@ class Bb(models.Model):
    author = models.ForeignKey(AdvUser, on_delete=models.CASCADE, verbose_name='Автор объявления')
    is_active = models.BooleanField(default=True, db_index=True, verbose_name='Выводить в списке?')
    created_at = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Опубликовано')
+   # Счетчики активных комментариев и ненулевых оценок (main.counters)
+   comment_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев')
+   rating_sum = models.PositiveIntegerField(default=0, editable=False, verbose_name='Сумма оценок')
+   rating_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Число оценок')
+   
+   COUNTER_FIELDS = ('comment_count', 'rating_sum', 'rating_count')
+   
+   def save(self, *args, **kwargs):
+      # Счетчики меняются только F-выражениями: обычное сохранение
+      # не должно затирать их значениями, прочитанными раньше
+      if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+         kwargs['update_fields'] = [
+            field.name for field in self._meta.concrete_fields
+            if not field.primary_key and field.name not in self.COUNTER_FIELDS
+         ]
+      super().save(*args, **kwargs)
    
    def delete(self, *args, **kwargs):
       for ai in self.additionalimage_set.all():
@@ -75,6 +92,23 @@ class Bb(models.Model):
       verbose_name_plural = 'Объявления'
       verbose_name = 'Объявление'
       ordering = ['-created_at']
+      # Частичные индексы: Django пишет фильтр is_active=True как WHERE "is_active",
+      # поэтому составной индекс с is_active в начале SQLite для поиска не использует
+      indexes = [
+         models.Index(fields=['created_at'], condition=models.Q(is_active=True), name='main_bb_active_created'),
+         models.Index(fields=['price'], condition=models.Q(is_active=True), name='main_bb_active_price'),
+         models.Index(fields=['rubric', 'created_at'], condition=models.Q(is_active=True), name='main_bb_active_rubric_created'),
+         models.Index(fields=['rubric', 'price'], condition=models.Q(is_active=True), name='main_bb_active_rubric_price'),
+         # "Мои объявления": все объявления автора, включая скрытые, новые первыми
+         models.Index(fields=['author', 'created_at'], name='main_bb_author_created'),
+      ]
+
+class BbTrigram(models.Model):
+   bb = models.ForeignKey(Bb, on_delete=models.CASCADE, related_name='trigrams')
+   trigram = models.CharField(max_length=3)
+
+   class Meta:
+      indexes = [models.Index(fields=['trigram', 'bb'], name='main_bbtrigram_lookup')]
 
 class AdditionalImage(models.Model):
    bb = models.ForeignKey(Bb, on_delete=models.CASCADE)
@@ -91,4 +125,7 @@ class Comment(models.Model):
    class Meta:
       verbose_name_plural = 'Комментарии'
       verbose_name = 'Комментарий'
-      ordering = ['-created_at'] 
\ No newline at end of file
+      ordering = ['-created_at']
+      indexes = [
+         models.Index(fields=['bb', 'created_at'], condition=models.Q(is_active=True), name='main_comment_active_bb_created'),
+      ] 
\ No newline at end of file
@@ -0,0 +1,173 @@
+"""
+Кеш готовых страниц для анонимных посетителей
+
+В Redis хранится отрисованный HTML и заголовки ответа, помеченные версиями
+тегов страницы ('index', 'rubric:3', 'bb:5', 'sidebar'). Их меняют те же
+сигналы, что сбрасывают кеш данных, поэтому отдельной инвалидации нет.
+Попадание отдает AnonymousPageCacheMiddleware.process_view до вызова view
+и до транзакции ATOMIC_REQUESTS - без запросов к базе и без шаблонов.
+
+Персонального в странице у анонима только CSRF-токен: при сохранении он
+заменяется меткой, при выдаче - свежим токеном посетителя. CAPTCHA формы
+комментария bb_detail.js обновляет, когда посетитель начинает ее заполнять.
+Счетчики объявлений в сайдбаре могут отставать на PAGE_CACHE_TIMEOUT секунд.
+"""
+import re
+import time
+from typing import Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import cc_delim_re
+
+from . import cache_stats
+from . import request_cache
+from .cache_utils import _count, generate_cache_key
+from .conditional import _page_stamps
+
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+
+# Параметры запроса, от которых зависят страницы; с любыми другими страница не кешируется
+PAGE_CACHE_PARAMS = ('keyword', 'sort', 'min_price', 'max_price', 'page', 'after', 'before')
+
+CSRF_PLACEHOLDER = '@@page-cache-csrf@@'
+CSRF_INPUT_RE = re.compile(r'(name="csrfmiddlewaretoken" value=")[A-Za-z0-9]+(")')
+
+
+def _has_only_known_params(request) -> bool:
+    """
+    Только параметры из PAGE_CACHE_PARAMS, каждый не больше одного раза
+
+    Иначе любой ?utm_source=... или ?_=<время> заводил бы в Redis свою
+    копию страницы.
+    """
+    return all(
+        name in PAGE_CACHE_PARAMS and len(values) == 1
+        for name, values in request.GET.lists()
+    )
+
+
+def is_page_cacheable(request) -> bool:
+    """
+    Запрос анонима без непоказанных сообщений и без посторонних параметров
+
+    Проверяется сессия, а не request.user, чтобы не обращаться к базе.
+    """
+    return (
+        request.method in ('GET', 'HEAD')
+        and _has_only_known_params(request)
+        and SESSION_KEY not in request.session
+        and not request.session.get('_messages')
+    )
+
+
+def page_cache_key(request) -> str:
+    """
+    Ключ страницы: путь, непустые параметры из PAGE_CACHE_PARAMS и часовой пояс из сессии
+
+    Хост, схема и порядок параметров в ключ не входят.
+    """
+    params = {name: request.GET[name] for name in PAGE_CACHE_PARAMS if request.GET.get(name)}
+    return generate_cache_key('page', request.path, request.session.get('django_timezone', ''), **params)
+
+
+def _vary_headers(response) -> List[str]:
+    """
+    Заголовки Vary ответа view, кроме Cookie
+
+    Cookie не учитывается: все, что у анонима зависит от cookies (часовой
+    пояс, CSRF-токен), уже входит в ключ или подставляется при выдаче.
+    """
+    if not response.has_header('Vary'):
+        return []
+    return [header for header in cc_delim_re.split(response['Vary']) if header.lower() != 'cookie']
+
+
+def _request_headers(request, names: List[str]) -> Dict[str, str]:
+    return {name: request.headers.get(name, '') for name in names}
+
+
+def _is_cacheable_response(request, response) -> bool:
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    if 'private' in response.get('Cache-Control', '') or 'no-store' in response.get('Cache-Control', ''):
+        return False
+    if '*' in _vary_headers(response):
+        return False
+    storage = getattr(request, '_messages', None)
+    return not (storage is not None and storage.added_new)
+
+
+def get_cached_page(request, tags: List[str]) -> Optional[HttpResponse]:
+    """
+    Готовый ответ из кеша или None
+
+    Запись подходит, если она помечена текущими версиями тегов и совпадают
+    значения заголовков из Vary.
+    """
+    entry = request_cache.get(request._page_cache_key)
+    versions, _ = _page_stamps(request, tags)
+    if (
+        entry is None
+        or entry['tags'] != versions
+        or _request_headers(request, list(entry['vary'])) != entry['vary']
+    ):
+        _count('page', 'misses', request._page_cache_key)
+        request._page_cache_started = time.time()
+        return None
+
+    _count('page', 'hits', request._page_cache_key)
+    content = entry['content']
+    if CSRF_PLACEHOLDER in content:
+        content = content.replace(CSRF_PLACEHOLDER, get_token(request))
+    return HttpResponse(content, status=entry['status'], headers=entry['headers'])
+
+
+def store_page(request, response, tags: List[str], timeout: int):
+    """Сохранить ответ view, если в нем нет персональных данных"""
+    if request.method != 'GET' or not _is_cacheable_response(request, response):
+        return
+    versions, _ = _page_stamps(request, tags)
+    if len(versions) < len(tags):
+        return
+
+    content = response.content.decode(response.charset)
+    content = CSRF_INPUT_RE.sub(rf'\g<1>{CSRF_PLACEHOLDER}\g<2>', content)
+    entry = {
+        'content': content,
+        'status': response.status_code,
+        'headers': {name: value for name, value in response.items() if name.lower() != 'vary'},
+        'vary': _request_headers(request, _vary_headers(response)),
+        'tags': versions,
+    }
+    cache_stats.record(
+        request._page_cache_key, computed=1, **cache_stats.size_metrics(entry),
+        callback_us=int((time.time() - request._page_cache_started) * 1_000_000),
+    )
+    request_cache.set(request._page_cache_key, entry, timeout)
+
+
+def anonymous_page_cache(get_tags: Callable[..., List[str]], timeout: int = PAGE_CACHE_TIMEOUT):
+    """
+    Кешировать страницу целиком для анонимных посетителей
+
+    Выдачу из кеша и сохранение выполняет AnonymousPageCacheMiddleware.
+    Не сохраняются ответы, которые ставят cookies, добавляют сообщения
+    (messages) или помечены Cache-Control: private / no-store.
+
+    Args:
+        get_tags: Функция (request, *args, **kwargs view) -> список тегов страницы
+        timeout: Время жизни записи в секундах
+
+    Usage:
+        @anonymous_page_cache(lambda request, pk: [f'rubric:{pk}', 'sidebar'])
+        def rubric_bbs(request, pk):
+            ...
+    """
+    def decorator(view_func):
+        view_func.page_cache_tags = get_tags
+        view_func.page_cache_timeout = timeout
+        return view_func
+    return decorator
@@ -0,0 +1,195 @@
+"""
+Keyset (cursor) пагинация списков объявлений по (поле сортировки, pk)
+
+Страница выбирается условием по индексу поля сортировки (created_at или price)
+и читается одним запросом на page_size + 1 строк, поэтому глубокие страницы
+стоят столько же, сколько первая. Старые ссылки вида ?page=N поддерживаются
+через совместимый режим.
+"""
+import datetime
+from typing import Any, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+ONE_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def encode_cursor(value, pk: int) -> str:
+    """
+    Курсор строки: значение поля сортировки и pk
+
+    Даты кодируются микросекундами от эпохи ("1712345678123456-42"),
+    цены - как есть ("1500.0-42").
+    """
+    if isinstance(value, datetime.datetime):
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, datetime.timezone.utc)
+        return f'{(value - EPOCH) // ONE_MICROSECOND}-{pk}'
+    return f'{float(value)!r}-{pk}'
+
+
+def decode_cursor(token: Optional[str], field: str = 'created_at') -> Optional[Tuple[Any, int]]:
+    """
+    Разобрать курсор из GET-параметра
+
+    Args:
+        token: Значение ?after= / ?before=
+        field: Поле сортировки, для которого выдан курсор
+
+    Returns:
+        Optional[Tuple]: (значение поля, pk) или None, если курсор пустой или испорчен
+    """
+    if not token:
+        return None
+    try:
+        value, pk = token.rsplit('-', 1)
+        if field == 'created_at':
+            return EPOCH + datetime.timedelta(microseconds=int(value)), int(pk)
+        return float(value), int(pk)
+    except (ValueError, OverflowError):
+        return None
+
+
+def _seek(queryset: QuerySet, field: str, value, pk: int, descending: bool) -> QuerySet:
+    """Строки строго после (value, pk) в порядке (field, pk) по убыванию или возрастанию"""
+    if descending:
+        return queryset.filter(Q(**{f'{field}__lte': value}) & ~Q(**{field: value, 'pk__gte': pk}))
+    return queryset.filter(Q(**{f'{field}__gte': value}) & ~Q(**{field: value, 'pk__lte': pk}))
+
+
+def parse_page_number(value) -> int:
+    """Номер страницы из GET-параметра page (некорректные значения -> 1)"""
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return 1
+
+
+def keyset_page(queryset: QuerySet, page_size: int, after: Optional[str] = None,
+                before: Optional[str] = None, ordering: str = '-created_at') -> dict:
+    """
+    Прочитать одну страницу PK в порядке (ordering, pk)
+
+    Args:
+        queryset: Отфильтрованный QuerySet модели Bb
+        page_size: Размер страницы
+        after: Курсор последней строки предыдущей страницы (листаем вперед)
+        before: Курсор первой строки следующей страницы (листаем назад)
+        ordering: Поле сортировки ('-created_at', 'price', '-price'); значения не NULL
+
+    Returns:
+        dict: {'ids': [...], 'next': курсор или None, 'prev': курсор или None}
+    """
+    field = ordering.lstrip('-')
+    descending = ordering.startswith('-')
+    forward_order = (ordering, '-pk' if descending else 'pk')
+    backward_order = (field if descending else f'-{field}', 'pk' if descending else '-pk')
+
+    before_key = decode_cursor(before, field)
+    after_key = decode_cursor(after, field) if before_key is None else None
+
+    if before_key is not None:
+        rows = list(
+            _seek(queryset, field, *before_key, descending=not descending)
+            .order_by(*backward_order)
+            .values_list('pk', field)[:page_size + 1]
+        )
+        if len(rows) <= page_size:
+            return keyset_page(queryset, page_size, ordering=ordering)
+        rows = rows[:page_size][::-1]
+        return {
+            'ids': [row[0] for row in rows],
+            'next': encode_cursor(rows[-1][1], rows[-1][0]),
+            'prev': encode_cursor(rows[0][1], rows[0][0]),
+        }
+
+    if after_key is not None:
+        queryset = _seek(queryset, field, *after_key, descending=descending)
+
+    rows = list(queryset.order_by(*forward_order).values_list('pk', field)[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    return {
+        'ids': [row[0] for row in rows],
+        'next': encode_cursor(rows[-1][1], rows[-1][0]) if rows and has_more else None,
+        'prev': encode_cursor(rows[0][1], rows[0][0]) if rows and after_key is not None else None,
+    }
+
+
+def legacy_page_cursor(queryset: QuerySet, page_number: int, page_size: int,
+                       ordering: str = '-created_at') -> Optional[str]:
+    """
+    Совместимость со ссылками ?page=N: курсор последней строки страницы N-1
+
+    Читается одна строка по индексу поля сортировки; сами страницы дальше
+    листаются курсорами.
+
+    Returns:
+        Optional[str]: Курсор или None, если такой страницы нет
+    """
+    field = ordering.lstrip('-')
+    order = (ordering, '-pk' if ordering.startswith('-') else 'pk')
+    offset = (page_number - 1) * page_size - 1
+    rows = list(queryset.order_by(*order).values_list(field, 'pk')[offset:offset + 1])
+    return encode_cursor(*rows[0]) if rows else None
+
+
+class KeysetPage:
+    """Страница списка для шаблона includes/_keyset_pagination.html"""
+
+    def __init__(self, object_list: List, number: int, next_params: Optional[dict],
+                 previous_params: Optional[dict], base_params: Optional[dict] = None):
+        """
+        Args:
+            object_list: Объекты текущей страницы
+            number: Номер страницы (для отображения)
+            next_params: GET-параметры ссылки на следующую страницу или None
+            previous_params: GET-параметры ссылки на предыдущую страницу или None
+            base_params: Параметры, общие для всех ссылок (например, keyword)
+        """
+        self.object_list = object_list
+        self.number = number
+        self.has_next = next_params is not None
+        self.has_previous = previous_params is not None
+        self._base_params = {key: value for key, value in (base_params or {}).items() if value}
+        self.next_link = self._link(next_params)
+        self.previous_link = self._link(previous_params)
+
+    def _link(self, params: Optional[dict]) -> str:
+        if params is None:
+            return ''
+        query = {**self._base_params, **params}
+        query = {key: value for key, value in query.items() if value and not (key == 'page' and value == 1)}
+        return '?' + urlencode(query) if query else '?'
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def build_page(data: dict, object_list: List, number: int, base_params: Optional[dict] = None) -> KeysetPage:
+    """
+    Собрать KeysetPage из закешированного результата keyset_page()/fuzzy-поиска
+
+    Args:
+        data: {'ids', 'next', 'prev'} или {'ids', 'next_page', 'prev_page'} для постраничного режима
+        object_list: Объекты текущей страницы в нужном порядке
+        number: Номер текущей страницы
+        base_params: Общие GET-параметры ссылок
+    """
+    if 'next_page' in data:
+        next_params = {'page': data['next_page']} if data['next_page'] else None
+        previous_params = {'page': data['prev_page']} if data['prev_page'] else None
+    else:
+        next_params = {'after': data['next'], 'page': number + 1} if data['next'] else None
+        if data['prev']:
+            previous_params = {'before': data['prev'], 'page': max(number - 1, 1)}
+        else:
+            number = 1
+            previous_params = None
+    return KeysetPage(object_list, number, next_params, previous_params, base_params)
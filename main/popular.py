@@ -0,0 +1,75 @@
+"""
+Рейтинг популярных объявлений для /api/async/popular/
+
+Один список из POPULAR_SIZE лучших активных объявлений: больше всего
+комментариев за последние POPULAR_WINDOW_DAYS дней, затем средняя оценка
+в них, затем новизна. Любой ?limit= - срез этого списка, поэтому запрос
+к API не трогает базу и не плодит ключи. Список живет в Redis и в памяти
+воркеров (L1); пересчитывается по мягкому TTL, командой popular_refresh
+по расписанию и в фоне после изменений объявлений и комментариев.
+"""
+import datetime
+import logging
+from typing import Dict, List
+
+from django.conf import settings
+from django.db.models import Avg, Count, F, Q
+from django.utils import timezone
+
+from .cache_utils import generate_cache_key, get_cached_or_set, refresh_cache
+from .models import Bb
+
+logger = logging.getLogger(__name__)
+
+POPULAR_SIZE = getattr(settings, 'POPULAR_BBS_SIZE', 500)
+POPULAR_WINDOW_DAYS = 30
+POPULAR_TIMEOUT = 3600
+POPULAR_SOFT_TIMEOUT = 600
+# Изменения за эти секунды попадают в один фоновый пересчет
+POPULAR_REFRESH_DELAY = 10
+
+POPULAR_FIELDS = ('id', 'title', 'content', 'price', 'created_at', 'rubric__name', 'author__username')
+
+
+def get_popular_cache_key() -> str:
+    return generate_cache_key('popular_bbs', POPULAR_SIZE)
+
+
+def compute_popular_bbs() -> List[Dict]:
+    """Рейтинг одним GROUP BY по активным объявлениям и их свежим комментариям"""
+    since = timezone.now() - datetime.timedelta(days=POPULAR_WINDOW_DAYS)
+    recent = Q(comment__is_active=True, comment__created_at__gte=since)
+    bbs = list(
+        Bb.objects.filter(is_active=True)
+        .annotate(
+            recent_comments=Count('comment', filter=recent),
+            recent_rating=Avg('comment__rating', filter=recent),
+        )
+        .order_by('-recent_comments', F('recent_rating').desc(nulls_last=True), '-created_at', '-pk')
+        .values(*POPULAR_FIELDS)[:POPULAR_SIZE]
+    )
+    logger.info(f"Popular bbs computed: {len(bbs)}")
+    return bbs
+
+
+def get_popular_bbs(limit: int, offset: int = 0) -> List[Dict]:
+    """Срез рейтинга; limit и offset должны быть уже ограничены вызывающим"""
+    bbs = get_cached_or_set(
+        get_popular_cache_key(), compute_popular_bbs,
+        timeout=POPULAR_TIMEOUT, soft_timeout=POPULAR_SOFT_TIMEOUT, local=True
+    )
+    return bbs[offset:offset + limit]
+
+
+def refresh_popular_bbs(background: bool = False) -> bool:
+    """
+    Пересчитать рейтинг сейчас или в фоне через POPULAR_REFRESH_DELAY секунд
+
+    Returns:
+        bool: False, если пересчет уже идет в другом процессе
+    """
+    return refresh_cache(
+        get_popular_cache_key(), compute_popular_bbs,
+        timeout=POPULAR_TIMEOUT, soft_timeout=POPULAR_SOFT_TIMEOUT,
+        background=background, delay=POPULAR_REFRESH_DELAY if background else 0.0,
+    )
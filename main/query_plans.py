@@ -0,0 +1,235 @@
+"""
+Планы запросов страниц и подсказки индексов (SQLite EXPLAIN QUERY PLAN)
+
+collect_view_queries() проходит по страницам main.views, main.api_views и
+api.views с пустым кешем и запоминает каждый SQL-запрос ORM.
+analyze_queries() выполняет для них EXPLAIN QUERY PLAN и находит полные
+проходы по таблицам main и сортировки во временном B-дереве, а
+suggest_index() предлагает составной индекс: сначала столбцы сравнений на
+равенство, затем столбец диапазона или сортировки. Те же проверки - в
+QueryPlanTests и в команде query_plans.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+from django.apps import apps
+from django.db import connection
+
+# Справочники, которые читаются и сортируются целиком намеренно (сайдбар, списки рубрик)
+ALLOWED_TABLES = ('main_rubric',)
+
+# (URL-имя или '*', фрагмент SQL): временные сортировки, которые индекс не уберет
+ALLOWED_TEMP_SORTS = (
+    # "Новые" с диапазоном цен: индекс цены дает диапазон, сортируются только попавшие строки
+    ('main:index', '"main_bb"."price" >='),
+    ('main:index', '"main_bb"."price" <='),
+    ('main:rubric_bbs', '"main_bb"."price" >='),
+    ('main:rubric_bbs', '"main_bb"."price" <='),
+    # Гистограмма цен: группировка по интервалам CASE (считается раз и кешируется)
+    ('*', 'CASE WHEN "main_bb"."price"'),
+    # Поиск: сортируются только найденные строки
+    ('*', 'main_bb_search MATCH'),
+    ('*', 'FROM "main_bbtrigram"'),
+    # Пересчет рейтинга популярных: порядок по агрегатам комментариев
+    ('*', 'ORDER BY COUNT("main_comment"."id")'),
+)
+
+_SCAN = re.compile(r'^SCAN (?P<table>\w+)(?P<rest>.*)$')
+_TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (?P<what>ORDER BY|GROUP BY|DISTINCT|RIGHT PART OF ORDER BY|LAST TERM OF ORDER BY)')
+
+
+class QueryCollector:
+    """execute_wrapper, запоминающий SQL и параметры выполненных запросов"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def explain(sql, params) -> List[str]:
+    """Строки EXPLAIN QUERY PLAN (последний столбец - описание шага)"""
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def _aliases(sql: str) -> Dict[str, str]:
+    """{имя или псевдоним в запросе: таблица}: '"main_bb" U0' -> {'U0': 'main_bb', 'main_bb': 'main_bb'}"""
+    aliases = {}
+    for table, alias in re.findall(r'(?:FROM|JOIN) "(\w+)"(?: (?:AS )?(\w+))?', sql):
+        aliases[table] = table
+        if alias and alias not in ('ON', 'WHERE', 'INNER', 'LEFT', 'ORDER', 'GROUP', 'LIMIT'):
+            aliases[alias] = table
+    return aliases
+
+
+def _model_fields(table: str) -> Tuple[Optional[str], Dict[str, str]]:
+    """(имя модели, {столбец: поле}) для таблицы приложения"""
+    for model in apps.get_models():
+        if model._meta.db_table == table and not model._meta.proxy:
+            return model.__name__, {field.column: field.name for field in model._meta.concrete_fields}
+    return None, {}
+
+
+def suggest_index(sql: str, table: str) -> Optional[str]:
+    """
+    Составной индекс для таблицы запроса: равенства, затем диапазон или сортировка
+
+    Returns:
+        str: 'Comment(bb, created_at) WHERE is_active' или None, если подсказать нечего
+    """
+    refs = [name for name, target in _aliases(sql).items() if target == table]
+    if not refs:
+        return None
+    ref = '(?:' + '|'.join(f'"{name}"' if name == table else re.escape(name) for name in refs) + ')'
+    where, _, order = sql.partition(' ORDER BY ')
+    where = where.split(' WHERE ', 1)[1] if ' WHERE ' in where else ''
+
+    flags = re.findall(ref + r'\."(\w+)"(?= AND|\)|$)', where)
+    equal = re.findall(ref + r'\."(\w+)" (?:= |IN \()', where)
+    ranges = re.findall(ref + r'\."(\w+)" (?:[<>]=?) ', where)
+    ordering = re.findall(ref + r'\."(\w+)"', order.split(' LIMIT ')[0])
+    columns = list(dict.fromkeys(equal + (ranges[:1] or ordering)))
+    if not columns:
+        return None
+
+    model_name, fields = _model_fields(table)
+    if model_name is None:
+        return None
+    # Булев фильтр (WHERE "is_active") SQLite берет из условия частичного индекса, а не из столбцов
+    condition = f" WHERE {' AND '.join(fields.get(column, column) for column in dict.fromkeys(flags))}" if flags else ''
+    return f"{model_name}({', '.join(fields.get(column, column) for column in columns)}){condition}"
+
+
+def plan_problems(plan: List[str]) -> List[Tuple[str, str]]:
+    """[(таблица, описание)] полных проходов по таблицам main и временных сортировок"""
+    problems = []
+    for line in plan:
+        scan = _SCAN.match(line)
+        if scan and ' USING ' not in scan['rest'] and 'VIRTUAL TABLE' not in scan['rest']:
+            problems.append((scan['table'], f'полный проход: {line}'))
+        sort = _TEMP_SORT.search(line)
+        if sort:
+            problems.append(('', f'временное B-дерево: {sort["what"]}'))
+    return problems
+
+
+def _is_allowed(label: str, sql: str, table: str, problem: str) -> bool:
+    if table in ALLOWED_TABLES or not table.startswith('main_'):
+        return True
+    if problem.startswith('полный проход'):
+        return False
+    return any(allowed in ('*', label) and fragment in sql for allowed, fragment in ALLOWED_TEMP_SORTS)
+
+
+def analyze_queries(queries: List[Tuple[str, str, tuple]]) -> List[Dict]:
+    """
+    Проблемы в планах собранных запросов
+
+    Args:
+        queries: [(метка страницы, sql, params), ...] из collect_view_queries()
+
+    Returns:
+        List[dict]: [{'label', 'sql', 'plan', 'problem', 'suggestion', 'allowed'}, ...]
+                    по одной записи на проблему уникального запроса
+    """
+    findings = []
+    seen = set()
+    for label, sql, params in queries:
+        if not sql.lstrip().upper().startswith('SELECT') or (label, sql) in seen:
+            continue
+        seen.add((label, sql))
+        plan = explain(sql, params)
+        aliases = _aliases(sql)
+        for alias, problem in plan_problems(plan):
+            table = aliases.get(alias, alias) if alias else next(iter(aliases.values()), '')
+            findings.append({
+                'label': label,
+                'sql': sql,
+                'plan': plan,
+                'problem': problem,
+                'suggestion': suggest_index(sql, table),
+                'allowed': _is_allowed(label, sql, table, problem),
+            })
+    return findings
+
+
+def seed_plan_data(size: int = 30) -> Dict:
+    """
+    Минимальный набор данных для обхода страниц: рубрики, авторы, объявления и комментарии
+
+    Планы SQLite без ANALYZE не зависят от числа строк, поэтому хватает
+    нескольких десятков объявлений.
+    """
+    from .models import AdvUser, Bb, Comment, SubRubric, SuperRubric
+
+    author = AdvUser.objects.create_user(username='plan-author', password='-', is_activated=True)
+    super_rubric = SuperRubric.objects.create(name='Транспорт')
+    rubrics = [SubRubric.objects.create(name=f'Рубрика {i}', super_rubric=super_rubric) for i in range(3)]
+    Bb.objects.bulk_create(
+        Bb(rubric=rubrics[i % 3], title=f'Велосипед {i}', content='Горный', contacts='-',
+           author=author, price=i * 100 if i % 5 else None, is_active=bool(i % 7))
+        for i in range(size)
+    )
+    bb = Bb.objects.filter(is_active=True).order_by('-created_at', '-pk').first()
+    for i in range(25):
+        Comment.objects.create(bb=bb, author=f'гость {i}', content='Отличный', rating=i % 6)
+    return {'author': author, 'rubric': rubrics[0], 'bb': bb}
+
+
+def plan_urls(data: Dict) -> List[Tuple[str, Optional[object]]]:
+    """[(URL, пользователь или None)] страниц main.views, main.api_views и api.views"""
+    bb, rubric, author = data['bb'], data['rubric'], data['author']
+    listing = ['', '?sort=cheap', '?sort=expensive', '?min_price=100', '?min_price=100&max_price=1500',
+               '?keyword=велосипед', '?keyword=велосипед&sort=cheap']
+    urls = [('/' + query, None) for query in listing]
+    urls += [(f'/rubric_{rubric.pk}/' + query, None) for query in listing]
+    urls += [
+        (f'/rubric_{bb.rubric_id}/bb_{bb.pk}/', None),
+        ('/api/async/rubrics/', None), ('/api/async/popular/', None), (f'/api/async/bb/{bb.pk}/', None),
+        ('/api/bbs/', None), (f'/api/bbs/{bb.pk}/', None), (f'/api/bbs/{bb.pk}/comments/', None),
+        ('/accounts/profile/', author), ('/accounts/profile/bbs/', author),
+        (f'/accounts/profile/edit/{bb.pk}/', author),
+    ]
+    return urls
+
+
+def collect_view_queries(client, urls: List[Tuple[str, Optional[object]]]) -> List[Tuple[str, str, tuple]]:
+    """
+    Запросы ORM, выполненные страницами с пустым кешем
+
+    Страница объявления добавляет в обход следующую страницу комментариев
+    (bb_comments) по своему курсору. Ответы запоминают контекст шаблона
+    только в тестовом окружении (setup_test_environment).
+
+    Returns:
+        List[tuple]: [(URL-имя страницы, sql, params), ...]
+    """
+    from django.core.cache import cache
+
+    from .cache_utils import local_cache
+
+    queries = []
+    pending = list(urls)
+    for url, user in pending:
+        cache.clear()
+        local_cache.clear()
+        if user is not None:
+            client.force_login(user)
+        else:
+            client.logout()
+        collector = QueryCollector()
+        with connection.execute_wrapper(collector):
+            response = client.get(url)
+        if response.status_code != 200:
+            raise AssertionError(f'{url}: статус {response.status_code}')
+        label = response.resolver_match.view_name
+        queries += [(label, sql, params) for sql, params in collector.queries]
+
+        comments_next = response.context.get('comments_next') if response.context else None
+        if comments_next:
+            pending.append((f'/bb_{response.resolver_match.kwargs["pk"]}/comments/?after={comments_next}', None))
+    return queries
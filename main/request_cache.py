@@ -0,0 +1,157 @@
+"""
+Кеш на время запроса: пакетное чтение и отложенная запись в Redis
+
+RequestCacheMiddleware в начале запроса одним get_many читает все, что
+понадобится странице: сессию, версии тегов, ключи, объявленные view через
+@prefetch_cache_keys, счетчики сайдбара. Дальше get_cached_or_set(), теги,
+фасеты и кеш страниц берут значения отсюда, а недостающие ключи читаются
+пачками и запоминаются до конца запроса. Записи GET-запросов копятся и
+уходят в Redis одним pipeline после того, как view вернул ответ.
+
+Записи POST и других изменяющих запросов не откладываются: сигналы удаляют
+ключи напрямую, и отложенная запись могла бы вернуть устаревшее значение.
+"""
+import logging
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.core.cache import cache
+
+from . import budgets
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+_current: ContextVar[Optional['RequestCache']] = ContextVar('request_cache', default=None)
+
+
+class RequestCache:
+    """
+    Значения кеша, прочитанные за запрос, и отложенные записи
+
+    Args:
+        defer_writes: Копить записи до flush() (только для безопасных запросов)
+    """
+
+    def __init__(self, defer_writes: bool = False):
+        self.defer_writes = defer_writes
+        self.round_trips = 0
+        self._values = {}
+        self._pending = {}
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Как cache.get_many(); в Redis идут только ключи, которых еще не было в запросе"""
+        keys = list(keys)
+        unknown = [key for key in keys if key not in self._values]
+        if unknown:
+            self.round_trips += 1
+            fetched = cache.get_many(unknown)
+            for key in unknown:
+                self._values[key] = fetched.get(key, _MISSING)
+        return {key: self._values[key] for key in keys if self._values[key] is not _MISSING}
+
+    def lookup(self, key: str) -> Tuple[bool, Any]:
+        """(известен ли ключ в этом запросе, значение или None)"""
+        value = self._values.get(key, _MISSING)
+        if key not in self._values:
+            return False, None
+        return True, None if value is _MISSING else value
+
+    def set_many(self, mapping: Dict[str, Any], timeout: Optional[int]):
+        self._values.update(mapping)
+        if self.defer_writes:
+            self._pending.update({key: (value, timeout) for key, value in mapping.items()})
+            return
+        self.round_trips += 1
+        cache.set_many(mapping, timeout=timeout)
+
+    def forget(self, keys: Iterable[str]):
+        """Ключ изменили или удалили: следующее чтение пойдет в Redis, отложенная запись отменяется"""
+        for key in keys:
+            self._values.pop(key, None)
+            self._pending.pop(key, None)
+
+    def flush(self):
+        """Отправить отложенные записи: один pipeline для django-redis, иначе set_many по TTL"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        self.round_trips += 1
+        client = getattr(cache, 'client', None)
+        if hasattr(client, 'get_client'):
+            pipe = client.get_client(write=True).pipeline(transaction=False)
+            for key, (value, timeout) in pending.items():
+                cache.set(key, value, timeout=timeout, client=pipe)
+            started = time.perf_counter()
+            pipe.execute()
+            budgets.record_cache_call((time.perf_counter() - started) * 1000)
+            return
+        by_timeout = defaultdict(dict)
+        for key, (value, timeout) in pending.items():
+            by_timeout[timeout][key] = value
+        for timeout, mapping in by_timeout.items():
+            cache.set_many(mapping, timeout=timeout)
+
+
+def current() -> Optional[RequestCache]:
+    return _current.get()
+
+
+def activate(request_cache: RequestCache):
+    return _current.set(request_cache)
+
+
+def deactivate(token):
+    _current.reset(token)
+
+
+def get_many(keys: Iterable[str]) -> Dict[str, Any]:
+    """cache.get_many() через кеш запроса, если он есть"""
+    request_cache = _current.get()
+    if request_cache is None:
+        return cache.get_many(keys)
+    return request_cache.get_many(keys)
+
+
+def get(key: str, default: Any = None) -> Any:
+    return get_many([key]).get(key, default)
+
+
+def set_many(mapping: Dict[str, Any], timeout: Optional[int]):
+    """cache.set_many(); в GET-запросе - в конце ответа одним pipeline"""
+    request_cache = _current.get()
+    if request_cache is None:
+        cache.set_many(mapping, timeout=timeout)
+    else:
+        request_cache.set_many(mapping, timeout)
+
+
+def set(key: str, value: Any, timeout: Optional[int]):
+    set_many({key: value}, timeout)
+
+
+def forget(keys: Iterable[str]):
+    request_cache = _current.get()
+    if request_cache is not None:
+        request_cache.forget(keys)
+
+
+def prefetch_cache_keys(get_keys: Callable[..., List[str]]):
+    """
+    Объявить ключи, которые view прочитает: RequestCacheMiddleware заберет
+    их вместе с остальными одним get_many
+
+    Args:
+        get_keys: Функция (request, *args, **kwargs view) -> список ключей
+
+    Usage:
+        @prefetch_cache_keys(lambda request, pk: [generate_cache_key('bb_detail', pk)])
+        def bb_detail(request, pk):
+            ...
+    """
+    def decorator(view_func):
+        view_func.prefetch_cache_keys = get_keys
+        return view_func
+    return decorator
@@ -0,0 +1,304 @@
+"""
+Полнотекстовый поиск объявлений: индекс SQLite FTS5 + лемматизация pymorphy3,
+нечеткий поиск по триграммам заголовков для запросов с опечатками
+"""
+import re
+import logging
+from functools import lru_cache, reduce
+from operator import and_
+from typing import Iterable, List, Set
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q, QuerySet, Count
+from django.db.models.expressions import RawSQL
+
+from .models import BbTrigram
+
+logger = logging.getLogger(__name__)
+
+SEARCH_TABLE = 'main_bb_search'
+WORD_RE = re.compile(r'\w+')
+
+TRIGRAM_THRESHOLD = getattr(settings, 'SEARCH_TRIGRAM_THRESHOLD', 0.2)
+TRIGRAM_CANDIDATES = getattr(settings, 'SEARCH_TRIGRAM_CANDIDATES', 200)
+
+
+@lru_cache(maxsize=1)
+def get_morph():
+    """Морфологический анализатор загружается один раз на процесс (воркер)"""
+    import pymorphy3
+    return pymorphy3.MorphAnalyzer(lang='ru')
+
+
+@lru_cache(maxsize=100_000)
+def lemmatize(word: str) -> str:
+    """
+    Нормальная форма слова: нижний регистр, 'ё' -> 'е', лемма pymorphy3
+
+    Args:
+        word: Слово в любой форме ("Велосипеды")
+
+    Returns:
+        str: Лемма ("велосипед")
+    """
+    word = word.lower().replace('ё', 'е')
+    if word.isdigit():
+        return word
+    return get_morph().parse(word)[0].normal_form.replace('ё', 'е')
+
+
+def normalize_terms(text: str) -> List[str]:
+    """Разбить текст на слова и привести каждое к лемме"""
+    return [lemmatize(word) for word in WORD_RE.findall(text or '')]
+
+
+def document_terms(title: str, content: str) -> str:
+    """Текст документа для индекса: леммы заголовка и описания"""
+    return ' '.join(normalize_terms(f'{title} {content}'))
+
+
+def is_search_index_available() -> bool:
+    """FTS5-индекс есть только на SQLite, на других СУБД работает icontains"""
+    return connection.vendor == 'sqlite'
+
+
+def normalize_keyword(keyword: str) -> str:
+    """
+    Каноническая форма поискового запроса для ключа кеша
+
+    Порядок и регистр слов не важны, поэтому "Красный Велосипед" и
+    "велосипеды красные" дают одну и ту же строку и один ключ кеша.
+
+    Args:
+        keyword: Строка из SearchForm
+
+    Returns:
+        str: Отсортированные уникальные термы через пробел
+    """
+    if is_search_index_available():
+        terms = normalize_terms(keyword)
+    else:
+        terms = [word.lower() for word in (keyword or '').split()]
+    return ' '.join(sorted(set(terms)))
+
+
+def search_keyword(keyword: str) -> str:
+    """
+    Поисковый запрос, если в нем есть хотя бы одно слово
+
+    Запрос из одних знаков препинания ("!!!", "--") нормализуется в пустую
+    строку и означает отсутствие поиска: полный список без "Найдено".
+    """
+    return keyword if normalize_keyword(keyword) else ''
+
+
+def filter_by_keyword(queryset: QuerySet, keyword: str) -> QuerySet:
+    """
+    Отфильтровать объявления по поисковому запросу (все слова обязательны)
+
+    Args:
+        queryset: QuerySet модели Bb
+        keyword: Строка из SearchForm
+
+    Returns:
+        QuerySet: Отфильтрованный QuerySet (сам запрос не выполняется)
+    """
+    normalized = normalize_keyword(keyword)
+    if not normalized:
+        return queryset
+
+    if is_search_index_available():
+        match = ' '.join(f'"{term}"' for term in normalized.split())
+        return queryset.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s',
+            [match]
+        ))
+
+    q_objects = [Q(title__icontains=word) | Q(content__icontains=word) for word in normalized.split()]
+    return queryset.filter(reduce(and_, q_objects))
+
+
+def index_bb(pk: int, title: str, content: str):
+    """
+    Добавить или обновить объявление в поисковом индексе
+
+    Args:
+        pk: Первичный ключ объявления
+        title: Заголовок
+        content: Описание
+    """
+    if not is_search_index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [pk])
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, terms) VALUES (%s, %s)',
+            [pk, document_terms(title, content)]
+        )
+
+
+def unindex_bb(pk: int):
+    """Удалить объявление из поискового индекса"""
+    if not is_search_index_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [pk])
+
+
+def rebuild_index(rows: Iterable, batch_size: int = 1000) -> int:
+    """
+    Полностью перестроить поисковый индекс
+
+    Args:
+        rows: Итератор кортежей (pk, title, content)
+        batch_size: Размер пачки для executemany
+
+    Returns:
+        int: Количество проиндексированных объявлений
+    """
+    if not is_search_index_available():
+        return 0
+
+    total = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        batch = []
+        for pk, title, content in rows:
+            batch.append((pk, document_terms(title, content)))
+            if len(batch) >= batch_size:
+                cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, terms) VALUES (%s, %s)', batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(f'INSERT INTO {SEARCH_TABLE} (rowid, terms) VALUES (%s, %s)', batch)
+            total += len(batch)
+
+    logger.info(f"Search index rebuilt: {total} bbs")
+    return total
+
+
+def word_trigrams(word: str) -> Set[str]:
+    """Триграммы слова с выравниванием пробелами, как в pg_trgm ("  в", " ве", ...)"""
+    padded = f'  {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def split_words(text: str) -> List[str]:
+    """Слова текста в нижнем регистре, 'ё' -> 'е' (без лемматизации)"""
+    return [word.lower().replace('ё', 'е') for word in WORD_RE.findall(text or '')]
+
+
+def text_trigrams(text: str) -> Set[str]:
+    """Множество триграмм всех слов текста"""
+    trigrams = set()
+    for word in split_words(text):
+        trigrams |= word_trigrams(word)
+    return trigrams
+
+
+def trigram_similarity(query: str, title: str) -> float:
+    """
+    Похожесть заголовка на запрос
+
+    Для каждого слова запроса берется лучшее совпадение (коэффициент Жаккара
+    по триграммам) среди слов заголовка, результат усредняется по словам запроса.
+
+    Args:
+        query: Поисковый запрос
+        title: Заголовок объявления
+
+    Returns:
+        float: Оценка от 0 до 1
+    """
+    query_words = split_words(query)
+    title_sets = [word_trigrams(word) for word in split_words(title)]
+    if not query_words or not title_sets:
+        return 0.0
+
+    total = 0.0
+    for word in query_words:
+        query_set = word_trigrams(word)
+        total += max(len(query_set & title_set) / len(query_set | title_set) for title_set in title_sets)
+    return total / len(query_words)
+
+
+def index_bb_trigrams(pk: int, title: str):
+    """
+    Перестроить триграммы заголовка объявления
+
+    Args:
+        pk: Первичный ключ объявления
+        title: Заголовок
+    """
+    BbTrigram.objects.filter(bb_id=pk).delete()
+    BbTrigram.objects.bulk_create(
+        BbTrigram(bb_id=pk, trigram=trigram) for trigram in text_trigrams(title)
+    )
+
+
+def rebuild_trigrams(rows: Iterable, batch_size: int = 1000) -> int:
+    """
+    Полностью перестроить триграммный индекс заголовков
+
+    Args:
+        rows: Итератор кортежей (pk, title)
+        batch_size: Размер пачки для bulk_create
+
+    Returns:
+        int: Количество проиндексированных объявлений
+    """
+    BbTrigram.objects.all().delete()
+    total = 0
+    batch = []
+    for pk, title in rows:
+        batch.extend(BbTrigram(bb_id=pk, trigram=trigram) for trigram in text_trigrams(title))
+        total += 1
+        if len(batch) >= batch_size:
+            BbTrigram.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        BbTrigram.objects.bulk_create(batch)
+
+    logger.info(f"Trigram index rebuilt: {total} bbs")
+    return total
+
+
+def fuzzy_search(queryset: QuerySet, keyword: str) -> List[int]:
+    """
+    Нечеткий поиск по триграммам заголовков (запасной вариант при нуле точных совпадений)
+
+    Кандидаты отбираются одним запросом по индексу триграмм: не больше
+    TRIGRAM_CANDIDATES объявлений с наибольшим числом общих триграмм. Точная
+    оценка похожести считается только для этих кандидатов.
+
+    Args:
+        queryset: QuerySet модели Bb с уже примененными фильтрами (активность, рубрика)
+        keyword: Строка из SearchForm
+
+    Returns:
+        List[int]: PK объявлений по убыванию похожести
+    """
+    query_trigrams = text_trigrams(keyword)
+    if not query_trigrams:
+        return []
+
+    candidates = list(
+        BbTrigram.objects.filter(trigram__in=query_trigrams, bb__in=queryset.values('pk'))
+        .values('bb')
+        .annotate(shared=Count('id'))
+        .order_by('-shared')
+        .values_list('bb', flat=True)[:TRIGRAM_CANDIDATES]
+    )
+    if not candidates:
+        return []
+
+    scored = []
+    for pk, title in queryset.filter(pk__in=candidates).values_list('pk', 'title'):
+        score = trigram_similarity(keyword, title)
+        if score >= TRIGRAM_THRESHOLD:
+            scored.append((score, pk))
+    scored.sort(key=lambda item: (-item[0], -item[1]))
+
+    logger.debug(f"Fuzzy search '{keyword}': {len(candidates)} candidates, {len(scored)} matches")
+    return [pk for _, pk in scored]
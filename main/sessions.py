@@ -0,0 +1,25 @@
+"""
+Сессии в кеше с чтением через кеш запроса
+
+RequestCacheMiddleware забирает сессию вместе с остальными ключами
+страницы одним get_many, и load() не делает отдельного запроса в Redis.
+SESSION_ENGINE = 'main.sessions'
+"""
+from django.contrib.sessions.backends.cache import SessionStore as CacheSessionStore
+
+from . import request_cache
+
+
+class SessionStore(CacheSessionStore):
+
+    def load(self):
+        current = request_cache.current()
+        if current is None or self.session_key is None:
+            return super().load()
+        found, session_data = current.lookup(self.cache_key)
+        if not found:
+            return super().load()
+        if session_data is not None:
+            return session_data
+        self._session_key = None
+        return {}
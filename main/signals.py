@@ -1,8 +1,14 @@
 from django.dispatch import Signal, receiver
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.core.cache import cache
-from .models import Comment, Bb, SubRubric
-from .cache_utils import generate_cache_key, invalidate_cache_pattern
+from .models import Comment, Bb, SuperRubric, SubRubric, AdditionalImage
+from .cache_utils import generate_cache_key, invalidate_tags
+from .listings import get_bb_row_cache_key
+from .counters import apply_counter_delta, comment_contribution, invalidate_bb_comment_caches
+from .facets import apply_delta
+from .popular import refresh_popular_bbs
+from .search import index_bb, unindex_bb, index_bb_trigrams
 
 from .utilities import send_new_comment_notification 
 from .utilities import send_activation_notification
@@ -13,36 +19,156 @@ post_register = Signal()
 def post_register_dispatcher(sender, **kwargs):
     send_activation_notification(kwargs['instance'])
 
+@receiver(pre_save, sender=Comment)
+def remember_comment_state(sender, instance, **kwargs):
+    """
+    Запоминаем вклад комментария в счетчики объявления до сохранения
+    """
+    instance._counter_state = None
+    if instance.pk:
+        instance._counter_state = (
+            Comment.objects.filter(pk=instance.pk).values_list('bb_id', 'is_active', 'rating').first()
+        )
+
 @receiver(post_save, sender=Comment)
 def post_save_dispatcher(sender, **kwargs):
-    """Обработка сохранения комментария + инвалидация кеша"""
+    """Обработка сохранения комментария: счетчики объявления + инвалидация кеша"""
     instance = kwargs['instance']
     author = instance.bb.author
     
     if kwargs['created'] and author.send_messages:
         send_new_comment_notification(instance)
     
-    cache_key_rating = generate_cache_key('bb_rating', instance.bb.pk)
-    cache.delete(cache_key_rating)
+    # Разница вкладов до и после сохранения - в той же транзакции, что и комментарий
+    delta = comment_contribution(instance.is_active, instance.rating)
+    old = getattr(instance, '_counter_state', None)
+    if old and old[0] != instance.bb_id:
+        apply_counter_delta(old[0], *(-value for value in comment_contribution(old[1], old[2])))
+        invalidate_bb_comment_caches(old[0])
+    elif old:
+        delta = tuple(new - was for new, was in zip(delta, comment_contribution(old[1], old[2])))
+    apply_counter_delta(instance.bb_id, *delta)
+    invalidate_bb_comment_caches(instance.bb_id)
+
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_cache(sender, instance, **kwargs):
+    """Удаленный комментарий меняет счетчики и страницу объявления"""
+    apply_counter_delta(instance.bb_id, *(-value for value in comment_contribution(instance.is_active, instance.rating)))
+    invalidate_bb_comment_caches(instance.bb_id)
 
 @receiver([post_save, post_delete], sender=Bb)
 def invalidate_bb_cache(sender, instance, **kwargs):
     """
     Инвалидация кеша при изменении/удалении объявления
     """
-    cache_key_bb = generate_cache_key('bb_detail', instance.pk)
-    cache.delete(cache_key_bb)
+    keys = [
+        generate_cache_key('bb_detail', instance.pk),
+        generate_cache_key('api_bb_detail', instance.pk),
+        get_bb_row_cache_key(instance.pk),
+    ]
+    # Списки: главная и рубрика (а при переносе - и прежняя рубрика),
+    # записи и версия страницы объявления (ETag).
+    # Все сбрасывается после коммита: удаленную до коммита запись параллельный
+    # GET заново закешировал бы по старым данным. Записи объявления помечены
+    # тегом bb:<pk>, поэтому и запись, отложенная до конца такого GET, не читается
+    tags = {'index', f'rubric:{instance.rubric_id}', f'bb:{instance.pk}'}
+    old = getattr(instance, '_facet_state', None)
+    if old:
+        tags.add(f'rubric:{old[0]}')
     
-    cache_key_rating = generate_cache_key('bb_rating', instance.pk)
-    cache.delete(cache_key_rating)
+    def invalidate():
+        cache.delete_many(keys)
+        invalidate_tags(*tags)
+    
+    transaction.on_commit(invalidate)
+
+@receiver([post_save, post_delete], sender=AdditionalImage)
+def invalidate_bb_images_cache(sender, instance, **kwargs):
+    """
+    Запись объявления хранит URL дополнительных фото - сбрасываем ее
+    """
+    keys = [
+        generate_cache_key('bb_detail', instance.bb_id),
+        generate_cache_key('api_bb_detail', instance.bb_id),
+    ]
+    bb_tag = f'bb:{instance.bb_id}'
     
-    invalidate_cache_pattern(f'bboard:rubric_bbs:{instance.rubric.pk}:*')
+    def invalidate():
+        cache.delete_many(keys)
+        invalidate_tags(bb_tag)
     
-    invalidate_cache_pattern('bboard:index_page:*')
+    transaction.on_commit(invalidate)
+
+@receiver(post_save, sender=Bb)
+def update_search_index(sender, instance, **kwargs):
+    """
+    Переиндексация объявления в полнотекстовом поиске и в триграммах заголовка
+    """
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not {'title', 'content'} & set(update_fields):
+        return
+    index_bb(instance.pk, instance.title, instance.content)
+    index_bb_trigrams(instance.pk, instance.title)
+
+@receiver(post_delete, sender=Bb)
+def remove_from_search_index(sender, instance, **kwargs):
+    """
+    Удаление объявления из полнотекстового поиска
+    """
+    unindex_bb(instance.pk)
+
+@receiver(pre_save, sender=Bb)
+def remember_facet_state(sender, instance, **kwargs):
+    """
+    Запоминаем состояние объявления до сохранения для пересчета фасетов
+    """
+    instance._facet_state = None
+    if instance.pk:
+        instance._facet_state = (
+            Bb.objects.filter(pk=instance.pk).values_list('rubric_id', 'price', 'is_active').first()
+        )
+
+@receiver(post_save, sender=Bb)
+def update_facets_on_save(sender, instance, **kwargs):
+    """
+    Инкрементальное обновление счетчиков рубрик и гистограммы цен
+    """
+    old = getattr(instance, '_facet_state', None)
+    new = (instance.rubric_id, instance.price, instance.is_active)
+    if old == new:
+        return
+    
+    def apply():
+        if old and old[2]:
+            apply_delta(old[0], old[1], -1)
+        if new[2]:
+            apply_delta(new[0], new[1], 1)
+    
+    transaction.on_commit(apply)
+
+@receiver(post_delete, sender=Bb)
+def update_facets_on_delete(sender, instance, **kwargs):
+    """
+    Уменьшение счетчиков фасетов при удалении активного объявления
+    """
+    if instance.is_active:
+        rubric_id, price = instance.rubric_id, instance.price
+        transaction.on_commit(lambda: apply_delta(rubric_id, price, -1))
+
+@receiver([post_save, post_delete], sender=Bb)
+@receiver([post_save, post_delete], sender=Comment)
+def refresh_popular_on_change(sender, instance, **kwargs):
+    """
+    Фоновый пересчет рейтинга популярных после коммита; изменения за
+    POPULAR_REFRESH_DELAY секунд попадают в один пересчет
+    """
+    transaction.on_commit(lambda: refresh_popular_bbs(background=True))
 
+@receiver([post_save, post_delete], sender=SuperRubric)
 @receiver([post_save, post_delete], sender=SubRubric)
 def invalidate_rubrics_cache(sender, instance, **kwargs):
     """
-    Инвалидация кеша рубрик при их изменении
+    Инвалидация кеша рубрик (сайдбар, API) и страницы рубрики при их изменении
     """
-    invalidate_cache_pattern('bboard:rubrics:*')
+    tags = ('sidebar', f'rubric:{instance.pk}')
+    transaction.on_commit(lambda: invalidate_tags(*tags))
@@ -127,5 +127,55 @@
                 }
             });
         }
+
+        // Страница для гостей может прийти из кеша вместе с чужой CAPTCHA -
+        // получаем свою, когда посетитель начинает писать комментарий
+        const captchaImage = document.querySelector('img.captcha');
+        const captchaKey = document.querySelector('input[name="captcha_0"]');
+        if (captchaImage && captchaKey) {
+            captchaImage.closest('form').addEventListener('focusin', () => {
+                fetch(window.CAPTCHA_REFRESH_URL, {
+                    headers: { 'X-Requested-With': 'XMLHttpRequest' },
+                })
+                    .then((response) => (response.ok ? response.json() : null))
+                    .then((data) => {
+                        if (!data) {
+                            return;
+                        }
+                        captchaKey.value = data.key;
+                        captchaImage.src = data.image_url;
+                    })
+                    .catch(() => {});
+            }, { once: true });
+        }
+
+        // Первая страница комментариев приходит со страницей, следующие -
+        // HTML-фрагментами по курсору
+        const commentsList = document.querySelector('[data-comments]');
+        const moreButton = document.querySelector('[data-comments-more]');
+        if (commentsList && moreButton) {
+            moreButton.addEventListener('click', () => {
+                const url = `${moreButton.dataset.url}?after=${encodeURIComponent(moreButton.dataset.after)}`;
+                moreButton.disabled = true;
+                fetch(url, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+                    .then((response) => (response.ok ? response.json() : null))
+                    .then((data) => {
+                        if (!data) {
+                            moreButton.disabled = false;
+                            return;
+                        }
+                        commentsList.insertAdjacentHTML('beforeend', data.html);
+                        if (data.next) {
+                            moreButton.dataset.after = data.next;
+                            moreButton.disabled = false;
+                        } else {
+                            moreButton.remove();
+                        }
+                    })
+                    .catch(() => {
+                        moreButton.disabled = false;
+                    });
+            });
+        }
     });
 })();
@@ -0,0 +1,236 @@
+"""
+Подсказки при наборе поискового запроса (search-as-you-type)
+
+Индекс префиксов строится из заголовков активных объявлений и названий рубрик,
+хранится в Redis и держится в памяти каждого воркера (фоновый поток
+перечитывает его из Redis). Запрос подсказки обслуживается целиком из памяти,
+без обращений к Redis и SQLite. Собирает индекс команда suggest_rebuild, а
+если в Redis его нет (первый запуск, вытеснение) - фоновый поток одного из
+воркеров сразу после старта.
+"""
+import os
+import time
+import heapq
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, List, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .models import Bb, SubRubric
+from .cache_utils import generate_cache_key
+from .search import split_words
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_REFRESH_INTERVAL = getattr(settings, 'SUGGEST_REFRESH_INTERVAL', 300)
+SUGGEST_RETRY_INTERVAL = 5
+SUGGEST_MIN_WORD_LENGTH = 2
+PRECOMPUTED_PREFIX_LENGTH = 2
+PRECOMPUTED_TOP = 20
+
+
+class PrefixIndex:
+    """
+    Компактный индекс префиксов: отсортированный массив ключей + бинарный поиск
+
+    Для коротких префиксов (до PRECOMPUTED_PREFIX_LENGTH символов) лучшие
+    варианты посчитаны заранее, иначе просматривается только диапазон ключей,
+    начинающихся с префикса.
+    """
+
+    def __init__(self, items: List[Tuple[str, int, Any]]):
+        """
+        Args:
+            items: Кортежи (ключ, вес, значение); значение возвращается в подсказке
+        """
+        items = sorted(items, key=lambda item: item[0])
+        self.keys = [item[0] for item in items]
+        self.weights = [item[1] for item in items]
+        self.values = [item[2] for item in items]
+        self.top = {}
+
+        for length in range(1, PRECOMPUTED_PREFIX_LENGTH + 1):
+            prefixes = {key[:length] for key in self.keys if len(key) >= length}
+            for prefix in prefixes:
+                self.top[prefix] = self._scan(prefix, PRECOMPUTED_TOP)
+
+    def _scan(self, prefix: str, limit: int) -> List[Any]:
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + '\uffff', start)
+        best = heapq.nlargest(limit, range(start, end), key=lambda i: (self.weights[i], -i))
+        return [self.values[i] for i in best]
+
+    def complete(self, prefix: str, limit: int) -> List[Any]:
+        """
+        Лучшие по весу значения для ключей с данным префиксом
+
+        Args:
+            prefix: Префикс в нижнем регистре
+            limit: Максимальное число результатов
+
+        Returns:
+            List[Any]: Значения по убыванию веса
+        """
+        if prefix in self.top and limit <= PRECOMPUTED_TOP:
+            return self.top[prefix][:limit]
+        return self._scan(prefix, limit)
+
+
+def build_suggest_data() -> Dict[str, list]:
+    """
+    Собрать исходные данные индекса из базы (команда suggest_rebuild или ensure_suggest_index)
+
+    Returns:
+        dict: {'terms': [[слово, частота], ...], 'rubrics': [[слово, вес, pk, название], ...]}
+    """
+    counter = Counter()
+    for title in Bb.objects.filter(is_active=True).values_list('title', flat=True).iterator(chunk_size=2000):
+        counter.update({word for word in split_words(title) if len(word) >= SUGGEST_MIN_WORD_LENGTH})
+
+    rubrics = []
+    rubric_counts = Counter(Bb.objects.filter(is_active=True).values_list('rubric', flat=True).iterator(chunk_size=2000))
+    for pk, name in SubRubric.objects.values_list('pk', 'name'):
+        for word in split_words(name):
+            rubrics.append([word, rubric_counts[pk], pk, name])
+
+    logger.info(f"Suggest index built: {len(counter)} terms, {len(rubrics)} rubric words")
+    return {'terms': [[term, count] for term, count in counter.items()], 'rubrics': rubrics}
+
+
+def get_suggest_cache_key() -> str:
+    return generate_cache_key('suggest_index')
+
+
+def rebuild_suggest_index() -> Dict[str, list]:
+    """Пересобрать индекс и опубликовать его в Redis для всех воркеров"""
+    data = build_suggest_data()
+    cache.set(get_suggest_cache_key(), data, timeout=None)
+    _install(data)
+    return data
+
+
+# indexes - пара (термины, рубрики), заменяется целиком одним присваиванием
+_worker_state = {'indexes': None, 'loaded_at': 0.0, 'pid': None}
+_start_lock = threading.Lock()
+
+
+def _install(data: Dict[str, list]):
+    terms = PrefixIndex([(term, count, term) for term, count in data['terms']])
+    rubrics = PrefixIndex([
+        (word, weight, {'id': pk, 'name': name}) for word, weight, pk, name in data['rubrics']
+    ])
+    _worker_state['indexes'] = (terms, rubrics)
+    _worker_state['loaded_at'] = time.monotonic()
+
+
+def load_suggest_index() -> bool:
+    """
+    Прочитать индекс из Redis в память воркера
+
+    Returns:
+        bool: False, если индекса в Redis нет (прежний индекс воркера остается)
+    """
+    data = cache.get(get_suggest_cache_key())
+    if data is None:
+        logger.warning("Suggest index is missing in cache")
+        return False
+    _install(data)
+    return True
+
+
+def _acquire_rebuild() -> bool:
+    try:
+        return bool(cache.add(f'{get_suggest_cache_key()}:lock', 1, timeout=SUGGEST_REFRESH_INTERVAL))
+    except Exception as e:
+        logger.error(f"Suggest rebuild lock error: {e}")
+        return False
+
+
+def ensure_suggest_index() -> bool:
+    """
+    Загрузить индекс из Redis, а если его там нет - собрать из базы
+
+    Собирает один воркер на сайт (блокировка cache.add), остальные подхватят
+    опубликованный индекс при следующей попытке.
+
+    Returns:
+        bool: False, если индекс собирает другой воркер
+    """
+    if load_suggest_index():
+        return True
+    if not _acquire_rebuild():
+        return False
+    rebuild_suggest_index()
+    return True
+
+
+def _refresh_loop():
+    while True:
+        loaded = False
+        try:
+            loaded = ensure_suggest_index()
+        except Exception as e:
+            logger.error(f"Suggest index refresh error: {e}")
+        finally:
+            connections.close_all()
+        # Пока индекса нет, повторяем часто: его вот-вот опубликует другой воркер
+        time.sleep(SUGGEST_REFRESH_INTERVAL if loaded else SUGGEST_RETRY_INTERVAL)
+
+
+def start_suggest_refresher():
+    """
+    Фоновый поток воркера: загрузить (при необходимости собрать) индекс сразу
+    и перечитывать его раз в SUGGEST_REFRESH_INTERVAL секунд
+
+    Вызывается из post_fork в gunicorn.conf.py; если хук не настроен, поток
+    запускает первый запрос подсказки в процессе. Потоки не переживают fork,
+    поэтому запуск отмечается pid процесса.
+    """
+    with _start_lock:
+        if _worker_state['pid'] == os.getpid():
+            return
+        _worker_state['pid'] = os.getpid()
+    threading.Thread(target=_refresh_loop, name='suggest-refresh', daemon=True).start()
+
+
+def suggest(prefix: str, limit: int = 10) -> Dict[str, list]:
+    """
+    Подсказки для префикса
+
+    Ответ строится только из памяти воркера: индекс загружает и обновляет
+    фоновый поток (start_suggest_refresher). Пока индекса нет, подсказок нет -
+    ни Redis, ни SQLite в запросе не читаются.
+
+    Args:
+        prefix: Введенный пользователем текст
+        limit: Максимальное число подсказок каждого вида
+
+    Returns:
+        dict: {'terms': [...], 'rubrics': [{'id': ..., 'name': ...}, ...]}
+    """
+    if _worker_state['pid'] != os.getpid():
+        start_suggest_refresher()
+
+    words = split_words(prefix)
+    indexes = _worker_state['indexes']
+    if not words or indexes is None:
+        return {'terms': [], 'rubrics': []}
+    terms, rubric_index = indexes
+
+    *head, last = words
+    rubrics = []
+    seen = set()
+    for rubric in rubric_index.complete(last, limit * 2):
+        if rubric['id'] not in seen:
+            seen.add(rubric['id'])
+            rubrics.append(rubric)
+
+    return {
+        'terms': [' '.join(head + [term]) for term in terms.complete(last, limit)],
+        'rubrics': rubrics[:limit],
+    }
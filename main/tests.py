@@ -1,3 +1,1246 @@
-from django.test import TestCase
+import datetime
+import importlib.util
+import os
+import random
+import re
+import threading
+import time
+import unittest
+import unittest.mock
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count, product
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.conf import settings
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve
+
+from . import cache_stats
+from .budgets import budget_violations, get_budget
+from .cache_backends import JSONSerializer, MsgpackSerializer, ZlibCompressor
+from .comments import COMMENTS_PAGE_SIZE, get_comments_cache_key
+from .counters import deactivate_comments, recompute_bb_counters
+from .db import non_atomic_reads
+from .cache_utils import (
+    LocalCache, generate_cache_key, get_cached_or_set, get_tag_versions, invalidate_tags, local_cache,
+    get_cache_stats, reset_cache_stats
+)
+from . import facets
+from .facets import (
+    ALL_RUBRICS, NO_PRICE_BUCKET, get_price_histogram, get_rubric_count_key, get_rubric_counts, price_bucket,
+    reconcile_facets
+)
+from .forms import SearchForm
+from .listings import bb_detail_record, get_bb_row_cache_key, get_bb_rows
+from .middleware import get_sidebar
+from .models import AdvUser, SuperRubric, SubRubric, Bb, Comment
+from .popular import refresh_popular_bbs
+from .query_plans import (
+    QueryCollector, analyze_queries, collect_view_queries, explain, plan_urls, seed_plan_data, suggest_index
+)
+from .request_cache import RequestCache
+from .search import fuzzy_search, normalize_keyword
+from .suggest import (
+    _worker_state as suggest_state, ensure_suggest_index, get_suggest_cache_key, load_suggest_index,
+    rebuild_suggest_index, suggest
+)
+from .pagination import keyset_page, legacy_page_cursor
+from . import views
+from .views import apply_listing_filters
+from .warmup import warm_cache
+
+
+class ListingQueryPlanTests(TestCase):
+    """Каждая поддерживаемая комбинация фильтров и сортировки списка идет по индексу"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = AdvUser.objects.create(username='author')
+        super_rubric = SuperRubric.objects.create(name='Транспорт')
+        cls.rubric = SubRubric.objects.create(name='Велосипеды', super_rubric=super_rubric)
+        Bb.objects.bulk_create(
+            Bb(rubric=cls.rubric, title=f'Велосипед {i}', content='Описание', contacts='-',
+               author=author, price=i * 100 if i % 5 else None)
+            for i in range(30)
+        )
+
+    def assert_indexed(self, queries, allow_sort=False):
+        for sql, params in queries:
+            for line in explain(sql, params):
+                with self.subTest(sql=sql, plan=line):
+                    self.assertFalse(
+                        line.startswith('SCAN main_bb') and 'INDEX' not in line,
+                        'полный проход по main_bb'
+                    )
+                    if not allow_sort:
+                        self.assertNotIn('TEMP B-TREE', line)
+
+    def test_listing_queries_use_indexes(self):
+        price_filters = ({}, {'min_price': '100'}, {'max_price': '1500'}, {'min_price': '100', 'max_price': '1500'})
+        rubric_filters = ({}, {'rubric': self.rubric.pk})
+
+        for sort, prices, rubric in product(SearchForm.SORT_ORDERINGS, price_filters, rubric_filters):
+            form = SearchForm({'sort': sort, **prices})
+            self.assertTrue(form.is_valid())
+            queryset, ordering, _ = apply_listing_filters(Bb.objects.filter(is_active=True, **rubric), form)
+
+            collector = QueryCollector()
+            with connection.execute_wrapper(collector):
+                first = keyset_page(queryset, 5, ordering=ordering)
+                keyset_page(queryset, 5, after=first['next'], ordering=ordering)
+                keyset_page(queryset, 5, before=first['next'], ordering=ordering)
+                legacy_page_cursor(queryset, 3, 5, ordering)
+
+            # "Новые" с диапазоном цен: один индекс не дает и диапазон, и порядок,
+            # планировщик выбирает поиск по индексу цены и сортирует только попавшие строки
+            allow_sort = sort == 'new' and bool(prices)
+            with self.subTest(sort=sort, prices=prices, rubric=rubric):
+                self.assertTrue(first['ids'])
+                self.assert_indexed(collector.queries, allow_sort)
+
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'KEY_PREFIX': 'bboard',
+        'TIMEOUT': 300,
+    }
+}
+
+
+class CleanCacheMixin:
+    """Пустые кеши (Redis и локальный) и HTTP_HOST клиента перед каждым тестом"""
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        local_cache.clear()
+        self.client.defaults['HTTP_HOST'] = 'localhost'
+
+
+class BbFixtureMixin(CleanCacheMixin):
+    """Автор, рубрика "Транспорт / Велосипеды" и одно объявление в ней"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.author = AdvUser.objects.create(username='author', send_messages=False)
+        super_rubric = SuperRubric.objects.create(name='Транспорт')
+        cls.rubric = SubRubric.objects.create(name='Велосипеды', super_rubric=super_rubric)
+        cls.bb = Bb.objects.create(rubric=cls.rubric, title='Велосипед', content='Горный', contacts='-',
+                                   author=cls.author, price=1000)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SingleFlightTests(SimpleTestCase):
+    """Под параллельной нагрузкой callback горячего ключа выполняется один раз"""
+
+    def setUp(self):
+        cache.clear()
+
+    def run_parallel(self, callback, requests=50, **kwargs):
+        barrier = threading.Barrier(requests)
+
+        def request(_):
+            barrier.wait()
+            return get_cached_or_set('bboard:test:hot', callback, timeout=60, single_flight=True, **kwargs)
+
+        with ThreadPoolExecutor(max_workers=requests) as pool:
+            return list(pool.map(request, range(requests)))
+
+    def counting_callback(self, value):
+        calls = []
+        lock = threading.Lock()
+
+        def callback():
+            with lock:
+                calls.append(1)
+            time.sleep(0.2)
+            return value
+
+        return callback, calls
+
+    def test_one_callback_for_50_parallel_requests(self):
+        callback, calls = self.counting_callback('fresh')
+        results = self.run_parallel(callback)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['fresh'] * 50)
+
+    def test_expired_value_served_while_one_refreshes(self):
+        get_cached_or_set('bboard:test:hot', lambda: 'old', timeout=60, single_flight=True)
+        entry = cache.get('bboard:test:hot')
+        cache.set('bboard:test:hot', {**entry, 'expires_at': time.time() - 1}, timeout=60)
+
+        callback, calls = self.counting_callback('new')
+        results = self.run_parallel(callback)
+
+        self.assertEqual(len(calls), 1)
+        self.assertIn('new', results)
+        self.assertEqual(set(results), {'old', 'new'})
+        self.assertEqual(get_cached_or_set('bboard:test:hot', callback, timeout=60, single_flight=True), 'new')
+
+    def test_tagged_single_flight(self):
+        callback, calls = self.counting_callback('tagged')
+        results = self.run_parallel(callback, tags=['index'])
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['tagged'] * 50)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StaleWhileRevalidateTests(SimpleTestCase):
+    """После мягкого TTL значение отдается сразу и обновляется в фоне"""
+
+    def setUp(self):
+        cache.clear()
+
+    def expire(self, key, soft=True):
+        entry = cache.get(key)
+        if soft:
+            cache.set(key, {**entry, 'expires_at': time.time() - 1}, timeout=60)
+        else:
+            cache.delete(key)
+
+    def wait_for(self, key, value, seconds=2.0):
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if cache.get(key)['value'] == value:
+                return True
+            time.sleep(0.01)
+        return False
+
+    def test_soft_expired_value_served_and_refreshed_once(self):
+        key = 'bboard:test:swr'
+        get_cached_or_set(key, lambda: 'old', timeout=60, soft_timeout=30)
+        self.expire(key)
+
+        calls = []
+        refreshed = threading.Event()
+
+        def callback():
+            calls.append(1)
+            refreshed.wait(1)
+            return 'new'
+
+        results = [get_cached_or_set(key, callback, timeout=60, soft_timeout=30) for _ in range(10)]
+        refreshed.set()
+
+        self.assertEqual(results, ['old'] * 10)
+        self.assertTrue(self.wait_for(key, 'new'))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(get_cached_or_set(key, callback, timeout=60, soft_timeout=30), 'new')
+
+    def test_hard_expired_value_recomputed_synchronously(self):
+        key = 'bboard:test:swr'
+        get_cached_or_set(key, lambda: 'old', timeout=60, soft_timeout=30)
+        self.expire(key, soft=False)
+
+        self.assertEqual(get_cached_or_set(key, lambda: 'new', timeout=60, soft_timeout=30), 'new')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class LocalCacheTests(SimpleTestCase):
+    """L1 в памяти воркера: LRU, TTL, сброс по тегам и счетчики уровней"""
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        reset_cache_stats()
+
+    def test_lru_eviction(self):
+        l1 = LocalCache(maxsize=2, timeout=60)
+        l1.set('a', 1)
+        l1.set('b', 2)
+        l1.get('a')
+        l1.set('c', 3)
+
+        self.assertEqual((l1.get('a'), l1.get('b'), l1.get('c')), (1, None, 3))
+
+    def test_ttl(self):
+        l1 = LocalCache(maxsize=2, timeout=60)
+        l1.set('a', 1, timeout=0)
+
+        self.assertIsNone(l1.get('a'))
+
+    def test_local_hits_skip_redis_tier(self):
+        for _ in range(5):
+            get_cached_or_set('bboard:test:l1', lambda: ['x'], timeout=60, tags=['sidebar'], local=True)
+
+        stats = get_cache_stats()
+        self.assertEqual(stats['l1'], {'hits': 4, 'misses': 1})
+        self.assertEqual(stats['redis'], {'misses': 1})
+
+    def test_invalidate_tags_drops_local_copy(self):
+        get_cached_or_set('bboard:test:l1', lambda: 'old', timeout=60, tags=['sidebar'], local=True)
+        invalidate_tags('sidebar')
+
+        value = get_cached_or_set('bboard:test:l1', lambda: 'new', timeout=60, tags=['sidebar'], local=True)
+        self.assertEqual(value, 'new')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheStatsTests(SimpleTestCase):
+    """Попадания, промахи, время callback и размер копятся по префиксам ключей"""
+
+    def setUp(self):
+        cache.clear()
+        cache_stats.reset_stats()
+
+    @unittest.mock.patch.object(cache_stats, 'CACHE_STATS_SIZE_SAMPLE', 1)
+    def test_stats_per_prefix(self):
+        for pk in (1, 1, 1, 2):
+            get_cached_or_set(generate_cache_key('bb_detail', pk), lambda: {'title': 'x' * 100}, timeout=60)
+        get_cached_or_set(generate_cache_key('bb_rating', 1), lambda: 5, timeout=60, tags=['bb:1'])
+
+        stats = cache_stats.get_local_stats()
+        self.assertEqual(stats['bb_detail']['hits'], 2)
+        self.assertEqual(stats['bb_detail']['misses'], 2)
+        self.assertEqual(stats['bb_detail']['computed'], 2)
+        self.assertEqual(stats['bb_detail']['sized'], 2)
+        self.assertGreater(stats['bb_detail']['bytes'], 200)
+        self.assertIn('callback_us', stats['bb_detail'])
+        self.assertEqual(stats['bb_rating']['misses'], 1)
+
+    def test_size_sampled(self):
+        with unittest.mock.patch.object(cache_stats, '_computed', count()), \
+                unittest.mock.patch.object(cache_stats, 'payload_size', wraps=cache_stats.payload_size) as size:
+            for pk in range(20):
+                get_cached_or_set(generate_cache_key('bb_detail', pk), lambda: {'title': 'x' * 100}, timeout=60)
+
+        stats = cache_stats.get_local_stats()['bb_detail']
+        self.assertEqual((stats['computed'], stats['sized'], size.call_count), (20, 2, 2))
+
+    def test_errors_counted(self):
+        def failing_set(*args, **kwargs):
+            raise ConnectionError('redis down')
+
+        with unittest.mock.patch.object(cache, 'set', failing_set):
+            self.assertEqual(get_cached_or_set(generate_cache_key('api_rubrics'), lambda: [], timeout=60), [])
+
+        self.assertEqual(cache_stats.get_local_stats()['api_rubrics']['errors'], 1)
+
+
+class CacheFormatTests(SimpleTestCase):
+    """Сериализаторы кеша возвращают записи с теми же типами"""
+
+    record = {
+        'pk': 1,
+        'title': 'Велосипед',
+        'price': 1500.0,
+        'created_at': datetime.datetime(2025, 5, 1, 12, 30, tzinfo=datetime.timezone.utc),
+        'image_url': None,
+        'ids': [3, 2, 1],
+    }
+
+    def test_json_round_trip(self):
+        serializer = JSONSerializer({})
+        self.assertEqual(serializer.loads(serializer.dumps(self.record)), self.record)
+
+    @unittest.skipUnless(importlib.util.find_spec('msgpack'), 'msgpack не установлен')
+    def test_msgpack_round_trip(self):
+        serializer = MsgpackSerializer({})
+        self.assertEqual(serializer.loads(serializer.dumps(self.record)), self.record)
+
+    def test_compression_threshold(self):
+        compressor = ZlibCompressor({'COMPRESS_MIN_LENGTH': 100})
+        short, long = b'x' * 50, b'x' * 500
+
+        self.assertEqual(compressor.compress(short), short)
+        self.assertLess(len(compressor.compress(long)), len(long))
+        self.assertEqual(compressor.decompress(compressor.compress(long)), long)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTests(BbFixtureMixin, TestCase):
+    """Страницы объявления и рубрики отвечают 304 без запросов к базе"""
+
+    def setUp(self):
+        super().setUp()
+        self.urls = [
+            f'/rubric_{self.rubric.pk}/bb_{self.bb.pk}/',
+            f'/rubric_{self.rubric.pk}/',
+        ]
+
+    def test_not_modified_without_queries(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('ETag', response)
+                self.assertIn('Last-Modified', response)
+
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+
+    def test_comment_changes_detail_etag(self):
+        url = self.urls[0]
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(bb=self.bb, author='гость', content='Отличный', rating=5)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_new_bb_in_same_rubric_keeps_detail_etag(self):
+        detail_url, rubric_url = self.urls
+        with unittest.mock.patch('main.conditional.time.time', return_value=1_000_000):
+            etags = {url: self.client.get(url)['ETag'] for url in self.urls}
+            with self.captureOnCommitCallbacks(execute=True):
+                Bb.objects.create(rubric=self.rubric, title='Велосипед 2', content='Шоссейный', contacts='-',
+                                  author=self.bb.author, price=700)
+
+            # Страница объявления зависит только от bb:<pk> и sidebar
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=etags[detail_url]).status_code, 304)
+            self.assertEqual(self.client.get(rubric_url, HTTP_IF_NONE_MATCH=etags[rubric_url]).status_code, 200)
+
+    def test_sidebar_counters_lag_until_next_period(self):
+        other = SubRubric.objects.create(name='Самокаты', super_rubric=self.rubric.super_rubric)
+        url = f'/rubric_{self.rubric.pk}/'
+        with unittest.mock.patch('main.conditional.time.time', return_value=1_000_000):
+            etag = self.client.get(url)['ETag']
+            with self.captureOnCommitCallbacks(execute=True):
+                Bb.objects.create(rubric=other, title='Самокат', content='Городской', contacts='-',
+                                  author=self.bb.author, price=500)
+            # Объявление в другой рубрике меняет только счетчики сайдбара
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with unittest.mock.patch('main.conditional.time.time', return_value=1_000_000 + settings.PAGE_CACHE_TIMEOUT):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AnonymousPageCacheTests(BbFixtureMixin, TestCase):
+    """Анонимам страницы отдаются из кеша без базы и шаблонов"""
+
+    def setUp(self):
+        super().setUp()
+        self.detail_url = f'/rubric_{self.rubric.pk}/bb_{self.bb.pk}/'
+
+    def test_hit_without_queries_and_templates(self):
+        for url in ('/', f'/rubric_{self.rubric.pk}/', self.detail_url, '/about/'):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.templates)
+                self.assertEqual(len(response.content), len(first.content))
+
+    def test_cached_page_gets_visitor_csrf_token(self):
+        client = self.client_class(enforce_csrf_checks=True, HTTP_HOST='localhost')
+        self.client.get(self.detail_url)
+        response = client.get(self.detail_url)
+        self.assertFalse(response.templates)
+
+        token = re.search(r'name="csrfmiddlewaretoken" value="(\w+)"', response.content.decode()).group(1)
+        response = client.post(self.detail_url, {'csrfmiddlewaretoken': token, 'content': 'Текст', 'rating': 5})
+        self.assertNotEqual(response.status_code, 403)
+
+    def test_comment_invalidates_page(self):
+        self.client.get(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(bb=self.bb, author='гость', content='Отличный велосипед', rating=5)
+
+        self.assertContains(self.client.get(self.detail_url), 'Отличный велосипед')
+
+    def test_key_ignores_host_and_param_order(self):
+        self.client.get('/', {'sort': 'cheap', 'min_price': 100})
+        with self.assertNumQueries(0):
+            response = self.client.get('/?min_price=100&sort=cheap', HTTP_HOST='127.0.0.1')
+        self.assertFalse(response.templates)
+
+    def test_unknown_params_not_cached(self):
+        for query in ('?utm_source=mail', '?sort=cheap&sort=expensive'):
+            with self.subTest(query=query):
+                self.client.get('/' + query)
+                self.assertTrue(self.client.get('/' + query).templates)
+
+    def test_wrong_rubric_redirects_without_caching(self):
+        other = SubRubric.objects.create(name='Самокаты', super_rubric=self.rubric.super_rubric)
+        url = f'/rubric_{other.pk}/bb_{self.bb.pk}/'
+        for _ in range(2):
+            self.assertRedirects(self.client.get(url), self.detail_url, status_code=301)
+
+    def test_authenticated_user_bypasses_cache(self):
+        self.client.get(self.detail_url)
+        self.client.force_login(self.author)
+
+        self.assertTrue(self.client.get(self.detail_url).templates)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RequestCacheTests(BbFixtureMixin, TestCase):
+    """Ключи страницы читаются одним get_many, записи GET уходят после ответа"""
+
+    def setUp(self):
+        super().setUp()
+        self.detail_url = f'/rubric_{self.rubric.pk}/bb_{self.bb.pk}/'
+
+    def round_trips(self, url):
+        with self.assertLogs('main.request_cache', 'DEBUG') as logs:
+            self.client.get(url)
+        return int(re.search(r': (\d+) cache round trips', logs.output[-1]).group(1))
+
+    def test_detail_in_one_round_trip(self):
+        self.client.force_login(self.author)
+        self.round_trips(self.detail_url)
+        # Сессия, теги, объявление, рейтинг и счетчики сайдбара - один get_many
+        self.assertEqual(self.round_trips(self.detail_url), 1)
+
+    def test_writes_flushed_after_response(self):
+        flushed = []
+        original_flush = RequestCache.flush
+
+        def flush(request_cache):
+            flushed.append(set(request_cache._pending))
+            original_flush(request_cache)
+
+        self.client.force_login(self.author)
+        with unittest.mock.patch.object(RequestCache, 'flush', flush):
+            self.client.get(self.detail_url)
+        keys = {generate_cache_key('bb_detail', self.bb.pk), get_comments_cache_key(self.bb.pk)}
+        self.assertEqual(len(flushed), 1)
+        self.assertLessEqual(keys, flushed[0])
+        self.assertEqual(len(cache.get_many(keys)), 2)
+
+    def test_late_detail_write_not_served_after_change(self):
+        original_flush = RequestCache.flush
+
+        def flush(request_cache):
+            # Объявление изменили, пока этот запрос отрисовывал страницу со старой записью
+            Bb.objects.filter(pk=self.bb.pk).update(title='Велосипед складной')
+            cache.delete(generate_cache_key('bb_detail', self.bb.pk))
+            invalidate_tags(f'bb:{self.bb.pk}')
+            original_flush(request_cache)
+
+        self.client.force_login(self.author)
+        with unittest.mock.patch.object(RequestCache, 'flush', flush):
+            self.client.get(self.detail_url)
+        self.assertContains(self.client.get(self.detail_url), 'Велосипед складной')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CommentPagesTests(BbFixtureMixin, TestCase):
+    """Комментарии выводятся страницами из кеша, следующие - фрагментами по курсору"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Comment.objects.bulk_create(
+            Comment(bb=cls.bb, author=f'гость {i}', content=f'Комментарий №{i}', rating=i % 6)
+            for i in range(COMMENTS_PAGE_SIZE * 2 + 5)
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.detail_url = f'/rubric_{self.rubric.pk}/bb_{self.bb.pk}/'
+        self.comments_url = f'/bb_{self.bb.pk}/comments/'
+
+    def test_first_page_inline_rest_by_cursor(self):
+        response = self.client.get(self.detail_url)
+        self.assertEqual(len(response.context['comments']), COMMENTS_PAGE_SIZE)
+        self.assertContains(response, 'data-comments-more')
+
+        seen = [comment['pk'] for comment in response.context['comments']]
+        after = response.context['comments_next']
+        while after:
+            data = self.client.get(self.comments_url, {'after': after}).json()
+            seen += [int(pk) for pk in re.findall(r'Комментарий №(\d+)', data['html'])]
+            after = data['next']
+        self.assertEqual(len(seen), len(set(seen)))
+        self.assertEqual(len(seen), COMMENTS_PAGE_SIZE * 2 + 5)
+
+    def test_detail_queries_do_not_depend_on_comment_count(self):
+        self.client.force_login(self.bb.author)
+        self.client.get(self.detail_url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.detail_url)
+        self.assertFalse([query for query in queries.captured_queries if 'main_comment' in query['sql']])
+
+    def test_new_comment_resets_pages(self):
+        self.client.get(self.detail_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(bb=self.bb, author='гость', content='Самый свежий', rating=5)
+
+        self.assertEqual(self.client.get(self.detail_url).context['comments'][0]['content'], 'Самый свежий')
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get(self.comments_url, {'after': 'x'}).status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BbCountersTests(BbFixtureMixin, TestCase):
+    """Счетчики комментариев и оценок меняются вместе с комментариями и сходятся с пересчетом"""
+
+    def counters(self):
+        return Bb.objects.values_list(*Bb.COUNTER_FIELDS).get(pk=self.bb.pk)
+
+    def test_save_moderation_and_delete(self):
+        first = Comment.objects.create(bb=self.bb, author='гость', content='Отлично', rating=5)
+        second = Comment.objects.create(bb=self.bb, author='гость', content='Нормально', rating=3)
+        self.assertEqual(self.counters(), (2, 8, 2))
+
+        second.rating = 4
+        second.save()
+        self.assertEqual(self.counters(), (2, 9, 2))
+
+        first.is_active = False
+        first.save()
+        self.assertEqual(self.counters(), (1, 4, 1))
+
+        second.delete()
+        first.delete()
+        self.assertEqual(self.counters(), (0, 0, 0))
+
+    def test_bulk_deactivate_and_recompute(self):
+        for rating in (5, 4, 0):
+            Comment.objects.create(bb=self.bb, author='гость', content='Текст', rating=rating)
+        self.assertEqual(deactivate_comments(Comment.objects.filter(rating__gte=4)), 2)
+        self.assertEqual(self.counters(), (1, 0, 0))
+
+        Bb.objects.filter(pk=self.bb.pk).update(comment_count=7, rating_sum=1)
+        self.assertEqual(recompute_bb_counters(), [self.bb.pk])
+        self.assertEqual(self.counters(), (1, 0, 0))
+
+    def test_bb_save_keeps_counters(self):
+        bb = Bb.objects.get(pk=self.bb.pk)
+        Comment.objects.create(bb=self.bb, author='гость', content='Текст', rating=5)
+        bb.title = 'Шоссейный велосипед'
+        bb.save()
+        self.assertEqual(self.counters(), (1, 5, 1))
+
+    def test_pages_without_comment_aggregates(self):
+        Comment.objects.create(bb=self.bb, author='гость', content='Текст', rating=4)
+        for url in ('/', f'/rubric_{self.rubric.pk}/', f'/rubric_{self.rubric.pk}/bb_{self.bb.pk}/'):
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertRegex(response.content.decode(), r'4[.,]0')
+            self.assertFalse([query for query in queries.captured_queries if 'main_comment' in query['sql']
+                              and ('AVG(' in query['sql'] or 'COUNT(' in query['sql'])])
+
+    def test_comment_invalidates_listing_tags(self):
+        tags = ['index', f'rubric:{self.rubric.pk}', f'bb:{self.bb.pk}']
+        before = get_tag_versions(tags)
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(bb=self.bb, author='гость', content='Текст', rating=4)
+        after = get_tag_versions(tags)
+        for tag in tags:
+            self.assertNotEqual(before[tag], after[tag], tag)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SqliteSettingsTests(TestCase):
+    """PRAGMA на соединении и GET читающих view без транзакции"""
+
+    def test_pragmas_applied_to_connection(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_read_views_skip_atomic_requests(self):
+        for view in (views.index, views.bb_detail, views.bb_comments, views.rubric_bbs, views.profile_my_bbs):
+            with self.subTest(view=view.__name__):
+                self.assertIn('default', getattr(view, '_non_atomic_requests', set()))
+        self.assertFalse(getattr(views.profile_bb_toggle_active, '_non_atomic_requests', set()))
+        for url in ('/api/async/rubrics/', '/api/async/popular/', '/api/async/bb/1/', '/api/async/suggest/',
+                    '/api/bbs/', '/api/bbs/1/', '/api/bbs/1/comments/',
+                    '/accounts/login/', '/accounts/register/', '/accounts/register/done/',
+                    '/accounts/profile/edit/', '/accounts/password/edit/', '/accounts/profile/delete/',
+                    '/accounts/profile/add/', '/accounts/profile/edit/1/', '/accounts/profile/delete/1/',
+                    '/captcha/refresh/', '/admin/', '/admin/login/', '/admin/main/bb/', '/admin/main/bb/1/change/'):
+            with self.subTest(url=url):
+                self.assertIn('default', getattr(resolve(url).func, '_non_atomic_requests', set()))
+        # Атрибуты внутренних декораторов сохранены для middleware
+        self.assertTrue(hasattr(views.bb_detail, 'prefetch_cache_keys'))
+
+    def test_get_runs_outside_transaction_post_inside(self):
+        # TestCase держит внешнюю транзакцию - сравниваем глубину вложенности
+        depth = len(connection.atomic_blocks)
+        seen = []
+        view = non_atomic_reads(lambda request: seen.append(len(connection.atomic_blocks)))
+        view(RequestFactory().get('/'))
+        view(RequestFactory().post('/'))
+        self.assertEqual(seen, [depth, depth + 1])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RequestBudgetTests(TestCase):
+    """Страницы на заполненной базе укладываются в REQUEST_BUDGETS при пустом кеше"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = AdvUser.objects.create_user(username='author', password='-', is_activated=True)
+        cls.admin = AdvUser.objects.create_superuser(username='admin', password='-', email='admin@example.com')
+        super_rubric = SuperRubric.objects.create(name='Транспорт')
+        cls.rubrics = [SubRubric.objects.create(name=f'Рубрика {i}', super_rubric=super_rubric) for i in range(3)]
+        Bb.objects.bulk_create(
+            Bb(rubric=cls.rubrics[i % 3], title=f'Велосипед {i}', content='Горный', contacts='-',
+               author=cls.author, price=i * 100)
+            for i in range(30)
+        )
+        cls.bb = Bb.objects.order_by('-created_at', '-pk').first()
+        for i in range(COMMENTS_PAGE_SIZE + 5):
+            Comment.objects.create(bb=cls.bb, author=f'гость {i}', content='Отличный', rating=i % 6)
+
+    def setUp(self):
+        self.client.defaults['HTTP_HOST'] = 'localhost'
+
+    def get_cold(self, url, user=None):
+        cache.clear()
+        local_cache.clear()
+        if user is not None:
+            self.client.force_login(user)
+        else:
+            self.client.logout()
+        return self.client.get(url)
+
+    def assertWithinBudget(self, response):
+        view_name = response.resolver_match.view_name
+        self.assertIsNotNone(get_budget(view_name), f'нет бюджета для {view_name}')
+        violations = budget_violations(view_name, response.request_stats)
+        self.assertFalse(violations, f'{view_name}: {", ".join(violations)}')
+
+    def test_pages_within_budget(self):
+        detail_url = f'/rubric_{self.bb.rubric_id}/bb_{self.bb.pk}/'
+        after = self.get_cold(detail_url).context['comments_next']
+        public = [
+            '/', '/?keyword=велосипед', f'/rubric_{self.rubrics[0].pk}/', detail_url,
+            f'/bb_{self.bb.pk}/comments/?after={after}', '/about/',
+            '/api/async/rubrics/', '/api/async/popular/', f'/api/async/bb/{self.bb.pk}/',
+        ]
+        own = ['/accounts/profile/', '/accounts/profile/bbs/', '/accounts/profile/add/',
+               f'/accounts/profile/edit/{self.bb.pk}/']
+        admin = ['/admin/main/bb/', '/admin/main/comment/', '/admin/main/subrubric/']
+
+        cases = [(url, user) for url in public for user in (None, self.author)]
+        cases += [(url, self.author) for url in own] + [(url, self.admin) for url in admin]
+        for url, user in cases:
+            with self.subTest(url=url, user=user):
+                response = self.get_cold(url, user)
+                self.assertEqual(response.status_code, 200)
+                self.assertWithinBudget(response)
+
+    def test_server_timing_header(self):
+        response = self.get_cold('/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", cache;dur=[\d.]+;desc="\d+ calls"$')
+
+    def test_over_budget_logged(self):
+        with override_settings(REQUEST_BUDGETS={'main:index': {'queries': 0, 'cache_calls': 100}}), \
+                self.assertLogs('main.budgets', 'WARNING') as logs:
+            self.get_cold('/')
+        self.assertIn('over budget: queries', logs.output[0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class QueryPlanTests(TestCase):
+    """Запросы страниц main.views, main.api_views и api.views идут по индексам"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_plan_data()
+
+    def test_view_queries_use_indexes(self):
+        self.client.defaults['HTTP_HOST'] = 'localhost'
+        queries = collect_view_queries(self.client, plan_urls(self.data))
+        labels = {label for label, _, _ in queries}
+        for view_name in ('main:index', 'main:rubric_bbs', 'main:bb_detail', 'main:bb_comments',
+                          'main:profile_my_bbs', 'async_api:bb_detail', 'api.views.comments'):
+            self.assertIn(view_name, labels)
+
+        for finding in analyze_queries(queries):
+            if finding['allowed']:
+                continue
+            with self.subTest(view=finding['label'], sql=finding['sql']):
+                self.fail(f"{finding['problem']}; план: {finding['plan']}; индекс: {finding['suggestion']}")
+
+    def test_suggest_index(self):
+        queryset = Comment.objects.filter(bb=self.data['bb'], is_active=True).order_by('-created_at')
+        sql, params = queryset.query.sql_with_params()
+        self.assertEqual(suggest_index(sql, 'main_comment'), 'Comment(bb, created_at) WHERE is_active')
+        self.assertIn('main_comment_active_bb_created', ' '.join(explain(sql, params)))
+
+        sql, _ = Bb.objects.filter(price__gte=100, rubric=self.data['rubric']).order_by('-created_at').query.sql_with_params()
+        self.assertEqual(suggest_index(sql, 'main_bb'), 'Bb(rubric, price)')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SuggestTests(CleanCacheMixin, TestCase):
+    """Подсказки отдаются из памяти воркера, без запросов к базе"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = AdvUser.objects.create(username='author')
+        super_rubric = SuperRubric.objects.create(name='Электроника')
+        cls.rubric = SubRubric.objects.create(name='Телефоны', super_rubric=super_rubric)
+        for title in ('Айфон 12', 'Айфон 13 мини', 'Айфон 13', 'Телевизор'):
+            Bb.objects.create(rubric=cls.rubric, title=title, content='-', contacts='-', author=author)
+
+    def setUp(self):
+        super().setUp()
+        # Фоновый поток обновления в тестах не нужен: индекс загружается явно
+        suggest_state.update(indexes=None, pid=os.getpid())
+
+    def test_missing_index_returns_empty_without_db(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(suggest('айф'), {'terms': [], 'rubrics': []})
+            self.assertFalse(load_suggest_index())
+        self.assertIsNone(suggest_state['indexes'])
+
+    def test_endpoint_completes_terms_and_rubrics_without_db(self):
+        rebuild_suggest_index()
+        with self.assertNumQueries(0):
+            data = self.client.get('/api/async/suggest/', {'q': 'айф'}).json()
+            rubrics = self.client.get('/api/async/suggest/', {'q': 'ТЕЛ'}).json()['rubrics']
+        self.assertEqual(data['query'], 'айф')
+        self.assertTrue(data['terms'])
+        self.assertTrue(all(term.startswith('айф') for term in data['terms']))
+        self.assertEqual(rubrics, [{'id': self.rubric.pk, 'name': 'Телефоны'}])
+
+    def test_index_reload_from_cache(self):
+        rebuild_suggest_index()
+        suggest_state['indexes'] = None
+        with self.assertNumQueries(0):
+            self.assertTrue(load_suggest_index())
+            self.assertTrue(suggest('телев')['terms'])
+
+    def test_missing_index_built_once_by_refresher(self):
+        self.assertTrue(ensure_suggest_index())
+        with self.assertNumQueries(0):
+            self.assertTrue(suggest('айф')['terms'])
+
+        # Другой воркер: индекс уже в Redis, собирать не нужно
+        suggest_state['indexes'] = None
+        with self.assertNumQueries(0):
+            self.assertTrue(ensure_suggest_index())
+
+        # Индекс пропал, но его уже собирает другой воркер
+        cache.delete(get_suggest_cache_key())
+        suggest_state['indexes'] = None
+        with self.assertNumQueries(0):
+            self.assertFalse(ensure_suggest_index())
+
+    def test_p99_latency_under_5ms(self):
+        rng = random.Random(1)
+        alphabet = 'абвгдежзиклмнопрстуфхцчшэюя'
+        terms = {''.join(rng.choices(alphabet, k=rng.randint(3, 10))) for _ in range(50_000)}
+        data = {'terms': [[term, rng.randint(1, 100)] for term in terms], 'rubrics': []}
+        cache.set(get_suggest_cache_key(), data, timeout=None)
+        self.assertTrue(load_suggest_index())
+
+        timings = []
+        for term in rng.sample(sorted(terms), 1000):
+            prefix = term[:rng.randint(1, 4)]
+            start = time.perf_counter()
+            suggest(prefix)
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        self.assertLess(timings[int(len(timings) * 0.99)], 0.005)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SearchTests(CleanCacheMixin, TestCase):
+    """Полнотекстовый поиск по леммам, ключи кеша поиска и запасной нечеткий поиск"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = AdvUser.objects.create(username='author')
+        super_rubric = SuperRubric.objects.create(name='Транспорт')
+        cls.rubric = SubRubric.objects.create(name='Велосипеды', super_rubric=super_rubric)
+        cls.bike = Bb.objects.create(rubric=cls.rubric, title='Велосипед', content='Горный, красный',
+                                     contacts='-', author=author, price=1000)
+        cls.phone = Bb.objects.create(rubric=cls.rubric, title='Айфон', content='Почти новый',
+                                      contacts='-', author=author, price=20000)
+
+    def test_punctuation_keyword_is_no_search(self):
+        for url in ('/', f'/rubric_{self.rubric.pk}/'):
+            with self.subTest(url=url):
+                response = self.client.get(url, {'keyword': '!!! --'})
+                self.assertEqual(len(response.context['bbs']), 2)
+                self.assertNotContains(response, 'Найдено')
+                self.assertNotContains(response, 'найдено')
+
+    def found(self, keyword, url='/'):
+        return [row['pk'] for row in self.client.get(url, {'keyword': keyword}).context['bbs']]
+
+    def test_lemmatized_search(self):
+        for keyword in ('велосипеды', 'Велосипедов', 'красного горного'):
+            with self.subTest(keyword=keyword):
+                self.assertEqual(self.found(keyword), [self.bike.pk])
+
+    def test_index_follows_bb_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Bb.objects.get(pk=self.bike.pk).delete()
+        self.assertNotIn(self.bike.pk, self.found('велосипед'))
+
+        phone = Bb.objects.get(pk=self.phone.pk)
+        phone.content = 'Почти новый, с чехлами'
+        with self.captureOnCommitCallbacks(execute=True):
+            phone.save()
+        self.assertEqual(self.found('чехол'), [self.phone.pk])
+
+    def test_equivalent_queries_share_cache_entry(self):
+        self.assertEqual(normalize_keyword('Красный Велосипед'), normalize_keyword('велосипеды  красные'))
+        self.assertEqual(self.found('Красный Велосипед'), [self.bike.pk])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.found('велосипеды  красные'), [self.bike.pk])
+        self.assertFalse([query for query in queries.captured_queries if 'MATCH' in query['sql']])
+
+    def test_typo_falls_back_to_trigrams(self):
+        response = self.client.get('/', {'keyword': 'ифон'})
+        self.assertEqual([row['pk'] for row in response.context['bbs']], [self.phone.pk])
+        self.assertContains(response, 'Точных совпадений нет')
+        self.assertEqual(self.found('ифон', f'/rubric_{self.rubric.pk}/'), [self.phone.pk])
+
+    def test_fuzzy_candidates_from_trigram_index(self):
+        # Кандидаты по индексу триграмм и заголовки только этих кандидатов
+        with self.assertNumQueries(2):
+            self.assertEqual(fuzzy_search(Bb.objects.filter(is_active=True), 'ифон'), [self.phone.pk])
+        self.assertEqual(fuzzy_search(Bb.objects.filter(is_active=True), 'самолет'), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class KeysetPaginationTests(CleanCacheMixin, TestCase):
+    """Курсоры after/before, совместимые ссылки ?page=N и их граничные случаи"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = AdvUser.objects.create(username='author')
+        super_rubric = SuperRubric.objects.create(name='Транспорт')
+        cls.rubric = SubRubric.objects.create(name='Велосипеды', super_rubric=super_rubric)
+        Bb.objects.bulk_create(
+            Bb(rubric=cls.rubric, title=f'Велосипед {i}', content='Горный', contacts='-',
+               author=author, price=(i + 1) * 100)
+            for i in range(12)
+        )
+
+    def test_legacy_page_past_end_not_found(self):
+        for query in ({'page': 99}, {'page': 99, 'keyword': 'велосипед'}):
+            with self.subTest(query=query):
+                for _ in range(2):
+                    self.assertEqual(self.client.get('/', query).status_code, 404)
+        self.assertEqual(self.client.get('/', {'page': 3}).status_code, 200)
+
+    def page(self, query=''):
+        page = self.client.get('/' + query).context['page']
+        return [row['pk'] for row in page], page
+
+    def test_cursor_round_trip(self):
+        orderings = {'': ('-created_at', '-pk'), 'cheap': ('price', 'pk'), 'expensive': ('-price', '-pk')}
+        for sort, ordering in orderings.items():
+            with self.subTest(sort=sort):
+                expected = list(Bb.objects.order_by(*ordering).values_list('pk', flat=True))
+                pages = [self.page(f'?sort={sort}')]
+                while pages[-1][1].has_next:
+                    pages.append(self.page(pages[-1][1].next_link))
+                self.assertEqual([pk for ids, _ in pages for pk in ids], expected)
+                self.assertEqual([page.number for _, page in pages], [1, 2, 3])
+
+                back = [pages[-1]]
+                while back[-1][1].has_previous:
+                    back.append(self.page(back[-1][1].previous_link))
+                self.assertEqual([ids for ids, _ in back], [ids for ids, _ in reversed(pages)])
+
+    def test_legacy_page_matches_cursor_page(self):
+        first_ids, first = self.page()
+        second_ids, _ = self.page(first.next_link)
+        self.assertEqual(self.page('?page=2')[0], second_ids)
+        self.assertEqual(self.page('?page=1')[0], first_ids)
+
+    def test_bad_cursor_shows_first_page(self):
+        first_ids, _ = self.page()
+        for query in ('?after=x', '?before=1-2-x', '?after=99999999999999999999999-1', '?page=abc'):
+            with self.subTest(query=query):
+                self.assertEqual(self.page(query)[0], first_ids)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ListingHydrationTests(CleanCacheMixin, TestCase):
+    """Список собирается из строк только текущей страницы; число найденных кешируется отдельно"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = AdvUser.objects.create(username='author')
+        super_rubric = SuperRubric.objects.create(name='Транспорт')
+        cls.rubric = SubRubric.objects.create(name='Велосипеды', super_rubric=super_rubric)
+        # Через create(): поисковый индекс обновляют сигналы
+        for i in range(12):
+            Bb.objects.create(rubric=cls.rubric, title=f'Велосипед {i}', content='Горный', contacts='-',
+                              author=cls.author, price=(i + 1) * 100)
+
+    def bb_queries(self, queries):
+        return [query['sql'] for query in queries.captured_queries
+                if query['sql'].startswith('SELECT "main_bb"."id"') and 'IN (' in query['sql']]
+
+    def test_only_page_rows_and_listing_columns(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/')
+        self.assertEqual(len(response.context['bbs']), 5)
+        hydration = self.bb_queries(queries)
+        self.assertEqual(len(hydration), 1)
+        self.assertEqual(hydration[0].split('IN (')[1].split(')')[0].count(',') + 1, 5)
+        self.assertNotIn('"main_bb"."contacts"', hydration[0])
+
+    def test_search_total_cached_and_invalidated(self):
+        self.assertContains(self.client.get('/', {'keyword': 'велосипед'}), 'Найдено объявлений: 12')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertContains(self.client.get('/', {'keyword': 'велосипеды'}), 'Найдено объявлений: 12')
+        self.assertFalse([query for query in queries.captured_queries if 'COUNT(' in query['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Bb.objects.create(rubric=self.rubric, title='Велосипед детский', content='-', contacts='-',
+                              author=self.author, price=500)
+        self.assertContains(self.client.get('/', {'keyword': 'велосипед'}), 'Найдено объявлений: 13')
+
+    def test_rows_from_cache_with_batched_misses(self):
+        pks = list(Bb.objects.order_by('-pk').values_list('pk', flat=True)[:5])
+        with self.assertNumQueries(1):
+            rows = get_bb_rows(pks)
+        self.assertEqual([row['pk'] for row in rows], pks)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_bb_rows(pks), rows)
+
+        cache.delete_many([get_bb_row_cache_key(pk) for pk in pks[1:3]])
+        with self.assertNumQueries(1):
+            self.assertEqual(get_bb_rows(pks), rows)
+
+    def test_bb_save_evicts_row(self):
+        bb = Bb.objects.order_by('pk').first()
+        get_bb_rows([bb.pk])
+        bb.title = 'Велосипед складной'
+        with self.captureOnCommitCallbacks(execute=True):
+            bb.save()
+        self.assertEqual(get_bb_rows([bb.pk])[0]['title'], 'Велосипед складной')
+
+    def test_row_cached_before_change_not_served(self):
+        bb = Bb.objects.order_by('pk').first()
+        get_bb_rows([bb.pk])
+        # Строка осталась в кеше (запись GET, отложенная до после коммита), версия тега уже новая
+        Bb.objects.filter(pk=bb.pk).update(title='Велосипед складной')
+        invalidate_tags(f'bb:{bb.pk}')
+        self.assertEqual(get_bb_rows([bb.pk])[0]['title'], 'Велосипед складной')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FacetsTests(CleanCacheMixin, TestCase):
+    """Счетчики рубрик и гистограмма цен меняются сигналами и сверяются с базой"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = AdvUser.objects.create(username='author')
+        super_rubric = SuperRubric.objects.create(name='Транспорт')
+        cls.bikes = SubRubric.objects.create(name='Велосипеды', super_rubric=super_rubric)
+        cls.scooters = SubRubric.objects.create(name='Самокаты', super_rubric=super_rubric)
+        for rubric, price, is_active in ((cls.bikes, 500, True), (cls.bikes, 7000, True),
+                                         (cls.bikes, None, False), (cls.scooters, None, True)):
+            Bb.objects.create(rubric=rubric, title='Объявление', content='-', contacts='-',
+                              author=cls.author, price=price, is_active=is_active)
+
+    def counts(self):
+        return get_rubric_counts([self.bikes.pk, self.scooters.pk])
+
+    def tearDown(self):
+        facets._last_values.clear()
+
+    def buckets(self, rubric_id=ALL_RUBRICS):
+        return {row['bucket']: row['count'] for row in get_price_histogram(rubric_id)}
+
+    def test_counts_and_histogram(self):
+        self.assertEqual(self.counts(), {self.bikes.pk: 2, self.scooters.pk: 1})
+        self.assertEqual(self.buckets(), {price_bucket(500): 1, price_bucket(7000): 1, NO_PRICE_BUCKET: 1})
+        self.assertEqual(self.buckets(self.scooters.pk), {NO_PRICE_BUCKET: 1})
+        # Счетчики уже в кеше: чтение без запросов к базе
+        with self.assertNumQueries(0):
+            self.counts()
+            self.buckets()
+
+    def test_signals_update_counters(self):
+        self.counts()
+        bb = Bb.objects.filter(rubric=self.bikes, price=500).get()
+        with self.captureOnCommitCallbacks(execute=True):
+            Bb.objects.create(rubric=self.scooters, title='Самокат', content='-', contacts='-',
+                              author=self.author, price=500)
+        with self.captureOnCommitCallbacks(execute=True):
+            bb.is_active = False
+            bb.save()
+        self.assertEqual(self.counts(), {self.bikes.pk: 1, self.scooters.pk: 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bb.is_active = True
+            bb.rubric = self.scooters
+            bb.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Bb.objects.filter(rubric=self.bikes, price=7000).get().delete()
+        self.assertEqual(self.counts(), {self.bikes.pk: 0, self.scooters.pk: 3})
+        self.assertEqual(self.buckets(self.scooters.pk), {price_bucket(500): 2, NO_PRICE_BUCKET: 1})
+
+    def test_reconcile_fixes_drift(self):
+        self.counts()
+        # update() идет мимо сигналов
+        Bb.objects.filter(rubric=self.bikes).update(is_active=True)
+        self.assertEqual(self.counts()[self.bikes.pk], 2)
+        reconcile_facets()
+        self.assertEqual(self.counts()[self.bikes.pk], 3)
+
+    def test_missing_counters_reconciled_once(self):
+        self.counts()
+        cache.delete(get_rubric_count_key(self.bikes.pk))
+        cache.delete(get_rubric_count_key(self.scooters.pk))
+        # Пересчет только что был: до конца интервала - последние значения воркера, без запросов
+        with self.assertNumQueries(0):
+            self.assertEqual(self.counts(), {self.bikes.pk: 2, self.scooters.pk: 1})
+
+        facets._last_values.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.counts(), {self.bikes.pk: 0, self.scooters.pk: 0})
+
+    def test_read_error_skips_reconcile(self):
+        with unittest.mock.patch.object(cache, 'get_many', side_effect=ConnectionError('redis down')), \
+                self.assertNumQueries(0):
+            self.assertEqual(self.counts(), {self.bikes.pk: 0, self.scooters.pk: 0})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TagInvalidationTests(BbFixtureMixin, TestCase):
+    """Записи помечены версиями тегов; инвалидация - INCR версии, без поиска ключей"""
+
+    def test_only_tagged_values_recomputed(self):
+        calls = []
+
+        def compute(name):
+            calls.append(name)
+            return name
+
+        for _ in range(2):
+            get_cached_or_set('bboard:test:first', lambda: compute('first'), timeout=60, tags=['rubric:1'])
+            get_cached_or_set('bboard:test:second', lambda: compute('second'), timeout=60, tags=['rubric:2'])
+        cache.set('bboard:session:abc', 'session')
+        invalidate_tags('rubric:1')
+        get_cached_or_set('bboard:test:first', lambda: compute('first'), timeout=60, tags=['rubric:1'])
+        get_cached_or_set('bboard:test:second', lambda: compute('second'), timeout=60, tags=['rubric:2'])
+
+        self.assertEqual(calls, ['first', 'second', 'first'])
+        self.assertEqual(cache.get('bboard:session:abc'), 'session')
+
+    def test_bb_save_bumps_listing_tags(self):
+        tags = ['index', f'rubric:{self.rubric.pk}', f'bb:{self.bb.pk}']
+        before = get_tag_versions(tags)
+        bb = Bb.objects.get(pk=self.bb.pk)
+        bb.title = 'Велосипед горный'
+        with self.captureOnCommitCallbacks(execute=True):
+            bb.save()
+        after = get_tag_versions(tags)
+        for tag in tags:
+            self.assertNotEqual(before[tag], after[tag], tag)
+        self.assertContains(self.client.get(f'/rubric_{self.rubric.pk}/'), 'Велосипед горный')
+
+    def test_rubric_rename_refreshes_sidebar(self):
+        self.assertContains(self.client.get('/'), 'Велосипеды')
+        with self.captureOnCommitCallbacks(execute=True):
+            rubric = SubRubric.objects.get(pk=self.rubric.pk)
+            rubric.name = 'Велосипеды и самокаты'
+            rubric.save()
+        self.assertContains(self.client.get('/'), 'Велосипеды и самокаты')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheRecordTests(BbFixtureMixin, TestCase):
+    """В кеше простые записи без моделей и QuerySet; ключи разделены версией схемы"""
+
+    def assert_plain(self, value):
+        if isinstance(value, dict):
+            for item in value.values():
+                self.assert_plain(item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                self.assert_plain(item)
+        else:
+            self.assertIsInstance(value, (str, int, float, bool, type(None), datetime.datetime))
+
+    def test_records_are_plain(self):
+        bb = Bb.objects.select_related('rubric').get(pk=self.bb.pk)
+        self.assert_plain(bb_detail_record(bb))
+        self.assert_plain(get_bb_rows([self.bb.pk]))
+        self.assert_plain(get_sidebar())
+
+    def test_schema_version_namespaces_keys(self):
+        calls = []
+
+        def read(version):
+            return get_cached_or_set(
+                generate_cache_key('bb_detail', 1), lambda: calls.append(version) or version, timeout=60
+            )
+
+        self.assertEqual([read('1'), read('1')], ['1', '1'])
+        # Запись прежнего релиза не читается: ключ новой версии схемы другой
+        with unittest.mock.patch('main.cache_utils.CACHE_SCHEMA_VERSION', '2'):
+            self.assertIn(':v2:', generate_cache_key('bb_detail', 1))
+            self.assertEqual(read('2'), '2')
+        self.assertEqual(calls, ['1', '2'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheWarmTests(TransactionTestCase):
+    """После прогрева первые страницы и объявления отдаются без запросов к базе"""
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        # Потоки прогрева работают со своими соединениями - данные должны быть закоммичены
+        author = AdvUser.objects.create(username='author')
+        super_rubric = SuperRubric.objects.create(name='Транспорт')
+        self.rubric = SubRubric.objects.create(name='Велосипеды', super_rubric=super_rubric)
+        Bb.objects.bulk_create(
+            Bb(rubric=self.rubric, title=f'Велосипед {i}', content='Горный', contacts='-', author=author, price=i)
+            for i in range(12)
+        )
+
+    def test_warmed_pages_served_from_cache(self):
+        # Один поток: тестовая база SQLite в памяти блокирует таблицы целиком (CAPTCHA пишет в базу)
+        stats = warm_cache(pages=2, top_bbs=3, workers=1, rate=0, host='localhost', log=lambda message: None)
+        self.assertEqual(stats['errors'], 0)
+
+        bb = Bb.objects.order_by('-created_at', '-pk').first()
+        for url in ('/', f'/rubric_{self.rubric.pk}/', f'/rubric_{self.rubric.pk}/bb_{bb.pk}/'):
+            with self.subTest(url=url), self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url, HTTP_HOST='localhost').status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PopularBbsTests(CleanCacheMixin, TestCase):
+    """Любой limit - срез одного предрасчитанного рейтинга"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = AdvUser.objects.create(username='author')
+        super_rubric = SuperRubric.objects.create(name='Транспорт')
+        rubric = SubRubric.objects.create(name='Велосипеды', super_rubric=super_rubric)
+        cls.bbs = [
+            Bb.objects.create(rubric=rubric, title=f'Велосипед {i}', content='-', contacts='-', author=author)
+            for i in range(5)
+        ]
+        Comment.objects.create(bb=cls.bbs[0], author='гость', content='Отличный', rating=5)
+
+    def setUp(self):
+        super().setUp()
+        refresh_popular_bbs()
+
+    def test_commented_first_and_limit_clamped(self):
+        with self.assertNumQueries(0):
+            for limit, expected in (('2', 2), ('100000', 5), ('-3', 1), ('0', 1)):
+                response = self.client.get('/api/async/popular/', {'limit': limit}, HTTP_HOST='localhost')
+                self.assertEqual(len(response.json()['bbs']), expected)
+
+        bbs = self.client.get('/api/async/popular/', HTTP_HOST='localhost').json()['bbs']
+        self.assertEqual(bbs[0]['id'], self.bbs[0].pk)
+
+    def test_invalid_limit(self):
+        response = self.client.get('/api/async/popular/', {'limit': 'all'}, HTTP_HOST='localhost')
+        self.assertEqual(response.status_code, 400)
@@ -1,7 +1,7 @@
 from django.urls import path
 from django.conf import settings 
 from django.conf.urls.static import static
-from .views import index, set_timezone, other_page, profile, profile_my_bbs, user_activate, rubric_bbs, profile_bb_detail, profile_bb_toggle_active, profile_bb_edit, profile_bb_delete, profile_bb_add, bb_detail, BBLoginView, BBLogoutView, ProfileEditView, PasswordEditView, RegisterDoneView, RegisterView, ProfileDeleteView
+from .views import index, set_timezone, other_page, profile, profile_my_bbs, user_activate, rubric_bbs, profile_bb_detail, profile_bb_toggle_active, profile_bb_edit, profile_bb_delete, profile_bb_add, bb_detail, bb_comments, BBLoginView, BBLogoutView, ProfileEditView, PasswordEditView, RegisterDoneView, RegisterView, ProfileDeleteView
 
 app_name = 'main'
 urlpatterns = [
@@ -9,6 +9,7 @@ urlpatterns = [
     path('accounts/login/', BBLoginView.as_view(), name='login'),
     path('', index, name='index'),
     path('rubric_<int:pk>/', rubric_bbs, name='rubric_bbs'), 
+    path('bb_<int:pk>/comments/', bb_comments, name='bb_comments'),
     path('<str:page>/', other_page, name='other'),
     path('rubric_<int:rubric_pk>/bb_<int:pk>/', bb_detail, name='bb_detail'),
     path('accounts/profile/bbs/', profile_my_bbs, name='profile_my_bbs'),
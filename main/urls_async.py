@@ -10,4 +10,5 @@ urlpatterns = [
     path('rubrics/', api_views.api_rubrics, name='rubrics'),
     path('popular/', api_views.api_popular_bbs, name='popular'),
     path('bb/<int:pk>/', api_views.api_bb_detail, name='bb_detail'),
+    path('suggest/', api_views.api_suggest, name='suggest'),
 ]
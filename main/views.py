@@ -9,29 +9,23 @@ from django.contrib.auth.decorators import login_required
 
 from django.http import HttpResponse, JsonResponse, Http404
 from django.template import TemplateDoesNotExist
-from django.template.loader import get_template 
+from django.template.loader import get_template, render_to_string
 
 from django.views.generic.base import TemplateView 
 from django.views.generic.edit import UpdateView, CreateView, DeleteView
 from django.views.decorators.http import require_POST
+from django.utils.decorators import method_decorator
 
 from django.urls import reverse_lazy
 from django.shortcuts import render, redirect, get_object_or_404
 
 from django.core import signing
-from django.core.cache import cache
-from django.core.paginator import Paginator
 
 from django.conf import settings
 
-from django.db.models import Q, Avg, Count
-
 from nickname_gen.generator import Generator
 from nickname_gen.words import RU_ADJECTIVES_WORDS, RU_ANIMALS_WORDS
 
-from functools import reduce
-from operator import and_
-
 from .utilities import signer, get_anon_author_from_cookie
 from .models import SubRubric
 from .models import AdvUser
@@ -44,6 +38,17 @@ from .forms import BbForm, AIFormSet
 from .forms import CommentForm
 
 from .cache_utils import generate_cache_key, get_cached_or_set
+from .search import normalize_keyword, filter_by_keyword, fuzzy_search, search_keyword
+from .listings import get_bb_rows, bb_detail_record
+from .comments import get_comments_cache_key, get_comments_page
+from .counters import rating_summary
+from .conditional import conditional_page
+from .page_cache import anonymous_page_cache
+from .request_cache import prefetch_cache_keys
+from .db import non_atomic_reads
+from .warmup import WARM_USER_AGENT, log_search_query
+from .facets import get_price_histogram, get_price_count_keys, histogram_rows, compute_price_histogram
+from .pagination import parse_page_number, keyset_page, legacy_page_cursor, build_page, decode_cursor
 
 COOKIE_KEY = getattr(settings, "ANON_AUTHOR_COOKIE_NAME", "anon_author")
 COOKIE_MAX_AGE = getattr(settings, "ANON_AUTHOR_COOKIE_MAX_AGE", 60*60*24*365)
@@ -52,6 +57,7 @@ COOKIE_SALT = getattr(settings, "COOKIE_SALT", "anon-author-v1")
 
 # ==================== КЛАССЫ ПРЕДСТАВЛЕНИЙ ====================
 
+@method_decorator(non_atomic_reads, name='dispatch')
 class BBLoginView(LoginView):
     template_name = 'main/login.html'
     
@@ -74,6 +80,7 @@ class BBLogoutView(LogoutView):
         return super().dispatch(request, *args, **kwargs)
 
 
+@method_decorator(non_atomic_reads, name='dispatch')
 class ProfileEditView(SuccessMessageMixin, LoginRequiredMixin, UpdateView):
     model = AdvUser
     template_name = 'main/profile_edit.html'
@@ -96,6 +103,7 @@ class ProfileEditView(SuccessMessageMixin, LoginRequiredMixin, UpdateView):
         return super().form_invalid(form)
 
 
+@method_decorator(non_atomic_reads, name='dispatch')
 class PasswordEditView(SuccessMessageMixin, LoginRequiredMixin, PasswordChangeView):
     template_name = 'main/password_edit.html'
     success_url = reverse_lazy('main:profile')
@@ -110,6 +118,7 @@ class PasswordEditView(SuccessMessageMixin, LoginRequiredMixin, PasswordChangeVi
         return super().form_invalid(form)
 
 
+@method_decorator(non_atomic_reads, name='dispatch')
 class RegisterView(CreateView):
     model = AdvUser
     template_name = 'main/register.html'
@@ -131,10 +140,12 @@ class RegisterView(CreateView):
         return super().form_invalid(form)
 
 
+@method_decorator(non_atomic_reads, name='dispatch')
 class RegisterDoneView(TemplateView):
     template_name = 'main/register_done.html'
 
 
+@method_decorator(non_atomic_reads, name='dispatch')
 class ProfileDeleteView(SuccessMessageMixin, LoginRequiredMixin, DeleteView):
     model = AdvUser
     template_name = 'main/profile_delete.html'
@@ -158,54 +169,150 @@ class ProfileDeleteView(SuccessMessageMixin, LoginRequiredMixin, DeleteView):
 
 # ==================== ФУНКЦИОНАЛЬНЫЕ ПРЕДСТАВЛЕНИЯ ====================
 
-def index(request):
-    """Главная страница со списком объявлений с кешированием"""
-    keyword = request.GET.get('keyword', '')
-    page_number = request.GET.get('page', 1)
+def apply_listing_filters(queryset, form):
+    """
+    Фильтр по цене и сортировка из SearchForm
+
+    Returns:
+        tuple: (QuerySet, поле сортировки для keyset_page, параметры для ссылок и ключа кеша)
+    """
+    cleaned = form.cleaned_data if form.is_bound else {}
+    min_price = cleaned.get('min_price')
+    max_price = cleaned.get('max_price')
+    sort = cleaned.get('sort') or 'new'
+    ordering = SearchForm.SORT_ORDERINGS[sort]
+    
+    if min_price is not None:
+        queryset = queryset.filter(price__gte=min_price)
+    if max_price is not None:
+        queryset = queryset.filter(price__lte=max_price)
+    if ordering.lstrip('-') == 'price':
+        queryset = queryset.filter(price__isnull=False)
+    
+    filters = {
+        'min_price': min_price,
+        'max_price': max_price,
+        'sort': sort if sort != 'new' else None,
+    }
+    return queryset, ordering, filters
+
+def get_listing_page(request, queryset, keyword, page_size, ordering, filters, tags, cache_prefix, *cache_args):
+    """
+    Страница списка объявлений с кешированием
+
+    Точный поиск листается курсорами по (ordering, pk); если он ничего не
+    нашел, показываются похожие объявления из триграммного поиска. Карточки
+    страницы собираются из кеша строк объявлений (get_bb_rows); общее число
+    найденных и гистограмма цен кешируются отдельным ключом с тем же префиксом.
+    Оба ключа помечаются тегами tags и сбрасываются через invalidate_tags();
+    после 4 минут значение отдается из кеша и обновляется в фоне.
+
+    Returns:
+        tuple: (KeysetPage, данные страницы из кеша)
+    """
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    page_number = parse_page_number(request.GET.get('page'))
+    
+    if keyword and page_number == 1 and not (after or before) \
+            and request.headers.get('User-Agent') != WARM_USER_AGENT:
+        log_search_query(keyword)
+    
+    cache_key = generate_cache_key(
+        cache_prefix, *cache_args, normalize_keyword(keyword),
+        after, before, None if after or before else page_number, **filters
+    )
+    
+    def get_page_data():
+        """Внутренняя функция для получения данных (выполняется при cache miss)"""
+        found = filter_by_keyword(queryset, keyword)
+        
+        if after or before or page_number == 1:
+            data = keyset_page(found, page_size, after, before, ordering)
+        else:
+            cursor = legacy_page_cursor(found, page_number, page_size, ordering)
+            if cursor:
+                data = keyset_page(found, page_size, after=cursor, ordering=ordering)
+            elif not keyword or found.exists():
+                # ?page=N за последней страницей: 404 не попадает ни в кеш данных, ни в кеш страниц
+                raise Http404()
+            else:
+                data = {'ids': [], 'next': None, 'prev': None}
+        
+        if not keyword or data['ids'] or after or before:
+            return data
+        
+        fuzzy_ids = fuzzy_search(queryset, keyword)
+        start = (page_number - 1) * page_size
+        if page_number > 1 and start >= len(fuzzy_ids):
+            raise Http404()
+        return {
+            'ids': fuzzy_ids[start:start + page_size],
+            'next_page': page_number + 1 if len(fuzzy_ids) > start + page_size else None,
+            'prev_page': page_number - 1 if page_number > 1 else None,
+            'total': len(fuzzy_ids),
+            'fuzzy': True,
+        }
     
-    cache_key = generate_cache_key('index_page', keyword, page_number)
+    data = get_cached_or_set(
+        cache_key, get_page_data, timeout=300, soft_timeout=240, tags=tags, single_flight=True
+    )
     
-    def get_bbs_data():
-        """Внутренняя функция для получения данных (выполняется при cache miss)"""
-        bbs = Bb.objects.filter(is_active=True).select_related('rubric')
+    if keyword and 'total' not in data:
+        facets_key = generate_cache_key(cache_prefix, 'facets', *cache_args, normalize_keyword(keyword), **filters)
         
-        if keyword:
-            keywords = [word for word in keyword.split() if word]
-            if keywords:
-                q_objects = []
-                for kw in keywords:
-                    q_objects.append(Q(title__icontains=kw) | Q(content__icontains=kw))
-                
-                if q_objects:
-                    bbs = bbs.filter(reduce(and_, q_objects))
+        def get_search_facets():
+            """Число найденных и гистограмма цен результатов поиска"""
+            found = filter_by_keyword(queryset, keyword)
+            prices = compute_price_histogram(found)
+            # Пары (корзина, число): ключи-числа не переживают JSON-сериализатор кеша
+            return {'total': sum(prices.values()), 'prices': list(prices.items())}
         
-        return list(bbs.values_list('pk', flat=True))
+        facets = get_cached_or_set(
+            facets_key, get_search_facets, timeout=300, soft_timeout=240, tags=tags, single_flight=True
+        )
+        data = {**data, **facets}
     
-    bb_ids = get_cached_or_set(cache_key, get_bbs_data, timeout=300)
+    bbs = get_bb_rows(data['ids'])
     
-    if bb_ids:
-        preserved = {pk: i for i, pk in enumerate(bb_ids)}
-        bbs = Bb.objects.filter(pk__in=bb_ids).select_related('rubric')
-        bbs = sorted(bbs, key=lambda obj: preserved[obj.pk])
-    else:
-        bbs = []
+    page = build_page(data, bbs, page_number, {'keyword': keyword, **filters})
+    return page, data
+
+@non_atomic_reads
+@anonymous_page_cache(lambda request: ['index', 'sidebar'])
+@prefetch_cache_keys(lambda request: [] if search_keyword(request.GET.get('keyword', '')) else get_price_count_keys())
+def index(request):
+    """Главная страница со списком объявлений с кешированием"""
+    keyword = search_keyword(request.GET.get('keyword', ''))
+    form = SearchForm(request.GET)
+    form.is_valid()
     
-    if keyword and request.method == 'GET' and bbs:
-        messages.info(request, f'Найдено объявлений: {len(bbs)}')
+    queryset, ordering, filters = apply_listing_filters(Bb.objects.filter(is_active=True), form)
+    page, data = get_listing_page(request, queryset, keyword, 5, ordering, filters, ['index'], 'index_page')
     
-    form = SearchForm(initial={'keyword': keyword})
-    paginator = Paginator(bbs, 5)
-    page = paginator.get_page(page_number)
+    if keyword and request.method == 'GET' and page.object_list:
+        if data.get('fuzzy'):
+            messages.info(request, f'Точных совпадений нет. Похожих объявлений: {data["total"]}')
+        else:
+            messages.info(request, f'Найдено объявлений: {data["total"]}')
+    
+    if keyword:
+        price_histogram = histogram_rows(dict(data.get('prices', ())))
+    else:
+        price_histogram = get_price_histogram()
     
     context = {
         'bbs': page.object_list,
         'page': page,
         'form': form,
         'keyword': keyword,
+        'price_histogram': price_histogram,
     }
     
     return render(request, 'main/index.html', context)
 
+@non_atomic_reads
+@anonymous_page_cache(lambda request, page: ['sidebar'])
 def other_page(request, page):
     """Отображение статических страниц"""
     try:
@@ -215,66 +322,33 @@ def other_page(request, page):
         raise Http404()
     return HttpResponse(template.render(request=request))
 
+@non_atomic_reads
+@conditional_page(lambda request, rubric_pk, pk: [f'bb:{pk}', 'sidebar'])
+@anonymous_page_cache(lambda request, rubric_pk, pk: [f'bb:{pk}', 'sidebar'])
+@prefetch_cache_keys(lambda request, rubric_pk, pk: [
+    generate_cache_key('bb_detail', pk), get_comments_cache_key(pk),
+])
 def bb_detail(request, rubric_pk, pk):
     """Детальный просмотр объявления с комментариями и кешированием"""
     cache_key_bb = generate_cache_key('bb_detail', pk)
     
     def get_bb_data():
-        """Получение данных объявления с дополнительными изображениями"""
-        bb = get_object_or_404(Bb, pk=pk)
-        ais = bb.additionalimage_set.all()
-        return {'bb': bb, 'ais': ais}
-    
-    bb_data = get_cached_or_set(cache_key_bb, get_bb_data, timeout=600)
-    bb = bb_data['bb']
-    ais = bb_data['ais']
-    
-    comments = Comment.objects.filter(bb=bb, is_active=True).select_related('bb')
-    
-    cache_key_rating = generate_cache_key('bb_rating', pk)
-    
-    def get_rating_stats():
-        """Вычисление статистики рейтинга"""
-        rating_stats = comments.aggregate(
-            avg_rating=Avg('rating'),
-            rating_count=Count('id')
-        )
-        avg_rating_value = float(rating_stats['avg_rating']) if rating_stats['avg_rating'] is not None else 0.0
-        rating_count = rating_stats['rating_count'] or 0
-        full_stars = int(avg_rating_value)
-        if full_stars > 5:
-            full_stars = 5
-        has_half_star = full_stars < 5 and (avg_rating_value - full_stars) >= 0.5
-        empty_stars = max(5 - full_stars - (1 if has_half_star else 0), 0)
-        avg_rating = round(avg_rating_value, 1) if rating_count else 0
-        
-        if rating_count:
-            avg_rating_text = f'{avg_rating:.1f} из 5'
-            last_digit = rating_count % 10
-            last_two_digits = rating_count % 100
-            if last_digit == 1 and last_two_digits != 11:
-                rating_label = f'{rating_count} оценка'
-            elif last_digit in (2, 3, 4) and not 12 <= last_two_digits <= 14:
-                rating_label = f'{rating_count} оценки'
-            else:
-                rating_label = f'{rating_count} оценок'
-        else:
-            avg_rating_text = 'Нет оценок'
-            rating_label = ''
-        
-        return {
-            'avg_rating': avg_rating,
-            'rating_count': rating_count,
-            'avg_rating_text': avg_rating_text,
-            'rating_label': rating_label,
-            'full_stars': full_stars,
-            'has_half_star': has_half_star,
-            'empty_stars': empty_stars,
-            'full_star_range': range(full_stars),
-            'empty_star_range': range(empty_stars),
-        }
-    
-    rating_data = get_cached_or_set(cache_key_rating, get_rating_stats, timeout=120)
+        """Компактная запись объявления с URL дополнительных изображений"""
+        return bb_detail_record(get_object_or_404(Bb.objects.select_related('rubric'), pk=pk))
+    
+    # Тег bb:<pk>: запись, отложенная до конца запроса, не переживет изменение объявления
+    bb = get_cached_or_set(cache_key_bb, get_bb_data, timeout=600, tags=[f'bb:{pk}'])
+    # Один адрес у объявления: иначе /rubric_<любая>/bb_<pk>/ - свои копии в кеше страниц
+    if bb['rubric']['pk'] != rubric_pk:
+        return redirect('main:bb_detail', rubric_pk=bb['rubric']['pk'], pk=pk, permanent=True)
+    ais = bb['image_urls']
+    
+    rating_data = rating_summary(bb['rating_sum'], bb['rating_count'])
+    rating_data = {
+        **rating_data,
+        'full_star_range': range(rating_data['full_stars']),
+        'empty_star_range': range(rating_data['empty_stars']),
+    }
     
     form = CommentForm(request=request)
 
@@ -297,7 +371,7 @@ def bb_detail(request, rubric_pk, pk):
                     messages.info(request, f'Вам присвоен временный ник: {author}')
                 comment.author = author
 
-            comment.bb = bb
+            comment.bb_id = pk
             comment.save()
             
             messages.success(request, '✅ Комментарий успешно добавлен!')
@@ -305,8 +379,6 @@ def bb_detail(request, rubric_pk, pk):
             if comment.rating:
                 messages.info(request, f'Ваша оценка: {comment.rating} из 5')
             
-            cache.delete(cache_key_rating)
-
             response = redirect(request.get_full_path_info())
 
             if not request.user.is_authenticated:
@@ -327,20 +399,36 @@ def bb_detail(request, rubric_pk, pk):
             if 'content' in form.errors:
                 messages.warning(request, 'Поле "Текст комментария" обязательно для заполнения')
 
+    comments_page = get_comments_page(pk)
+    
     context = {
         'bb': bb,
         'ais': ais,
-        'comments': comments,
+        'comments': comments_page['comments'],
+        'comments_next': comments_page['next'],
         'form': form,
         'rating_range': range(1, 6),
         **rating_data
     }
     return render(request, 'main/bb_detail.html', context)
 
+@non_atomic_reads
+@anonymous_page_cache(lambda request, pk: [f'bb:{pk}'])
+def bb_comments(request, pk):
+    """Следующая страница комментариев объявления: HTML-фрагмент для кнопки «Показать еще»"""
+    after = request.GET.get('after')
+    if decode_cursor(after) is None:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    page = get_comments_page(pk, after)
+    html = render_to_string('includes/_comments.html', {'comments': page['comments'], 'rating_range': range(1, 6)})
+    return JsonResponse({'html': html, 'next': page['next']})
+
+@non_atomic_reads
 @login_required
 def profile_bb_detail(request, rubric_pk, pk):
     """Просмотр собственного объявления"""
-    bb = get_object_or_404(Bb, pk=pk)
+    bb = get_object_or_404(Bb.objects.select_related('rubric'), pk=pk)
     ais = bb.additionalimage_set.all()
     comments = Comment.objects.filter(bb=bb, is_active=True)
 
@@ -370,61 +458,57 @@ def user_activate(request, sign):
         
     return render(request, template)
 
+@non_atomic_reads
+@conditional_page(lambda request, pk: [f'rubric:{pk}', 'sidebar'])
+@anonymous_page_cache(lambda request, pk: [f'rubric:{pk}', 'sidebar'])
+@prefetch_cache_keys(
+    lambda request, pk: [] if search_keyword(request.GET.get('keyword', '')) else get_price_count_keys(pk)
+)
 def rubric_bbs(request, pk):
     """Объявления в конкретной рубрике с кешированием"""
     rubric = get_object_or_404(SubRubric, pk=pk)
-    keyword = request.GET.get('keyword', '')
-    page_num = request.GET.get('page', 1)
-    
-    cache_key = generate_cache_key('rubric_bbs', pk, keyword, page_num)
-    
-    def get_rubric_bbs():
-        """Получение объявлений рубрики"""
-        bbs = Bb.objects.filter(is_active=True, rubric=pk).select_related('author', 'rubric')
-        
-        if keyword:
-            q = Q(title__icontains=keyword) | Q(content__icontains=keyword)
-            bbs = bbs.filter(q)
-        
-        return list(bbs.values_list('pk', flat=True))
+    keyword = search_keyword(request.GET.get('keyword', ''))
+    form = SearchForm(request.GET)
+    form.is_valid()
     
-    bb_ids = get_cached_or_set(cache_key, get_rubric_bbs, timeout=300)
-    
-    if bb_ids:
-        preserved = {pk: i for i, pk in enumerate(bb_ids)}
-        bbs = Bb.objects.filter(pk__in=bb_ids).select_related('author', 'rubric')
-        bbs = sorted(bbs, key=lambda obj: preserved[obj.pk])
-    else:
-        bbs = []
+    queryset, ordering, filters = apply_listing_filters(Bb.objects.filter(is_active=True, rubric=pk), form)
+    page, data = get_listing_page(request, queryset, keyword, 2, ordering, filters, [f'rubric:{pk}'], 'rubric_bbs', pk)
     
     if keyword:
-        if bbs:
-            messages.info(request, f'В рубрике "{rubric.name}" найдено: {len(bbs)}')
-        else:
+        if not page.object_list:
             messages.warning(request, f'В рубрике "{rubric.name}" ничего не найдено по запросу "{keyword}"')
+        elif data.get('fuzzy'):
+            messages.info(request, f'В рубрике "{rubric.name}" точных совпадений нет. Похожих: {data["total"]}')
+        else:
+            messages.info(request, f'В рубрике "{rubric.name}" найдено: {data["total"]}')
     
-    form = SearchForm(initial={'keyword': keyword})
-    paginator = Paginator(bbs, 2)
-    page = paginator.get_page(page_num)
+    if keyword:
+        price_histogram = histogram_rows(dict(data.get('prices', ())))
+    else:
+        price_histogram = get_price_histogram(pk)
     
-    context = {'rubric': rubric, 'page': page, 'bbs': page.object_list, 'form': form}
+    context = {'rubric': rubric, 'page': page, 'bbs': page.object_list, 'form': form,
+               'price_histogram': price_histogram}
     
     return render(request, 'main/rubric_bbs.html', context)
 
+@non_atomic_reads
 @login_required
 def profile(request):
     """Профиль пользователя"""
     return render(request, 'main/profile.html')
 
+@non_atomic_reads
 @login_required
 def profile_my_bbs(request):
     """Мои объявления"""
     bbs = Bb.objects.filter(author=request.user.pk)
-    if not bbs.exists():
+    if not bbs:
         messages.info(request, 'У вас пока нет объявлений. Создайте первое!')
     context = {'bbs': bbs}
     return render(request, 'main/profile_my_bbs.html', context)
 
+@non_atomic_reads
 @login_required
 def profile_bb_add(request):
     """Добавление нового объявления."""
@@ -493,6 +577,7 @@ def profile_bb_add(request):
 
     return render(request, 'main/profile_bb_add.html', {'form': form, 'formset': formset})
 
+@non_atomic_reads
 @login_required
 def profile_bb_edit(request, pk):
     """Редактирование объявления"""
@@ -526,6 +611,7 @@ def profile_bb_edit(request, pk):
     context = {'form': form, 'formset': formset}
     return render(request, 'main/profile_bb_edit.html', context)
 
+@non_atomic_reads
 @login_required
 def profile_bb_delete(request, pk):
     """Удаление объявления"""
@@ -0,0 +1,238 @@
+"""
+Прогрев кеша после деплоя или перезапуска Redis
+
+Страницы запрашиваются через обычный WSGI-обработчик Django анонимным
+посетителем, поэтому заполняются ровно те ключи, что читают view: данные
+списков, строки объявлений, фасеты, сайдбар, API и готовые страницы
+(page_cache). Запросы выполняет ограниченный пул потоков с общим лимитом
+запросов в секунду, чтобы прогрев не забирал SQLite у живого трафика.
+
+Запуск: python manage.py cache_warm или hook when_ready в gunicorn.conf.py.
+"""
+import io
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.db.models import Count
+from django.urls import reverse
+from django.utils.module_loading import import_string
+
+from .models import Bb, SubRubric
+
+logger = logging.getLogger(__name__)
+
+SEARCH_LOG_KEY = f"{settings.CACHES['default']['KEY_PREFIX']}:search-log"
+SEARCH_LOG_SIZE = 10_000
+
+WARM_USER_AGENT = 'bboard-cache-warm'
+NEXT_LINK_RE = re.compile(r'<a class="page-link" href="(\?[^"#]+)">Вперед')
+
+
+def _uses_redis() -> bool:
+    return settings.CACHES['default']['BACKEND'].startswith('django_redis')
+
+
+def log_search_query(keyword: str):
+    """
+    Учесть поисковый запрос в журнале (sorted set в Redis)
+
+    По журналу cache_warm прогревает самые частые запросы. Журнал изредка
+    обрезается до SEARCH_LOG_SIZE самых частых строк.
+    """
+    keyword = keyword.strip()[:100]
+    if not keyword or not _uses_redis():
+        return
+    try:
+        from django_redis import get_redis_connection
+        pipe = get_redis_connection('default').pipeline(transaction=False)
+        pipe.zincrby(SEARCH_LOG_KEY, 1, keyword)
+        if random.random() < 0.01:
+            pipe.zremrangebyrank(SEARCH_LOG_KEY, 0, -SEARCH_LOG_SIZE - 1)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Search log error: {e}")
+
+
+def top_search_queries(limit: int) -> List[str]:
+    """Самые частые поисковые запросы из журнала"""
+    if not limit or not _uses_redis():
+        return []
+    try:
+        from django_redis import get_redis_connection
+        return [keyword.decode() for keyword in get_redis_connection('default').zrevrange(SEARCH_LOG_KEY, 0, limit - 1)]
+    except Exception as e:
+        logger.error(f"Search log read error: {e}")
+        return []
+
+
+class RateLimiter:
+    """Не больше rate вызовов wait() в секунду на все потоки"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class CacheWarmer:
+    """
+    Запросы прогрева через WSGI-обработчик Django
+
+    Args:
+        host: Заголовок Host, как у живого трафика (входит в ключи готовых страниц)
+        scheme: 'http' или 'https' - как Django видит запросы за прокси
+        workers: Размер пула потоков
+        rate: Лимит запросов в секунду на весь прогрев
+    """
+
+    def __init__(self, host: str, scheme: str = 'http', workers: int = 4, rate: float = 20):
+        self.host = host
+        self.scheme = scheme
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.handler = WSGIHandler()
+        self.session_store = import_string(settings.SESSION_ENGINE).SessionStore
+        self.stats = {'requests': 0, 'errors': 0}
+        self._lock = threading.Lock()
+
+    def _environ(self, url: str) -> Dict:
+        path, _, query = url.partition('?')
+        return {
+            'REQUEST_METHOD': 'GET',
+            'SCRIPT_NAME': '',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '443' if self.scheme == 'https' else '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'HTTP_HOST': self.host,
+            'HTTP_USER_AGENT': WARM_USER_AGENT,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': self.scheme,
+            'wsgi.input': io.BytesIO(),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+
+    def fetch(self, url: str) -> Optional[str]:
+        """
+        Запросить страницу (с учетом лимита)
+
+        Сессию, созданную запросом (например, для сообщений о результатах
+        поиска), сразу удаляем - в Redis не остаются сессии прогрева.
+
+        Returns:
+            Optional[str]: Тело ответа 200 или None
+        """
+        self.limiter.wait()
+        status = {}
+
+        def start_response(status_line, headers, exc_info=None):
+            status['code'] = int(status_line.split(' ', 1)[0])
+            status['cookies'] = [value for name, value in headers if name.lower() == 'set-cookie']
+
+        try:
+            response = self.handler(self._environ(url), start_response)
+            try:
+                body = b''.join(response)
+            finally:
+                response.close()
+        except Exception as e:
+            logger.error(f"Cache warm error for {url}: {e}")
+            status['code'] = None
+
+        for cookie in status.get('cookies', ()):
+            if cookie.startswith(f'{settings.SESSION_COOKIE_NAME}='):
+                self.session_store(cookie.split('=', 1)[1].split(';', 1)[0]).delete()
+
+        with self._lock:
+            self.stats['requests'] += 1
+            if status['code'] != 200:
+                self.stats['errors'] += 1
+        if status['code'] != 200:
+            logger.warning(f"Cache warm {url}: HTTP {status['code']}")
+            return None
+        return body.decode()
+
+    def fetch_pages(self, url: str, pages: int):
+        """Первые pages страниц списка - по ссылкам "Вперед", как листает посетитель"""
+        for _ in range(pages):
+            html = self.fetch(url)
+            match = NEXT_LINK_RE.search(html or '')
+            if not match:
+                return
+            url = url.partition('?')[0] + match.group(1).replace('&amp;', '&')
+
+    def run(self, tasks: List[Callable[[], None]]):
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='cache-warm') as pool:
+            for future in [pool.submit(task) for task in tasks]:
+                future.result()
+
+
+def warm_cache(pages: int = 3, top_bbs: int = 100, top_queries: int = 50, workers: int = 4,
+               rate: float = 20, host: Optional[str] = None, scheme: str = 'http',
+               log: Callable[[str], None] = logger.info) -> Dict[str, int]:
+    """
+    Прогреть кеш: главная и рубрики (первые pages страниц), top_bbs объявлений
+    с наибольшим числом комментариев, API и top_queries частых поисковых запросов
+
+    Returns:
+        dict: {'requests': ..., 'errors': ...}
+    """
+    warmer = CacheWarmer(host or settings.ALLOWED_HOSTS[0], scheme, workers, rate)
+    index_url = reverse('main:index')
+
+    rubric_ids = list(SubRubric.objects.values_list('pk', flat=True))
+    log(f'📂 Главная и рубрики: {len(rubric_ids) + 1} списков по {pages} стр.')
+    warmer.run(
+        [lambda: warmer.fetch_pages(index_url, pages)]
+        + [lambda pk=pk: warmer.fetch_pages(reverse('main:rubric_bbs', args=[pk]), pages) for pk in rubric_ids]
+    )
+
+    bbs = list(
+        Bb.objects.filter(is_active=True)
+        .annotate(comments_total=Count('comment'))
+        .order_by('-comments_total', '-created_at')
+        .values_list('pk', 'rubric_id')[:top_bbs]
+    )
+    log(f'📄 Объявления: {len(bbs)}')
+    warmer.run(
+        [lambda pk=pk, rubric_id=rubric_id: warmer.fetch(reverse('main:bb_detail', args=[rubric_id, pk]))
+         for pk, rubric_id in bbs]
+        + [lambda pk=pk: warmer.fetch(reverse('async_api:bb_detail', args=[pk])) for pk, _ in bbs]
+    )
+
+    log('🔌 API: рубрики и популярные объявления')
+    warmer.run([
+        lambda: warmer.fetch(reverse('async_api:rubrics')),
+        lambda: warmer.fetch(reverse('async_api:popular')),
+    ])
+
+    queries = top_search_queries(top_queries)
+    log(f'🔍 Частые поисковые запросы: {len(queries)}')
+    warmer.run([
+        lambda keyword=keyword: warmer.fetch(f"{index_url}?{urlencode({'keyword': keyword})}")
+        for keyword in queries
+    ])
+
+    return warmer.stats